@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import os
+from typing import Iterable, Iterator
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer, RobertaForSequenceClassification
+
+from project.dataset.rendered_prompts import (
+	RenderableVideo,
+	RenderedPromptStore,
+	rendering_key,
+)
+
+# The tokenizer and the inputs of the fine-tuning in notebooks/roberta_basemodel.ipynb, the
+# checkpoints it saves have no tokenizer
+DEFAULT_TOKENIZER = "roberta-base"
+MAX_INPUT_LENGTH = 512
+DEFAULT_ATTRIBUTES = [
+	"channel_title",
+	"title",
+	"description",
+	"categories",
+	"tags",
+	"subtitles",
+	"auto_subtitles",
+	"comments",
+]
+DEFAULT_ATTRIBUTES_SETTINGS = {"max_subtitles_length": 1000, "include_comments_replies": True}
+DEFAULT_BATCH_SIZE = 32
+# Number of batches of videos sorted by length together, the videos are scored window by window
+DEFAULT_SORT_WINDOW_BATCHES = 32
+ONNX_FILENAME = "model.onnx"
+
+TORCH_BACKEND = "torch"
+QUANTIZED_BACKEND = "quantized"
+ONNX_BACKEND = "onnx"
+BACKENDS = (TORCH_BACKEND, QUANTIZED_BACKEND, ONNX_BACKEND)
+
+
+class RobertaClassifier:
+	"""
+	Scores videos on CPU with a RobertaForSequenceClassification checkpoint fine-tuned by
+	notebooks/roberta_basemodel.ipynb: the probability of the label 1 (conspiracy) of the
+	to_string_for_model_input text of every video, truncated to max_length tokens.
+
+	Instead of one pipeline call per video, padded to the longest text, the texts are tokenized
+	without padding, sorted by length and scored in batches padded to the longest text of the
+	batch only: the videos with short texts (no subtitles, no comments) do not pay for the 512
+	tokens of the others. The videos are read, sorted and scored by windows of
+	sort_window_batches batches, so that a dataset can be streamed (e.g. a VideoDataset), the
+	scores are yielded in the order of the videos.
+
+	Batching alone is not a speedup on CPU: scripts/benchmark_roberta_classifier.py scored 1.0
+	videos/s with the torch backend and batches sorted by length (0.8 in the order of the videos)
+	against 1.1 for the notebook pipeline on one core, the cost is in the 512 tokens texts, not in
+	the calls. The quantized backend is the one faster than the pipeline (1.7 videos/s), it is not
+	the default because its scores differ from the ones of the fine-tuned model (by up to 0.012).
+
+	The backends:
+	- torch: the checkpoint as it is.
+	- quantized: the Linear layers quantized to int8 with torch dynamic quantization, faster on
+	CPUs with VNNI/AVX512 at the cost of slightly different scores.
+	- onnx: the checkpoint exported to model.onnx in the checkpoint folder (once, reused next
+	time) and run by onnxruntime, installed by the onnx extra (pip install .[onnx]).
+	"""
+
+	def __init__(
+		self,
+		checkpoint_path: str,
+		backend: str = TORCH_BACKEND,
+		batch_size: int = DEFAULT_BATCH_SIZE,
+		threads: int | None = None,
+		tokenizer: str = DEFAULT_TOKENIZER,
+		attributes: list[str] | None = None,
+		attributes_settings: dict | None = None,
+		max_length: int = MAX_INPUT_LENGTH,
+		sort_window_batches: int = DEFAULT_SORT_WINDOW_BATCHES,
+	) -> None:
+		"""
+		:param checkpoint_path: The folder saved by Trainer.save_model (e.g. .../best_model).
+		:param backend: One of BACKENDS.
+		:param batch_size: Number of videos scored together.
+		:param threads: Number of threads of torch (set for the whole process) or onnxruntime.
+		If None the torch setting is left as it is and onnxruntime uses one thread per core.
+		:param tokenizer: The tokenizer name or folder.
+		:param attributes: The attributes_to_include of to_string_for_model_input, the ones of the
+		fine-tuning if None.
+		:param attributes_settings: The other settings of to_string_for_model_input, the ones of
+		the fine-tuning if None.
+		:param max_length: Maximum number of tokens of a text, the rest is truncated.
+		:param sort_window_batches: Number of batches of videos sorted by length together.
+		"""
+		if backend not in BACKENDS:
+			raise ValueError(f"Unknown backend {backend}, expected one of {BACKENDS}")
+		self.backend = backend
+		self.batch_size = batch_size
+		self.threads = threads
+		self.attributes = DEFAULT_ATTRIBUTES if attributes is None else attributes
+		self.attributes_settings = (
+			DEFAULT_ATTRIBUTES_SETTINGS if attributes_settings is None else attributes_settings
+		)
+		self.max_length = max_length
+		self.sort_window_batches = sort_window_batches
+		if threads is not None:
+			torch.set_num_threads(threads)
+		self.tokenizer = AutoTokenizer.from_pretrained(tokenizer)
+		self.model = RobertaForSequenceClassification.from_pretrained(checkpoint_path).eval()
+		self._session = None
+		if backend == QUANTIZED_BACKEND:
+			self.model = torch.ao.quantization.quantize_dynamic(
+				self.model, {torch.nn.Linear}, dtype=torch.qint8
+			)
+		elif backend == ONNX_BACKEND:
+			onnx_path = os.path.join(checkpoint_path, ONNX_FILENAME)
+			if not os.path.exists(onnx_path):
+				export_onnx(self.model, onnx_path)
+			self._session = _onnx_session(onnx_path, self.threads)
+			self.model = None
+
+	def score_videos(
+		self, videos: Iterable[RenderableVideo], prompt_store: RenderedPromptStore | None = None
+	) -> Iterator[tuple[str, float]]:
+		"""
+		Yield the id and the score of every video, in the order of the videos.
+
+		:param prompt_store: The rendered texts of the attributes of the classifier, rendered here
+		if None. Raises ValueError if it renders other attributes or settings.
+		"""
+		if prompt_store is not None and rendering_key(
+			prompt_store.attributes, prompt_store.attributes_settings
+		) != rendering_key(self.attributes, self.attributes_settings):
+			raise ValueError(
+				f"The prompt store renders {prompt_store.attributes} with "
+				f"{prompt_store.attributes_settings}, the classifier {self.attributes} with "
+				f"{self.attributes_settings}"
+			)
+		window_size = self.batch_size * self.sort_window_batches
+		ids, texts = [], []
+		for video in videos:
+			ids.append(video.id)
+			if prompt_store is not None:
+				texts.append(prompt_store.get(video))
+			else:
+				texts.append(
+					video.to_string_for_model_input(self.attributes, **self.attributes_settings)
+				)
+			if len(ids) == window_size:
+				yield from zip(ids, self.score_texts(texts))
+				ids, texts = [], []
+		if ids:
+			yield from zip(ids, self.score_texts(texts))
+
+	def score_texts(self, texts: list[str]) -> list[float]:
+		"""The probability of the label 1 of every text, in the order of the texts."""
+		input_ids = self.tokenizer(texts, truncation=True, max_length=self.max_length)["input_ids"]
+		# Texts of similar length in the same batch, padded to the longest of the batch
+		order = sorted(range(len(texts)), key=lambda i: len(input_ids[i]))
+		scores = [0.0] * len(texts)
+		for start in range(0, len(order), self.batch_size):
+			batch = order[start : start + self.batch_size]
+			padded = self.tokenizer.pad(
+				{"input_ids": [input_ids[i] for i in batch]}, return_tensors="np"
+			)
+			probabilities = self._probabilities(padded["input_ids"], padded["attention_mask"])
+			for i, probability in zip(batch, probabilities):
+				scores[i] = float(probability)
+		return scores
+
+	def _probabilities(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+		if self._session is not None:
+			(logits,) = self._session.run(
+				["logits"],
+				{
+					"input_ids": input_ids.astype(np.int64),
+					"attention_mask": attention_mask.astype(np.int64),
+				},
+			)
+			logits = torch.from_numpy(logits)
+		else:
+			with torch.inference_mode():
+				logits = self.model(
+					input_ids=torch.from_numpy(input_ids),
+					attention_mask=torch.from_numpy(attention_mask),
+				).logits
+		return torch.softmax(logits.float(), dim=-1)[:, 1].numpy()
+
+
+class _LogitsOnly(torch.nn.Module):
+	# The ModelOutput of the model is not exportable as it is
+	def __init__(self, model: RobertaForSequenceClassification) -> None:
+		super().__init__()
+		self.model = model
+
+	def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+		return self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+
+
+def export_onnx(model: RobertaForSequenceClassification, onnx_path: str) -> None:
+	"""Export the model with a dynamic batch size and sequence length."""
+	example_input = torch.ones((2, 8), dtype=torch.long)
+	tmp_path = f"{onnx_path}.tmp"
+	torch.onnx.export(
+		_LogitsOnly(model).eval(),
+		(example_input, example_input),
+		tmp_path,
+		input_names=["input_ids", "attention_mask"],
+		output_names=["logits"],
+		dynamic_axes={
+			"input_ids": {0: "batch", 1: "sequence"},
+			"attention_mask": {0: "batch", 1: "sequence"},
+			"logits": {0: "batch"},
+		},
+		opset_version=17,
+	)
+	os.replace(tmp_path, onnx_path)
+
+
+def _onnx_session(onnx_path: str, threads: int | None):
+	# Only the onnx backend needs onnxruntime, an optional dependency (the onnx extra)
+	import onnxruntime
+
+	session_options = onnxruntime.SessionOptions()
+	if threads is not None:
+		session_options.intra_op_num_threads = threads
+	session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+	return onnxruntime.InferenceSession(
+		onnx_path, session_options, providers=["CPUExecutionProvider"]
+	)
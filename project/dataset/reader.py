@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import codecs
+import json
+import os
+from typing import Any, Callable, Iterable, Iterator
+
+from project.dataset.store import MANIFEST_FILENAME
+from project.models import YouTubeVideoInfo
+
+HEAVY_FIELDS = ("auto_subtitles", "comments", "subtitles")
+VIDEO_INFO_FIELDS = tuple(YouTubeVideoInfo.__dataclass_fields__)
+
+_READ_CHUNK_SIZE = 1024 * 1024
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _read_json_value_at(file_path: str, byte_offset: int) -> Any:
+	"""Decode the single json value starting at byte_offset, reading only as much as needed."""
+	decoder = codecs.getincrementaldecoder("utf-8")()
+	buffer = ""
+	chunk_size = _READ_CHUNK_SIZE
+	with open(file_path, "rb") as json_file:
+		json_file.seek(byte_offset)
+		while True:
+			chunk = json_file.read(chunk_size)
+			buffer += decoder.decode(chunk, final=not chunk)
+			try:
+				return _JSON_DECODER.raw_decode(buffer)[0]
+			except json.JSONDecodeError:
+				if not chunk:
+					raise
+			chunk_size *= 2
+
+
+def _iter_json_array(file_path: str) -> Iterator[tuple[int, dict[str, Any]]]:
+	"""Stream the elements of a json array file together with their byte offset in the file."""
+	with open(file_path, "r", encoding="utf-8", newline="") as json_file:
+		buffer = json_file.read(_READ_CHUNK_SIZE)
+		index = len(buffer) - len(buffer.lstrip())
+		if buffer[index : index + 1] != "[":
+			raise ValueError(f"{file_path} does not contain a json array")
+		buffer_byte_offset = len(buffer[: index + 1].encode("utf-8"))
+		buffer = buffer[index + 1 :]
+		chunk_size = _READ_CHUNK_SIZE
+		eof = False
+		# buffer_byte_offset is the offset in the file of buffer[position]
+		position = 0
+		while True:
+			index = position
+			while index < len(buffer) and buffer[index] in " \t\r\n,":
+				index += 1
+			if index < len(buffer) and buffer[index] == "]":
+				return
+			try:
+				if index == len(buffer):
+					raise json.JSONDecodeError("Buffer exhausted", buffer, index)
+				element, end = _JSON_DECODER.raw_decode(buffer, index)
+			except json.JSONDecodeError:
+				if eof:
+					raise
+				# The element continues past the end of the buffer
+				chunk = json_file.read(chunk_size)
+				eof = not chunk
+				buffer = buffer[position:] + chunk
+				position = 0
+				chunk_size *= 2
+				continue
+			chunk_size = _READ_CHUNK_SIZE
+			yield buffer_byte_offset + len(buffer[position:index].encode("utf-8")), element
+			buffer_byte_offset += len(buffer[position:end].encode("utf-8"))
+			position = end
+
+
+def _iter_store(folder: str) -> Iterator[tuple[str, int, dict[str, Any]]]:
+	"""Stream the committed records of a ShardedDatasetStore with their shard and byte offset."""
+	with open(os.path.join(folder, MANIFEST_FILENAME), "r") as manifest_file:
+		manifest = json.load(manifest_file)
+	for shard in manifest["shards"]:
+		shard_path = os.path.join(folder, shard["filename"])
+		byte_offset = 0
+		with open(shard_path, "rb") as shard_file:
+			for _, line in zip(range(shard["records"]), shard_file):
+				yield shard_path, byte_offset, json.loads(line)
+				byte_offset += len(line)
+
+
+class VideoRecord:
+	"""
+	A video read by VideoDataset. Only the projected fields are kept in memory, the lazy fields are
+	read back from the dataset file every time they are accessed.
+	"""
+
+	def __init__(
+		self,
+		fields: dict[str, Any],
+		lazy_fields: frozenset[str],
+		load_json: Callable[[], dict[str, Any]],
+	) -> None:
+		self.__dict__.update(fields)
+		self._lazy_fields = lazy_fields
+		self._load_json = load_json
+
+	def __getattr__(self, name: str) -> Any:
+		# Only called for the attributes that are not in memory
+		if name in self.__dict__.get("_lazy_fields", ()):
+			return YouTubeVideoInfo.field_from_json(name, self._load_json()[name])
+		raise AttributeError(f"Field {name} is not in the projection of this record")
+
+	def __repr__(self) -> str:
+		return f"VideoRecord(id={self.__dict__.get('id')!r})"
+
+	def to_video_info(self) -> YouTubeVideoInfo:
+		"""Materialize the full YouTubeVideoInfo of this record."""
+		return YouTubeVideoInfo.from_json(self._load_json())
+
+	def to_string_for_model_input(self, *args, **kwargs) -> str:
+		# Read the record once instead of once per lazy attribute
+		return self.to_video_info().to_string_for_model_input(*args, **kwargs)
+
+
+class VideoDataset:
+	"""
+	Stream the videos of a dataset one at a time instead of loading the whole videos_infos.json.
+
+	The dataset path can be a videos_infos.json file, a ShardedDatasetStore folder or a dataset
+	folder containing either of them.
+	"""
+
+	def __init__(
+		self,
+		dataset_path: str,
+		fields: Iterable[str] | None = None,
+		lazy_fields: Iterable[str] = HEAVY_FIELDS,
+	) -> None:
+		"""
+		:param dataset_path: The path of the dataset.
+		:param fields: The fields kept in memory for every record, all the fields that are not lazy by default.
+		:param lazy_fields: The fields read from disk only when accessed.
+		"""
+		self.lazy_fields = frozenset(lazy_fields)
+		self.fields = (
+			tuple(fields)
+			if fields is not None
+			else tuple(f for f in VIDEO_INFO_FIELDS if f not in self.lazy_fields)
+		)
+		if os.path.isfile(dataset_path):
+			self.json_path, self.store_folder = dataset_path, None
+		elif os.path.isfile(os.path.join(dataset_path, MANIFEST_FILENAME)):
+			self.json_path, self.store_folder = None, dataset_path
+		elif os.path.isfile(os.path.join(dataset_path, "videos_infos", MANIFEST_FILENAME)):
+			self.json_path, self.store_folder = None, os.path.join(dataset_path, "videos_infos")
+		else:
+			self.json_path, self.store_folder = (
+				os.path.join(dataset_path, "videos_infos.json"),
+				None,
+			)
+
+	def iter_json(self) -> Iterator[tuple[str, int, dict[str, Any]]]:
+		"""Stream the raw json records with the file and the byte offset they were read from."""
+		if self.store_folder:
+			yield from _iter_store(self.store_folder)
+		else:
+			for byte_offset, json_data in _iter_json_array(self.json_path):
+				yield self.json_path, byte_offset, json_data
+
+	def __iter__(self) -> Iterator[VideoRecord]:
+		if self.store_folder:
+
+			def loader(file_path: str, byte_offset: int) -> Callable[[], dict[str, Any]]:
+				def load_json() -> dict[str, Any]:
+					with open(file_path, "rb") as shard_file:
+						shard_file.seek(byte_offset)
+						return json.loads(shard_file.readline())
+
+				return load_json
+		else:
+
+			def loader(file_path: str, byte_offset: int) -> Callable[[], dict[str, Any]]:
+				return lambda: _read_json_value_at(file_path, byte_offset)
+
+		for file_path, byte_offset, json_data in self.iter_json():
+			fields = {
+				field: YouTubeVideoInfo.field_from_json(field, json_data.get(field))
+				for field in self.fields
+			}
+			yield VideoRecord(fields, self.lazy_fields, loader(file_path, byte_offset))
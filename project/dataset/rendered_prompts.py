@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import hashlib
+import inspect
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Iterable, Iterator, Protocol
+
+from project.dataset.reader import VideoRecord
+from project.dataset.store import write_json_atomically
+from project.models import YouTubeVideoInfo
+from project.utils.subtitles_utils import TRANSCRIPT_CACHE_FILENAME, use_transcript_cache
+
+PROMPTS_FILENAME_FORMAT = "prompts-{}.jsonl"
+SETTINGS_FILENAME_FORMAT = "prompts-{}.settings.json"
+DEFAULT_MAX_CACHED_PROMPTS = 10_000
+# Part of the rendering key: increment it when to_string_for_model_input renders other prompts
+# from the same video and settings, so that the prompts rendered before are not reused
+RENDERER_VERSION = 1
+
+# The defaults of to_string_for_model_input, so that omitted and explicit default settings render
+# to the same prompts
+_DEFAULT_ATTRIBUTES_SETTINGS = {
+	name: parameter.default
+	for name, parameter in inspect.signature(
+		YouTubeVideoInfo.to_string_for_model_input
+	).parameters.items()
+	if parameter.default is not inspect.Parameter.empty
+}
+
+
+class RenderableVideo(Protocol):
+	"""A YouTubeVideoInfo or a VideoRecord."""
+
+	id: str
+
+	def to_string_for_model_input(self, attributes_to_include: list[str], **kwargs) -> str: ...
+
+
+def rendering_key(attributes: list[str], attributes_settings: dict[str, Any]) -> str:
+	"""
+	Hash of the renderer version, the attributes and the settings, equal settings written
+	differently share the key.
+	"""
+	settings = _DEFAULT_ATTRIBUTES_SETTINGS | attributes_settings
+	return hashlib.sha1(
+		json.dumps([RENDERER_VERSION, list(attributes), settings], sort_keys=True).encode("utf-8")
+	).hexdigest()[:16]
+
+
+def video_hash(video: RenderableVideo, attributes: list[str]) -> str:
+	"""
+	Hash of the values of the attributes of the video, read as to_string_for_model_input reads
+	them (the text and the author of the comments), so that a changed record is rendered again.
+	Cheaper than rendering: the subtitles are hashed instead of parsed.
+	"""
+	if isinstance(video, VideoRecord):
+		# Read the record once instead of once per lazy attribute
+		video = video.to_video_info()
+	digest = hashlib.sha1()
+	for attribute in attributes:
+		value = getattr(video, attribute)
+		if attribute == "comments" and value is not None:
+			_update_comments_digest(digest, value)
+		else:
+			digest.update(str(value).encode("utf-8"))
+		digest.update(b"\x1e")
+	return digest.hexdigest()[:16]
+
+
+def _update_comments_digest(digest: Any, comments: Iterable[Any]) -> None:
+	for comment in comments:
+		digest.update(f"{comment.author_name}\x1f{comment.text}\x1f".encode("utf-8"))
+		if comment.replies:
+			digest.update(b"\x02")
+			_update_comments_digest(digest, comment.replies)
+			digest.update(b"\x03")
+
+
+class RenderedPromptStore:
+	"""
+	The prompts rendered by to_string_for_model_input for one list of attributes and one settings
+	dict, keyed on the video id and the video_hash of the video, so that every experiment, model
+	and notebook using the same attributes renders every video once, and again only if the
+	rendered attributes of the video changed (e.g. a dataset generated again).
+
+	The prompts are appended to a JSON lines file named after rendering_key in the store folder,
+	only the byte offset and the video hash of every prompt are kept in memory together with the
+	max_cached_prompts most recently used prompts. A truncated last line (e.g. an interrupted run)
+	is ignored.
+	The transcripts of the subtitles are cached in the store folder too (see use_transcript_cache),
+	so that rendering with other attributes or settings does not parse the subtitles again.
+	"""
+
+	def __init__(
+		self,
+		folder: str,
+		attributes: list[str],
+		attributes_settings: dict[str, Any],
+		max_cached_prompts: int = DEFAULT_MAX_CACHED_PROMPTS,
+	) -> None:
+		"""
+		:param folder: The folder holding the prompts of every rendering, created if missing.
+		:param attributes: The attributes_to_include of to_string_for_model_input.
+		:param attributes_settings: The other arguments of to_string_for_model_input.
+		:param max_cached_prompts: Maximum number of prompts kept in memory.
+		"""
+		os.makedirs(folder, exist_ok=True)
+		use_transcript_cache(os.path.join(folder, TRANSCRIPT_CACHE_FILENAME))
+		self.attributes = list(attributes)
+		self.attributes_settings = dict(attributes_settings)
+		self.max_cached_prompts = max_cached_prompts
+		key = rendering_key(self.attributes, self.attributes_settings)
+		self.prompts_path = os.path.join(folder, PROMPTS_FILENAME_FORMAT.format(key))
+		settings_path = os.path.join(folder, SETTINGS_FILENAME_FORMAT.format(key))
+		if not os.path.exists(settings_path):
+			write_json_atomically(
+				{"attributes": self.attributes, "attributes_settings": self.attributes_settings},
+				settings_path,
+			)
+
+		self._offsets_by_video_id: dict[str, int] = {}
+		self._hashes_by_video_id: dict[str, str | None] = {}
+		self._cached_prompts: OrderedDict[str, str] = OrderedDict()
+		self._lock = threading.Lock()
+		byte_offset = 0
+		line = b"\n"
+		if os.path.exists(self.prompts_path):
+			with open(self.prompts_path, "rb") as prompts_file:
+				for line in prompts_file:
+					try:
+						entry = json.loads(line)
+					except json.JSONDecodeError:
+						byte_offset += len(line)
+						continue
+					self._offsets_by_video_id[entry["video_id"]] = byte_offset
+					self._hashes_by_video_id[entry["video_id"]] = entry.get("video_hash")
+					byte_offset += len(line)
+		self._file = open(self.prompts_path, "ab")
+		if not line.endswith(b"\n"):
+			# Do not append the next prompt to the truncated line
+			self._file.write(b"\n")
+		self._file_size = self._file.tell()
+
+	@classmethod
+	def for_experiment(
+		cls, folder: str, experiment: Any, max_cached_prompts: int = DEFAULT_MAX_CACHED_PROMPTS
+	) -> RenderedPromptStore:
+		"""The store of the attributes and the settings of an Experiment."""
+		return cls(
+			folder, experiment.attributes, experiment.attributes_settings, max_cached_prompts
+		)
+
+	def __enter__(self) -> RenderedPromptStore:
+		return self
+
+	def __exit__(self, *exc_info) -> None:
+		self.close()
+
+	def __len__(self) -> int:
+		return len(self._offsets_by_video_id)
+
+	def __contains__(self, video_id: str) -> bool:
+		return video_id in self._offsets_by_video_id
+
+	def __getitem__(self, video_id: str) -> str:
+		"""The last prompt rendered for the video id, raises KeyError if there is none."""
+		with self._lock:
+			if video_id in self._cached_prompts:
+				self._cached_prompts.move_to_end(video_id)
+				return self._cached_prompts[video_id]
+			byte_offset = self._offsets_by_video_id[video_id]
+			self._file.flush()
+			with open(self.prompts_path, "rb") as prompts_file:
+				prompts_file.seek(byte_offset)
+				prompt = json.loads(prompts_file.readline())["prompt"]
+			self._cache(video_id, prompt)
+			return prompt
+
+	def items(self) -> Iterator[tuple[str, str]]:
+		"""Stream the (video id, prompt) of all the rendered videos in rendering order."""
+		with self._lock:
+			self._file.flush()
+		byte_offset = 0
+		with open(self.prompts_path, "rb") as prompts_file:
+			for line in prompts_file:
+				try:
+					entry = json.loads(line)
+				except json.JSONDecodeError:
+					byte_offset += len(line)
+					continue
+				# Skip the prompts rendered again later
+				if self._offsets_by_video_id.get(entry["video_id"]) == byte_offset:
+					yield entry["video_id"], entry["prompt"]
+				byte_offset += len(line)
+
+	def get(self, video: RenderableVideo) -> str:
+		"""The prompt of the video, rendered and stored if this record of it was never rendered."""
+		current_hash = video_hash(video, self.attributes)
+		if self._hashes_by_video_id.get(video.id, "") == current_hash:
+			return self[video.id]
+		prompt = video.to_string_for_model_input(self.attributes, **self.attributes_settings)
+		self._append(video.id, current_hash, prompt)
+		self._file.flush()
+		return prompt
+
+	def render_all(self, videos: Iterable[RenderableVideo]) -> int:
+		"""
+		Render and store the prompts of all the videos whose record was never rendered, the videos
+		can be streamed (e.g. a VideoDataset). Returns the number of rendered prompts.
+		"""
+		rendered = 0
+		for video in videos:
+			current_hash = video_hash(video, self.attributes)
+			if self._hashes_by_video_id.get(video.id, "") == current_hash:
+				continue
+			prompt = video.to_string_for_model_input(self.attributes, **self.attributes_settings)
+			self._append(video.id, current_hash, prompt, cache=False)
+			rendered += 1
+		self._file.flush()
+		return rendered
+
+	def close(self) -> None:
+		self._file.close()
+
+	def _append(self, video_id: str, current_hash: str, prompt: str, cache: bool = True) -> None:
+		line = json.dumps({"video_id": video_id, "video_hash": current_hash, "prompt": prompt})
+		line = (line + "\n").encode("utf-8")
+		with self._lock:
+			self._file.write(line)
+			self._offsets_by_video_id[video_id] = self._file_size
+			self._hashes_by_video_id[video_id] = current_hash
+			self._file_size += len(line)
+			if cache:
+				self._cache(video_id, prompt)
+			else:
+				# The prompt of a previous record of the video
+				self._cached_prompts.pop(video_id, None)
+
+	def _cache(self, video_id: str, prompt: str) -> None:
+		self._cached_prompts[video_id] = prompt
+		self._cached_prompts.move_to_end(video_id)
+		if len(self._cached_prompts) > self.max_cached_prompts:
+			self._cached_prompts.popitem(last=False)
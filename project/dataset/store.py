@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from typing import Any, Iterator
+
+from project.utils import json_utils
+
+MANIFEST_FILENAME = "manifest.json"
+SHARD_FILENAME_FORMAT = "videos_infos-{:05}.jsonl"
+SHARD_IDS_FILENAME_FORMAT = "videos_infos-{:05}.ids"
+FAILED_FILENAME = "failed.jsonl"
+
+DEFAULT_MAX_SHARD_BYTES = 64 * 1024 * 1024
+
+
+def write_json_atomically(json_data: Any, file_path: str) -> None:
+	"""Write the json to a temporary file and move it over file_path, readers never see a partial file."""
+	tmp_file_path = f"{file_path}.tmp"
+	with open(tmp_file_path, "w") as tmp_file:
+		json.dump(json_data, tmp_file)
+		tmp_file.flush()
+		os.fsync(tmp_file.fileno())
+	os.replace(tmp_file_path, file_path)
+
+
+def _truncate_to(file_path: str, committed_bytes: int) -> None:
+	# Drop whatever was appended after the last checkpoint (e.g. a half written line after a crash)
+	if os.path.exists(file_path) and os.path.getsize(file_path) > committed_bytes:
+		os.truncate(file_path, committed_bytes)
+
+
+class ShardedDatasetStore:
+	"""
+	Append-only dataset of video infos split in size-capped JSONL shards.
+
+	Every record is appended as a single line to the current shard and its id is appended to a
+	sidecar .ids file, so that resuming only needs to read the ids. Once a shard exceeds
+	max_shard_bytes a new one is started. The manifest is the only file that gets rewritten: it
+	holds the committed size of every shard and it is replaced atomically on every checkpoint.
+	Anything appended after the last checkpoint is discarded when the store is opened again.
+	"""
+
+	def __init__(
+		self, folder: str, max_shard_bytes: int = DEFAULT_MAX_SHARD_BYTES, overwrite: bool = False
+	) -> None:
+		"""
+		:param folder: The folder holding the manifest and the shards, it is created if missing.
+		:param max_shard_bytes: A new shard is started once the current one exceeds this size.
+		:param overwrite: Delete the records already in the folder instead of resuming from them.
+		"""
+		if overwrite and os.path.isdir(folder):
+			shutil.rmtree(folder)
+		os.makedirs(folder, exist_ok=True)
+		self.folder = folder
+		self.max_shard_bytes = max_shard_bytes
+		self.manifest_path = os.path.join(folder, MANIFEST_FILENAME)
+
+		if os.path.exists(self.manifest_path):
+			with open(self.manifest_path, "r") as manifest_file:
+				self.manifest = json.load(manifest_file)
+		else:
+			self.manifest = {"shards": [], "failed": {"records": 0, "bytes": 0}}
+
+		for shard in self.manifest["shards"]:
+			_truncate_to(os.path.join(folder, shard["filename"]), shard["bytes"])
+			_truncate_to(os.path.join(folder, shard["ids_filename"]), shard["ids_bytes"])
+		_truncate_to(os.path.join(folder, FAILED_FILENAME), self.manifest["failed"]["bytes"])
+
+		self._shard_file = None
+		self._ids_file = None
+		self._failed_file = open(os.path.join(folder, FAILED_FILENAME), "ab")
+		if self.manifest["shards"]:
+			self._open_shard(self.manifest["shards"][-1])
+		else:
+			self._start_new_shard()
+
+	def __enter__(self) -> ShardedDatasetStore:
+		return self
+
+	def __exit__(self, *_) -> None:
+		self.close()
+
+	def __len__(self) -> int:
+		return sum(shard["records"] for shard in self.manifest["shards"])
+
+	def _open_shard(self, shard: dict[str, Any]) -> None:
+		if self._shard_file:
+			# The next checkpoint commits the byte counts of the previous shard too
+			for open_file in [self._shard_file, self._ids_file]:
+				open_file.flush()
+				os.fsync(open_file.fileno())
+				open_file.close()
+		self._shard_file = open(os.path.join(self.folder, shard["filename"]), "ab")
+		self._ids_file = open(os.path.join(self.folder, shard["ids_filename"]), "ab")
+
+	def _start_new_shard(self) -> None:
+		shard_index = len(self.manifest["shards"])
+		shard = {
+			"filename": SHARD_FILENAME_FORMAT.format(shard_index),
+			"ids_filename": SHARD_IDS_FILENAME_FORMAT.format(shard_index),
+			"records": 0,
+			"bytes": 0,
+			"ids_bytes": 0,
+		}
+		self.manifest["shards"].append(shard)
+		self._open_shard(shard)
+		# Checkpoint straight away so that the manifest always lists every shard on disk
+		self.checkpoint()
+
+	def append(self, video_info: Any) -> None:
+		"""Append a record, video_info can be a YouTubeVideoInfo or its json representation."""
+		line = (json_utils.dumps(video_info) + "\n").encode("utf-8")
+		video_id = video_info["id"] if isinstance(video_info, dict) else video_info.id
+		id_line = f"{video_id}\n".encode("utf-8")
+
+		shard = self.manifest["shards"][-1]
+		if shard["records"] > 0 and shard["bytes"] + len(line) > self.max_shard_bytes:
+			self._start_new_shard()
+			shard = self.manifest["shards"][-1]
+
+		self._shard_file.write(line)
+		self._ids_file.write(id_line)
+		shard["records"] += 1
+		shard["bytes"] += len(line)
+		shard["ids_bytes"] += len(id_line)
+
+	def append_failed(self, video_id: str, error: str) -> None:
+		line = (json.dumps({"id": video_id, "error": error}) + "\n").encode("utf-8")
+		self._failed_file.write(line)
+		self.manifest["failed"]["records"] += 1
+		self.manifest["failed"]["bytes"] += len(line)
+
+	def checkpoint(self) -> None:
+		"""Make everything appended so far durable and commit it in the manifest."""
+		for open_file in [self._shard_file, self._ids_file, self._failed_file]:
+			open_file.flush()
+			os.fsync(open_file.fileno())
+		write_json_atomically(self.manifest, self.manifest_path)
+
+	def close(self) -> None:
+		self.checkpoint()
+		for open_file in [self._shard_file, self._ids_file, self._failed_file]:
+			open_file.close()
+
+	def video_ids(self) -> Iterator[str]:
+		"""Ids of the committed records, only the .ids files are read."""
+		for shard in self.manifest["shards"]:
+			with open(os.path.join(self.folder, shard["ids_filename"]), "r") as ids_file:
+				for _, line in zip(range(shard["records"]), ids_file):
+					yield line.rstrip("\n")
+
+	def failed(self) -> dict[str, str]:
+		"""Errors of the committed failed videos by video id."""
+		failed = {}
+		with open(os.path.join(self.folder, FAILED_FILENAME), "r") as failed_file:
+			for _, line in zip(range(self.manifest["failed"]["records"]), failed_file):
+				failed_entry = json.loads(line)
+				failed[failed_entry["id"]] = failed_entry["error"]
+		return failed
+
+	def processed_video_ids(self) -> set[str]:
+		return set(self.video_ids()).union(self.failed().keys())
+
+	def iter_json(self) -> Iterator[dict[str, Any]]:
+		"""Stream the committed records as json, one at a time."""
+		for shard in self.manifest["shards"]:
+			with open(os.path.join(self.folder, shard["filename"]), "r") as shard_file:
+				for _, line in zip(range(shard["records"]), shard_file):
+					yield json.loads(line)
+
+	def export_json(self, dataset_file_path: str, failed_file_path: str) -> None:
+		"""
+		Write the committed records in the videos_infos.json/failed.json format. Records are
+		copied line by line so memory does not grow with the size of the dataset.
+		"""
+		tmp_file_path = f"{dataset_file_path}.tmp"
+		with open(tmp_file_path, "w") as dataset_file:
+			dataset_file.write("[")
+			separator = ""
+			for shard in self.manifest["shards"]:
+				with open(os.path.join(self.folder, shard["filename"]), "r") as shard_file:
+					for _, line in zip(range(shard["records"]), shard_file):
+						dataset_file.write(separator + line.rstrip("\n"))
+						separator = ", "
+			dataset_file.write("]")
+		os.replace(tmp_file_path, dataset_file_path)
+		write_json_atomically(self.failed(), failed_file_path)
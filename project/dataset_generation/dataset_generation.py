@@ -2,12 +2,17 @@ import glob
 import json
 import os
 import os.path
+import threading
+from typing import Any, Iterator
 
 import project.dataset_generation.yt_dlp_download as yt_dlp_download
-from project.models import YouTubeVideoInfo
-from project.utils.ffmpeg_utils import extract_frames_at_times
-from project.utils.json_utils import EnhancedJSONEncoder
+from project.dataset.store import DEFAULT_MAX_SHARD_BYTES, ShardedDatasetStore
+from project.dataset_generation.pipeline import run_pipeline
+from project.models import Heatmap, YouTubeVideoInfo
+from project.utils.ffmpeg_utils import extract_frames_at_times, extract_section_frames
+from project.utils.image_utils import transcode_to_jpeg
 from project.utils.sampling_utils import sample_fixed_interval, sample_heatmap, sample_random
+from project.utils.storyboard_utils import extract_frames_from_storyboard, select_storyboard_format
 from project.youtube.client import YouTubeClient
 
 YT_DLP_INFO_JSON_FILENAME_FORMAT = "{}.info.json"
@@ -18,6 +23,9 @@ YT_DLP_AUTO_SUBS_FILENAME_FORMAT = "{}.auto-subs.en.srt"
 
 DATASET_YT_DLP_DESTINATION_FOLDER = "{}/ytdlp-metadata"
 DATASET_IMAGES_FOLDER = "{}/images"
+DATASET_STORE_FOLDER = "{}/videos_infos"
+
+_yt_client_lock = threading.Lock()
 
 
 def generate_dataset_entry_from_video_id(
@@ -27,6 +35,11 @@ def generate_dataset_entry_from_video_id(
 	frames_to_extract: int,
 	delete_ytdlp_data_after: bool = True,
 	working_folder: str | None = None,
+	partial_download: bool = False,
+	frames_height: int | None = None,
+	use_storyboards: bool = False,
+	ydl_pool: yt_dlp_download.YoutubeDLPool | None = None,
+	heatmap_min_separation_s: float = 0.0,
 ) -> YouTubeVideoInfo:
 	"""
 	Download all the data for a single video.
@@ -37,6 +50,11 @@ def generate_dataset_entry_from_video_id(
 	:param frames_to_extract: The number of frames to extract for each sampling technique.
 	:param delete_ytdlp_data_after: Whether to delete the raw ytdlp data after having processed the video.
 	:param working_folder: The folder to use for downloading and processing the raw data. This parameter can be used to process already downloaded data, without downloading it (at least the mp4) again.
+	:param partial_download: Sample the frames timestamps from the video info before downloading any media and download only a short section of the video for each of them instead of the whole video.
+	:param frames_height: Download the smallest video-only format with at least this height instead of the best format, see download_video_and_metadata.
+	:param use_storyboards: Take the frames from the storyboard sprite sheets of YouTube instead of downloading the video. Frames are low resolution (the largest storyboards have 320px wide tiles) and mapped to the nearest tile. Cannot be combined with partial_download.
+	:param ydl_pool: Reuse the YoutubeDL instances of the pool instead of creating a new one for the video.
+	:param heatmap_min_separation_s: Minimum distance between the frames sampled from the heatmap, so that they come from different peaks, see sample_heatmap.
 	:return: The YouTubeVideoInfo objct containing all the info of the video, the extracted frames are in the destination_folder/images folder.
 	"""
 	ytdlp_metadata_destination_folder = DATASET_YT_DLP_DESTINATION_FOLDER.format(destination_folder)
@@ -45,14 +63,73 @@ def generate_dataset_entry_from_video_id(
 	if working_folder is None:
 		working_folder = ytdlp_metadata_destination_folder
 
-	# Download video, info, subs, auto-subs
-	info_json = yt_dlp_download.download_video_and_metadata(video_id, working_folder, download_video=frames_to_extract > 0)
+	yt_video_info, timestamps_by_frame_prefix = download_dataset_entry(
+		yt_client,
+		video_id,
+		destination_folder,
+		frames_to_extract,
+		working_folder,
+		partial_download,
+		frames_height,
+		use_storyboards,
+		ydl_pool,
+		heatmap_min_separation_s,
+	)
+	extract_dataset_entry_frames(
+		video_id,
+		timestamps_by_frame_prefix,
+		destination_folder,
+		delete_ytdlp_data_after,
+		working_folder,
+		partial_download,
+	)
+	return yt_video_info
+
+
+def download_dataset_entry(
+	yt_client: YouTubeClient,
+	video_id: str,
+	destination_folder: str,
+	frames_to_extract: int,
+	working_folder: str,
+	partial_download: bool = False,
+	frames_height: int | None = None,
+	use_storyboards: bool = False,
+	ydl_pool: yt_dlp_download.YoutubeDLPool | None = None,
+	heatmap_min_separation_s: float = 0.0,
+) -> tuple[YouTubeVideoInfo, dict[str, list[float]]]:
+	"""
+	Network bound part of generate_dataset_entry_from_video_id: download the video and its metadata
+	in the working_folder and move the thumbnail to the destination_folder/images folder.
+
+	With use_storyboards the frames are extracted here from the storyboards, since that is network
+	bound as well, and no timestamps are left to extract from the video.
 
-	# with open(
-	# 	os.path.join(working_folder, YT_DLP_INFO_JSON_FILENAME_FORMAT.format(video_id)),
-	# 	"r",
-	# ) as info_file:
-	# 	info_json = json.load(info_file)
+	:return: The YouTubeVideoInfo of the video and the timestamps of the frames to extract by frame prefix.
+	"""
+	check_frames_source(partial_download, use_storyboards)
+	timestamps_by_frame_prefix = {}
+
+	def sections_timestamps(info: dict[str, Any]) -> list[float]:
+		heatmap = Heatmap.from_yt_dlp_heatmap(info["heatmap"]) if info.get("heatmap") else None
+		timestamps_by_frame_prefix.update(
+			sample_frames_timestamps(
+				video_id, info["duration"], heatmap, frames_to_extract, heatmap_min_separation_s
+			)
+		)
+		return [t for timestamps in timestamps_by_frame_prefix.values() for t in timestamps]
+
+	# Download video (or only the sections around the frames), info, subs, auto-subs
+	info_json = yt_dlp_download.download_video_and_metadata(
+		video_id,
+		working_folder,
+		download_video=frames_to_extract > 0 and not use_storyboards,
+		sections_timestamps=sections_timestamps
+		if partial_download and frames_to_extract > 0
+		else None,
+		frames_height=frames_height,
+		ydl_pool=ydl_pool,
+	)
 
 	subs_filename = os.path.join(working_folder, YT_DLP_SUBS_FILENAME_FORMAT.format(video_id))
 	subs = None
@@ -71,7 +148,9 @@ def generate_dataset_entry_from_video_id(
 	# Check if video has location metadata
 	location = None
 	if info_json.get("location") and yt_client:
-		data_api_video_data = yt_client.get_videos([video_id])[0]
+		# The Data API client is not thread safe
+		with _yt_client_lock:
+			data_api_video_data = yt_client.get_videos([video_id])[0]
 		location = data_api_video_data.location
 
 	# Create youtubevideoinfo object
@@ -89,36 +168,94 @@ def generate_dataset_entry_from_video_id(
 			os.path.join(dataset_images_folder, f"{video_id}_thumbnail.{extension}"),
 		)
 
-	# Extract frames from video
-	if frames_to_extract > 0:
-		video_path = os.path.join(working_folder, f"{video_id}.mp4")
-		extract_frames_at_times(
-			video_path,
-			sample_random(yt_video_info.duration_s, frames_to_extract),
-			dataset_images_folder,
-			f"{video_id}_rand",
+	if not partial_download:
+		timestamps_by_frame_prefix = sample_frames_timestamps(
+			video_id,
+			yt_video_info.duration_s,
+			yt_video_info.heatmap,
+			frames_to_extract,
+			heatmap_min_separation_s,
 		)
-		if yt_video_info.heatmap:
-			extract_frames_at_times(
-				video_path,
-				sample_heatmap(yt_video_info.heatmap, frames_to_extract),
-				dataset_images_folder,
-				f"{video_id}_hm",
-			)
-		extract_frames_at_times(
-			video_path,
-			sample_fixed_interval(yt_video_info.duration_s, frames_to_extract),
-			dataset_images_folder,
-			f"{video_id}_fi",
+
+	if use_storyboards and timestamps_by_frame_prefix:
+		storyboard_format = select_storyboard_format(info_json.get("formats") or [])
+		if storyboard_format is None:
+			raise ValueError(f"No storyboard available for video {video_id}")
+		extract_frames_from_storyboard(
+			storyboard_format, timestamps_by_frame_prefix, dataset_images_folder
 		)
+		timestamps_by_frame_prefix = {}
+
+	return yt_video_info, timestamps_by_frame_prefix
+
+
+def check_frames_source(partial_download: bool, use_storyboards: bool) -> None:
+	"""Storyboards replace the video, there are no sections to download with partial_download."""
+	if partial_download and use_storyboards:
+		raise ValueError("partial_download and use_storyboards cannot be used together")
+
+
+def sample_frames_timestamps(
+	video_id: str,
+	duration_s: float,
+	heatmap: Heatmap | None,
+	frames_to_extract: int,
+	heatmap_min_separation_s: float = 0.0,
+) -> dict[str, list[float]]:
+	"""Timestamps of the frames to extract with every sampling technique, by frame prefix."""
+	if frames_to_extract <= 0:
+		return {}
+	timestamps_by_frame_prefix = {f"{video_id}_rand": sample_random(duration_s, frames_to_extract)}
+	if heatmap:
+		timestamps_by_frame_prefix[f"{video_id}_hm"] = sample_heatmap(
+			heatmap, frames_to_extract, heatmap_min_separation_s
+		)
+	timestamps_by_frame_prefix[f"{video_id}_fi"] = sample_fixed_interval(
+		duration_s, frames_to_extract
+	)
+	return timestamps_by_frame_prefix
+
+
+def extract_dataset_entry_frames(
+	video_id: str,
+	timestamps_by_frame_prefix: dict[str, list[float]],
+	destination_folder: str,
+	delete_ytdlp_data_after: bool,
+	working_folder: str,
+	partial_download: bool = False,
+) -> None:
+	"""
+	CPU bound part of generate_dataset_entry_from_video_id: extract the frames from the downloaded
+	video (or from its sections when partial_download is set), transcode the webp thumbnail to JPEG
+	(kept next to it, see transcode_to_jpeg) and delete the raw ytdlp data.
+	"""
+	dataset_images_folder = DATASET_IMAGES_FOLDER.format(destination_folder)
+	thumbnail_path = os.path.join(dataset_images_folder, f"{video_id}_thumbnail.webp")
+	if os.path.isfile(thumbnail_path):
+		try:
+			transcode_to_jpeg(thumbnail_path)
+		except Exception as e:
+			# The webp thumbnail is kept, the frames are still extracted
+			print(f"Error converting {thumbnail_path}: {e}")
+	video_path = os.path.join(working_folder, f"{video_id}.mp4")
+	for frame_prefix, timestamps in timestamps_by_frame_prefix.items():
+		if partial_download:
+			sections_paths = {
+				round(t, 1): os.path.join(
+					working_folder,
+					yt_dlp_download.SECTION_FILENAME_FORMAT.format(video_id, round(t, 1)),
+				)
+				for t in timestamps
+			}
+			extract_section_frames(sections_paths, timestamps, dataset_images_folder, frame_prefix)
+		else:
+			extract_frames_at_times(video_path, timestamps, dataset_images_folder, frame_prefix)
 
 	# Delete info, subs, video
 	if delete_ytdlp_data_after:
 		for filepath in glob.glob(os.path.join(working_folder, f"{video_id}.*")):
 			os.remove(filepath)
 
-	return yt_video_info
-
 
 def generate_dataset_from_video_ids(
 	yt_client: YouTubeClient,
@@ -129,54 +266,119 @@ def generate_dataset_from_video_ids(
 	working_folder: str | None = None,
 	save_every_n_videos: int = 100,
 	resume_from_file: bool = False,
-) -> list[YouTubeVideoInfo]:
+	max_shard_bytes: int = DEFAULT_MAX_SHARD_BYTES,
+	download_workers: int = 1,
+	processing_workers: int = 1,
+	max_pending_videos: int | None = None,
+	partial_download: bool = False,
+	frames_height: int | None = None,
+	use_storyboards: bool = False,
+	heatmap_min_separation_s: float = 0.0,
+) -> None:
+	"""
+	Download all the data for a list of videos.
+
+	Downloads and frame extraction run concurrently with run_pipeline. Each processed video is
+	appended to a ShardedDatasetStore under destination_folder/videos_infos, the store is
+	checkpointed every save_every_n_videos videos. At the end the store is exported to
+	destination_folder/videos_infos.json and destination_folder/failed.json. Nothing is returned,
+	the videos are not kept in memory: read them back with VideoDataset(destination_folder).
+
+	:param resume_from_file: Skip the videos already in the store (or in a videos_infos.json and failed.json created before the store existed) instead of starting from scratch.
+	:param max_shard_bytes: Maximum size of a single shard of the store.
+	:param download_workers: Number of videos downloaded concurrently, see run_pipeline.
+	:param processing_workers: Number of processes extracting frames, see run_pipeline.
+	:param max_pending_videos: Maximum number of videos in flight, see run_pipeline.
+	:param partial_download: Download only short sections of the videos around the frames, see generate_dataset_entry_from_video_id.
+	:param frames_height: Download the smallest video-only format with at least this height, see generate_dataset_entry_from_video_id.
+	:param use_storyboards: Take the frames from the storyboards instead of the video, see generate_dataset_entry_from_video_id.
+	:param heatmap_min_separation_s: Minimum distance between the frames sampled from the heatmap, see generate_dataset_entry_from_video_id.
+	"""
+	check_frames_source(partial_download, use_storyboards)
 	if working_folder is None:
 		working_folder = destination_folder
 
 	dataset_filename = os.path.join(destination_folder, "videos_infos.json")
 	failed_filename = os.path.join(destination_folder, "failed.json")
-	dataset_metadata = []
-	failed = dict()
-	if resume_from_file:
+	store = ShardedDatasetStore(
+		DATASET_STORE_FOLDER.format(destination_folder),
+		max_shard_bytes=max_shard_bytes,
+		overwrite=not resume_from_file,
+	)
+	if resume_from_file and len(store) == 0 and os.path.exists(dataset_filename):
+		# Dataset generated before the sharded store, import it once
 		with open(dataset_filename, "r") as dataset_file:
-			dataset_metadata = json.load(dataset_file)
+			for video in json.load(dataset_file):
+				store.append(video)
 		with open(failed_filename, "r") as failed_file:
-			failed = json.load(failed_file)
-		
-	already_processed_video_ids = set([video["id"] for video in dataset_metadata]).union(set(failed.keys()))
-
-	def save_metadata(d, f):
-		with open(dataset_filename, "w") as dataset_file:
-			json.dump(d, dataset_file, cls=EnhancedJSONEncoder)
-		with open(failed_filename, "w") as failed_file:
-			json.dump(f, failed_file, cls=EnhancedJSONEncoder)
-
-	for i, video_id in enumerate(video_ids):
-		print(f"Processing video {i}/{len(video_ids)} ⚙️")
-		if video_id in already_processed_video_ids:
-			print(f"Skipping video {video_id} as it has already been processed.")
-			continue
-		try:
-			dataset_metadata.append(
-				generate_dataset_entry_from_video_id(
-					yt_client,
-					video_id,
-					destination_folder,
-					frames_per_video,
-					delete_ytdlp_data_after,
-					working_folder,
-				)
-			)
-		except Exception as exception:
-			print(f"Error while processing {video_id}")
-			print(exception)
-			failed[video_id] = str(exception)
-			continue
-		if (i + 1) % save_every_n_videos == 0:
-			save_metadata(dataset_metadata, failed)
+			for video_id, error in json.load(failed_file).items():
+				store.append_failed(video_id, error)
+		store.checkpoint()
+
+	already_processed_video_ids = store.processed_video_ids()
+
+	def video_ids_to_process() -> Iterator[str]:
+		for i, video_id in enumerate(video_ids):
+			print(f"Processing video {i}/{len(video_ids)} ⚙️")
+			if video_id in already_processed_video_ids:
+				print(f"Skipping video {video_id} as it has already been processed.")
+				continue
+			yield video_id
+
+	def download_stage(video_id: str) -> tuple[YouTubeVideoInfo, tuple]:
+		yt_video_info, timestamps_by_frame_prefix = download_dataset_entry(
+			yt_client,
+			video_id,
+			destination_folder,
+			frames_per_video,
+			working_folder,
+			partial_download,
+			frames_height,
+			use_storyboards,
+			ydl_pool,
+			heatmap_min_separation_s,
+		)
+		return yt_video_info, (
+			video_id,
+			timestamps_by_frame_prefix,
+			destination_folder,
+			delete_ytdlp_data_after,
+			working_folder,
+			partial_download,
+		)
+
+	processed_videos = 0
+
+	def on_success(video_id: str, yt_video_info: YouTubeVideoInfo) -> None:
+		nonlocal processed_videos
+		store.append(yt_video_info)
+		processed_videos += 1
+		if processed_videos % save_every_n_videos == 0:
+			store.checkpoint()
+
+	def on_failure(video_id: str, exception: Exception) -> None:
+		print(f"Error while processing {video_id}")
+		print(exception)
+		store.append_failed(video_id, str(exception))
+
+	# One long-lived YoutubeDL instance per download worker
+	ydl_pool = yt_dlp_download.YoutubeDLPool()
+	try:
+		run_pipeline(
+			video_ids_to_process(),
+			download_stage,
+			extract_dataset_entry_frames,
+			on_success,
+			on_failure,
+			download_workers=download_workers,
+			processing_workers=processing_workers,
+			max_pending_videos=max_pending_videos,
+		)
+	finally:
+		ydl_pool.close()
 
-	save_metadata(dataset_metadata, failed)
-	return dataset_metadata
+	store.close()
+	store.export_json(dataset_filename, failed_filename)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import multiprocessing
+from concurrent.futures import (
+	FIRST_COMPLETED,
+	Future,
+	ProcessPoolExecutor,
+	ThreadPoolExecutor,
+	wait,
+)
+from typing import Any, Callable, Iterable
+
+# Forking while the download threads run can deadlock the children on a lock held by one of them
+# (e.g. in yt-dlp or in logging), the processing workers are started from a clean process instead
+PROCESSING_START_METHOD = (
+	"forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+def run_pipeline(
+	video_ids: Iterable[str],
+	download_stage: Callable[[str], tuple[Any, tuple | None]],
+	processing_stage: Callable[..., None],
+	on_success: Callable[[str, Any], None],
+	on_failure: Callable[[str, Exception], None],
+	download_workers: int = 1,
+	processing_workers: int = 1,
+	max_pending_videos: int | None = None,
+) -> None:
+	"""
+	Run the network bound and the CPU bound work of the videos concurrently.
+
+	Downloads run in a thread pool, processing runs in a process pool. A new download is started
+	only when a download worker is free and less than max_pending_videos videos are in flight, so
+	that a slow processing stage does not fill the disk with downloaded but unprocessed videos.
+	All the callbacks are invoked from the calling thread, they do not need to be thread safe.
+
+	:param video_ids: The ids of the videos to process.
+	:param download_stage: Called with the video id in the thread pool. It returns the result of the video and the arguments of processing_stage, or None if there is nothing to process.
+	:param processing_stage: Called with the arguments returned by download_stage in the process pool (started with PROCESSING_START_METHOD), must be picklable.
+	:param on_success: Called with the video id and the result of download_stage once the video is fully processed. An exception raised by on_success is reported to on_failure like the ones of the stages.
+	:param on_failure: Called with the video id and the exception raised by any of the stages.
+	:param download_workers: Maximum number of concurrent downloads.
+	:param processing_workers: Maximum number of concurrent processing jobs.
+	:param max_pending_videos: Maximum number of videos being downloaded, waiting for processing or being processed. Defaults to download_workers + 2 * processing_workers.
+	"""
+	if max_pending_videos is None:
+		max_pending_videos = download_workers + 2 * processing_workers
+	video_ids_iterator = iter(video_ids)
+	downloads: dict[Future, str] = {}
+	processing: dict[Future, tuple[str, Any]] = {}
+	exhausted = False
+
+	def succeed(video_id: str, result: Any) -> None:
+		try:
+			on_success(video_id, result)
+		except Exception as exception:
+			on_failure(video_id, exception)
+
+	with (
+		ThreadPoolExecutor(max_workers=download_workers) as download_executor,
+		ProcessPoolExecutor(
+			max_workers=processing_workers,
+			mp_context=multiprocessing.get_context(PROCESSING_START_METHOD),
+		) as processing_executor,
+	):
+		while True:
+			while (
+				not exhausted
+				and len(downloads) < download_workers
+				and len(downloads) + len(processing) < max_pending_videos
+			):
+				video_id = next(video_ids_iterator, None)
+				if video_id is None:
+					exhausted = True
+					break
+				downloads[download_executor.submit(download_stage, video_id)] = video_id
+
+			if not downloads and not processing:
+				return
+
+			done, _ = wait([*downloads, *processing], return_when=FIRST_COMPLETED)
+			for future in done:
+				if future in downloads:
+					video_id = downloads.pop(future)
+					try:
+						result, processing_args = future.result()
+					except Exception as exception:
+						on_failure(video_id, exception)
+						continue
+					if processing_args is None:
+						succeed(video_id, result)
+						continue
+					processing[processing_executor.submit(processing_stage, *processing_args)] = (
+						video_id,
+						result,
+					)
+				else:
+					video_id, result = processing.pop(future)
+					try:
+						future.result()
+					except Exception as exception:
+						on_failure(video_id, exception)
+						continue
+					succeed(video_id, result)
@@ -1,15 +1,58 @@
-import glob
+import os.path
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Hashable, Iterator
 
 import yt_dlp
 
 import project.utils.yt_dlp_utils as yt_dlp_utils
-from project.models import YouTubeVideoInfo
 
 YOUTUBE_VIDEO_URL_FORMAT = "https://www.youtube.com/watch?v={}"
+SECTION_FILENAME_FORMAT = "{}.section-{}.mp4"
+SECTION_DURATION_S = 1.0
+SUBTITLES_LANGUAGE = "en"
+# SRT is used as is, the other formats are converted in process by convert_subtitles_to_srt
+SUBTITLES_FORMATS_PREFERENCE = ("srt", "vtt", "json3", "srv3")
 
 
-def download_video_and_metadata(video_id: str, download_folder: str, download_video: bool = True):
-	# Configure yt-dlp options
+class YoutubeDLPool:
+	"""
+	Long-lived YoutubeDL instances reused across videos, so that the extractors initialization and
+	the HTTP connections are paid once per instance instead of once per video. Every instance is
+	used by one thread at a time, the pool grows up to the number of concurrent downloads.
+	"""
+
+	def __init__(self) -> None:
+		self._idle_ydls: dict[Hashable, list[yt_dlp.YoutubeDL]] = {}
+		self._lock = threading.Lock()
+
+	@contextmanager
+	def session(self, key: Hashable, ydl_opts: dict[str, Any]) -> Iterator[yt_dlp.YoutubeDL]:
+		"""An idle instance created with the same key, or a new one created with ydl_opts."""
+		with self._lock:
+			idle_ydls = self._idle_ydls.setdefault(key, [])
+			ydl = idle_ydls.pop() if idle_ydls else None
+		if ydl is None:
+			ydl = yt_dlp.YoutubeDL(ydl_opts)
+		try:
+			yield ydl
+		finally:
+			with self._lock:
+				self._idle_ydls[key].append(ydl)
+
+	def close(self) -> None:
+		with self._lock:
+			for idle_ydls in self._idle_ydls.values():
+				for ydl in idle_ydls:
+					ydl.close()
+			self._idle_ydls.clear()
+
+
+def _ydl_options(
+	download_folder: str, download_video: bool, frames_height: int | None, sections: bool
+) -> dict[str, Any]:
 	ydl_opts = {
 		"extractor_args": {
 			"youtube": {"comment_sort": "top", "max_comments": ["all", "20", "all", "5"]}
@@ -19,49 +62,149 @@ def download_video_and_metadata(video_id: str, download_folder: str, download_vi
 		"writeinfojson": True,  # Save video metadata as JSON
 		"writethumbnail": True,  # Download thumbnail
 		"writesubtitles": True,  # Download subtitles if available
-		"subtitlesformat": "srt",  # Download subtitles in SRT format
-		"subtitleslangs": ["en"],  # Choose the language of subtitles
+		# Download subtitles in SRT format, or in a format converted to SRT after the extraction
+		"subtitlesformat": "/".join([*SUBTITLES_FORMATS_PREFERENCE, "best"]),
+		"subtitleslangs": [SUBTITLES_LANGUAGE],  # Choose the language of subtitles
 		"format": "best",  # Download best quality video
-		"postprocessors": [
-			{  # Convert subtitles to SRT format
-				"key": "FFmpegSubtitlesConvertor",
-				"format": "srt",
-			}
-		],
+		"skip_download": not download_video,  # Still writes info, subs and thumbnail
 	}
 
-	# Download video, thumbnail, and metadata
-	with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-		video_info = ydl.extract_info(YOUTUBE_VIDEO_URL_FORMAT.format(video_id), download=download_video)
-
-	# Automatic subs
-	auto_subs_opts = {
-		"outtmpl": f"{download_folder}/%(id)s.auto-subs.%(ext)s",  # Save video in the specified folder
-		"writesubtitles": True,
-		"writeautomaticsub": True,
-		"subtitleslangs": ["en"],
-		"skip_download": True,
-		"subtitlesformat": "srt",  # Download subtitles in SRT format
-		"postprocessors": [
-			{  # Convert subtitles to SRT format
-				"key": "FFmpegSubtitlesConvertor",
-				"format": "srt",
-			}
-		],
-	}
+	if frames_height:
+		ydl_opts["format"] = yt_dlp_utils.frames_format_selector(frames_height)
+
+	if sections:
+		ydl_opts["outtmpl"] = {
+			"default": f"{download_folder}/%(id)s.section-%(section_start)s.%(ext)s",
+			"infojson": f"{download_folder}/%(id)s.%(ext)s",
+			"subtitle": f"{download_folder}/%(id)s.%(ext)s",
+			"thumbnail": f"{download_folder}/%(id)s.%(ext)s",
+		}
+		# A stream copied section starts at the keyframe before its start, seconds earlier on
+		# videos with sparse keyframes, and only the containers with an edit list hide the frames
+		# before the start: the sections are re-encoded so that their first frame is at the start
+		ydl_opts["force_keyframes_at_cuts"] = True
+	return ydl_opts
+
+
+def download_video_and_metadata(
+	video_id: str,
+	download_folder: str,
+	download_video: bool = True,
+	sections_timestamps: Callable[[dict[str, Any]], list[float]] | None = None,
+	video_url: str | None = None,
+	frames_height: int | None = None,
+	ydl_pool: YoutubeDLPool | None = None,
+):
+	"""
+	Download the video, its metadata, subtitles, automatic subtitles and thumbnail in the download
+	folder with a single extraction.
+
+	:param download_video: When False the metadata, subtitles and thumbnail are written but the video is not downloaded.
+	:param sections_timestamps: When set only short sections of the video are downloaded instead of the whole video. It is called with the yt-dlp info of the video before any media is downloaded and returns the timestamps of the sections. The section starting at timestamp t is saved as SECTION_FILENAME_FORMAT.format(video_id, round(t, 1)).
+	:param video_url: The url to download from, the YouTube url of the video by default.
+	:param frames_height: When set the video is only used to extract frames of this height: the smallest video-only format that is high enough is downloaded instead of the best muxed format.
+	:param ydl_pool: Reuse a YoutubeDL instance of the pool instead of creating a new one.
+	"""
+	start_time = time.perf_counter()
+	sections = sections_timestamps is not None
+	ydl_opts = _ydl_options(download_folder, download_video, frames_height, sections)
+	if ydl_pool is None:
+		ydl_session = yt_dlp.YoutubeDL(ydl_opts)
+	else:
+		ydl_session = ydl_pool.session(
+			(download_folder, download_video, frames_height, sections), ydl_opts
+		)
+
+	with ydl_session as ydl:
+		session_time = time.perf_counter()
+		if sections:
+			# The only per video option, it is read when the video is processed
+			ydl.params["download_ranges"] = lambda info, _: [
+				{"start_time": timestamp, "end_time": timestamp + SECTION_DURATION_S}
+				for timestamp in sorted(set(round(t, 1) for t in sections_timestamps(info)))
+			]
+		try:
+			# Download video, thumbnail, subs and metadata
+			video_info = ydl.extract_info(video_url or YOUTUBE_VIDEO_URL_FORMAT.format(video_id))
+		finally:
+			ydl.params.pop("download_ranges", None)
+		extraction_time = time.perf_counter()
+		convert_requested_subtitles(video_info, download_folder)
+		write_automatic_subtitles(ydl, video_info, download_folder)
+		end_time = time.perf_counter()
+
+	print(
+		f"yt-dlp {video_id}: session {session_time - start_time:.2f}s, "
+		f"extraction {extraction_time - session_time:.2f}s, "
+		f"automatic subtitles {end_time - extraction_time:.2f}s"
+	)
+
+	if frames_height and download_video:
+		report_frames_format(video_info)
 
-	with yt_dlp.YoutubeDL(auto_subs_opts) as ydl:
-		ydl.process_ie_result(video_info)
-		# Postprocessors are not invoked by that method so this is a workaround
-		auto_subs_paths = glob.glob(f"{download_folder}/{video_id}.auto-subs.en.*")
-		if auto_subs_paths:
-			# ydl.post_process(auto_subs_paths[0], info) # TODO: make this work and remove line below
-			yt_dlp_utils.convert_subtitles_to_srt(
-				auto_subs_paths[0], f"{download_folder}/{video_id}.auto-subs.en.srt"
-			)
-	
 	return video_info
 
+
+def convert_requested_subtitles(video_info: dict[str, Any], download_folder: str) -> None:
+	"""Convert the subtitles written by yt-dlp to {id}.en.srt if they are not already SRT."""
+	subtitles = (video_info.get("requested_subtitles") or {}).get(SUBTITLES_LANGUAGE)
+	if not subtitles or subtitles.get("ext") == "srt" or not subtitles.get("filepath"):
+		return
+	subs_path = os.path.join(download_folder, f"{video_info['id']}.{SUBTITLES_LANGUAGE}.srt")
+	yt_dlp_utils.convert_subtitles_to_srt(subtitles["filepath"], subs_path)
+
+
+def write_automatic_subtitles(
+	ydl: yt_dlp.YoutubeDL, video_info: dict[str, Any], download_folder: str
+) -> None:
+	"""
+	Write the {id}.auto-subs.en.srt file from the already extracted info, without extracting the
+	video again. Like yt-dlp with writeautomaticsub, the manual subtitles are preferred to the
+	automatic captions when they exist.
+	"""
+	video_id = video_info["id"]
+	auto_subs_path = os.path.join(download_folder, f"{video_id}.auto-subs.{SUBTITLES_LANGUAGE}.srt")
+	if os.path.exists(auto_subs_path):
+		return
+	subs_path = os.path.join(download_folder, f"{video_id}.{SUBTITLES_LANGUAGE}.srt")
+	if os.path.exists(subs_path):
+		shutil.copyfile(subs_path, auto_subs_path)
+		return
+
+	captions = (video_info.get("automatic_captions") or {}).get(SUBTITLES_LANGUAGE) or []
+	captions_by_ext = {c.get("ext"): c for c in captions}
+	ext = next((e for e in SUBTITLES_FORMATS_PREFERENCE if e in captions_by_ext), None)
+	if ext is None:
+		return
+	captions_path = os.path.join(
+		download_folder, f"{video_id}.auto-subs.{SUBTITLES_LANGUAGE}.{ext}"
+	)
+	with open(captions_path, "wb") as captions_file:
+		captions_file.write(ydl.urlopen(captions_by_ext[ext]["url"]).read())
+	yt_dlp_utils.convert_subtitles_to_srt(captions_path, auto_subs_path)
+
+
+def report_frames_format(video_info: dict[str, Any]) -> None:
+	"""Print the bytes saved by the selected format compared to the best muxed format."""
+	formats = video_info.get("formats") or []
+	duration_s = video_info.get("duration")
+	selected_format = next(
+		(f for f in formats if f.get("format_id") == video_info.get("format_id")), None
+	)
+	best_format = yt_dlp_utils.best_muxed_format(formats)
+	if not selected_format or not best_format:
+		return
+	selected_size = yt_dlp_utils.format_size(selected_format, duration_s)
+	best_size = yt_dlp_utils.format_size(best_format, duration_s)
+	if selected_size is None or best_size is None:
+		return
+	print(
+		f"Selected format {selected_format['format_id']} ({selected_format.get('height')}p video "
+		f"only) for {video_info['id']}: {(best_size - selected_size) / 1e6:.1f}MB saved compared "
+		f"to format {best_format['format_id']}"
+	)
+
+
 if __name__ == "__main__":
 	download_video_and_metadata("dQw4w9WgXcQ", ".")
 	# download_video("csdXyd3B2EQ", ".")
@@ -4,6 +4,12 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import Any
 
+from project.llm_models.classification import (
+	completion_content,
+	label_probability,
+	parse_label,
+)
+
 
 @dataclass
 class Experiment:
@@ -39,15 +45,23 @@ class Experiment:
 			predicted_labels_by_model[model] = {}
 			for vid, completion in completions.items():
 				try:
-					is_conspiracy = "1" in completion.choices[0].message.content
-					correct_output_format = completion.choices[0].message.content in ["0", "1"]
-					predicted_labels_by_model[model][vid] = {
-						"is_conspiracy": is_conspiracy,
-						"correct_output_format": correct_output_format,
-						"output": completion.choices[0].message.content,
-					}
+					content = completion_content(completion)
+					is_conspiracy = "1" in content
+					correct_output_format = parse_label(content) is not None
 				except Exception as exception:
 					predicted_labels_by_model[model][vid] = str(exception)
+					continue
+				try:
+					probability = label_probability(completion)
+				except Exception:
+					# Malformed logprobs do not invalidate the label
+					probability = None
+				predicted_labels_by_model[model][vid] = {
+					"is_conspiracy": is_conspiracy,
+					"correct_output_format": correct_output_format,
+					"output": content,
+					"probability": probability,
+				}
 
 		return cls(
 			attributes_settings=attributes_settings,
@@ -0,0 +1,388 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from functools import partial
+from typing import Any, Callable, Iterable, Iterator
+
+from project.dataset.rendered_prompts import RenderableVideo, RenderedPromptStore
+from project.dataset.store import write_json_atomically
+from project.experiments.models import Experiment
+from project.llm_models.completion_cache import CompletionCache, completion_key
+from project.llm_models.engine import InferenceRequest, OllamaInferenceEngine, read_images
+from project.llm_models.image_cache import PreparedImageCache
+from project.llm_models.scheduler import OllamaModelScheduler
+from project.utils import json_utils
+from project.utils.subtitles_utils import TRANSCRIPT_CACHE_FILENAME, use_transcript_cache
+
+EXPERIMENT_FOLDER_FORMAT = "experiment-{}"
+SETTINGS_FILENAME = "experiment.json"
+JOURNAL_FILENAME_FORMAT = "completions-{}.jsonl"
+JOURNAL_IDS_FILENAME_FORMAT = "completions-{}.ids"
+DEFAULT_MAX_IN_FLIGHT_PER_MODEL = 4
+
+COMPLETED = "completed"
+FAILED = "failed"
+
+# (model, system prompt, user prompt, images paths) -> completion
+CompleteFunction = Callable[[str, str, str, list[str]], Any]
+
+
+class CompletionJournal:
+	"""
+	The completions of one model in one experiment, appended to a JSON lines file as soon as they
+	are received, so that a crash loses only the requests in flight.
+
+	The first line of the journal is a header holding the settings the completions depend on
+	(the model, the prompts and the attributes): a journal written with other settings is never
+	resumed, opening it raises a ValueError.
+
+	The id and the status of every journaled video are appended to a sidecar .ids file once its
+	completion is written, so that resuming only reads the ids and never the completions. A video
+	in the journal but not in the .ids file (a crash between the two writes) is run again, the
+	last completion of a video wins. Truncated last lines are ignored.
+	"""
+
+	def __init__(self, journal_path: str, ids_path: str, header: dict[str, Any]) -> None:
+		"""
+		:param header: The settings of the completions, they must be the ones of the header of
+		the journal if it exists.
+		"""
+		self.journal_path = journal_path
+		self.ids_path = ids_path
+		# As it is read back from the journal (e.g. tuples as lists)
+		self.header = json.loads(json_utils.dumps(header))
+		self.statuses_by_video_id: dict[str, str] = {}
+		journal_header = _read_header(journal_path)
+		if journal_header is None:
+			with open(journal_path, "wb") as journal_file:
+				journal_file.write((json.dumps({"header": self.header}) + "\n").encode("utf-8"))
+			with open(ids_path, "wb"):
+				pass
+		elif journal_header != self.header:
+			raise ValueError(
+				f"{journal_path} was written with the settings {journal_header}, not "
+				f"{self.header}: run the experiment with another id"
+			)
+		if os.path.exists(ids_path):
+			with open(ids_path, "r", encoding="utf-8") as ids_file:
+				for line in ids_file:
+					video_id, _, status = line.rstrip("\n").rpartition("\t")
+					# A truncated line has no status
+					if status in (COMPLETED, FAILED):
+						self.statuses_by_video_id[video_id] = status
+		self._journal_file = _open_for_append(journal_path)
+		self._ids_file = _open_for_append(ids_path)
+
+	def append(self, video_id: str, completion: Any = None, error: str | None = None) -> None:
+		"""Journal the completion of the video, or the error of its request if it failed."""
+		entry = {"video_id": video_id}
+		if error is None:
+			entry["completion"] = completion
+		else:
+			entry["error"] = error
+		self._journal_file.write((json_utils.dumps(entry) + "\n").encode("utf-8"))
+		self._journal_file.flush()
+		status = COMPLETED if error is None else FAILED
+		self._ids_file.write(f"{video_id}\t{status}\n".encode("utf-8"))
+		self._ids_file.flush()
+		self.statuses_by_video_id[video_id] = status
+
+	def completions(self) -> dict[str, Any]:
+		"""The last completion of every journaled video, the error message of the failed ones."""
+		self._journal_file.flush()
+		completions = {}
+		with open(self.journal_path, "rb") as journal_file:
+			for line in journal_file:
+				try:
+					entry = json.loads(line)
+				except json.JSONDecodeError:
+					continue
+				if "video_id" in entry:
+					completions[entry["video_id"]] = entry.get("completion", entry.get("error"))
+		return completions
+
+	def close(self) -> None:
+		self._journal_file.close()
+		self._ids_file.close()
+
+
+class ExperimentRunner:
+	"""
+	Runs an experiment, every video with every model, checkpointing every completion in the
+	CompletionJournal of its model in the experiment folder. Running again an experiment that was
+	interrupted resumes it: the videos already completed by a model are skipped, the failed ones
+	are run again unless retry_failed is False. The models run concurrently.
+
+	The settings of the experiment are written to the experiment folder when it is created, resume
+	reads them back. A runner created with other settings than the ones of the journals of the
+	experiment raises a ValueError (see CompletionJournal). to_experiment builds the Experiment
+	from the journals. The transcripts of the subtitles are cached in the folder shared by the
+	experiments (see use_transcript_cache).
+	"""
+
+	def __init__(
+		self,
+		folder: str,
+		*,
+		attributes_settings: dict[str, Any],
+		attributes: list[str],
+		description: str | None,
+		id: str,
+		image_filename_format: str | None,
+		models: list[str],
+		start_time: datetime | None = None,
+		system_prompt: str,
+	) -> None:
+		"""
+		:param folder: The folder holding the folder of every experiment.
+		:param start_time: The start of the experiment, now if None.
+		The other parameters are the fields of the Experiment.
+		"""
+		self.attributes_settings = attributes_settings
+		self.attributes = attributes
+		self.description = description
+		self.id = id
+		self.image_filename_format = image_filename_format
+		self.models = models
+		self.start_time = start_time or datetime.now(timezone.utc)
+		self.system_prompt = system_prompt
+		self.experiment_folder = os.path.join(folder, EXPERIMENT_FOLDER_FORMAT.format(id))
+		os.makedirs(self.experiment_folder, exist_ok=True)
+		use_transcript_cache(os.path.join(folder, TRANSCRIPT_CACHE_FILENAME))
+		settings_path = os.path.join(self.experiment_folder, SETTINGS_FILENAME)
+		if not os.path.exists(settings_path):
+			write_json_atomically(
+				self._settings() | {"start_time": self.start_time.isoformat()}, settings_path
+			)
+
+		self.journals_by_model = {}
+		for model in models:
+			journal_name = _journal_name(model)
+			self.journals_by_model[model] = CompletionJournal(
+				os.path.join(self.experiment_folder, JOURNAL_FILENAME_FORMAT.format(journal_name)),
+				os.path.join(
+					self.experiment_folder, JOURNAL_IDS_FILENAME_FORMAT.format(journal_name)
+				),
+				{
+					"attributes_settings": attributes_settings,
+					"attributes": attributes,
+					"image_filename_format": image_filename_format,
+					"model": model,
+					"system_prompt": system_prompt,
+				},
+			)
+
+	@classmethod
+	def resume(cls, folder: str, experiment_id: str) -> ExperimentRunner:
+		"""The runner of an experiment created before, with its settings."""
+		settings_path = os.path.join(
+			folder, EXPERIMENT_FOLDER_FORMAT.format(experiment_id), SETTINGS_FILENAME
+		)
+		with open(settings_path, "r") as settings_file:
+			settings = json.load(settings_file)
+		settings["start_time"] = datetime.fromisoformat(settings["start_time"])
+		return cls(folder, **settings)
+
+	def __enter__(self) -> ExperimentRunner:
+		return self
+
+	def __exit__(self, *exc_info) -> None:
+		self.close()
+
+	def is_pending(self, model: str, video_id: str, retry_failed: bool = True) -> bool:
+		status = self.journals_by_model[model].statuses_by_video_id.get(video_id)
+		return status is None or (retry_failed and status == FAILED)
+
+	def run(
+		self,
+		videos: Iterable[RenderableVideo],
+		complete: CompleteFunction,
+		images_folder: str | None = None,
+		max_in_flight_per_model: int = DEFAULT_MAX_IN_FLIGHT_PER_MODEL,
+		retry_failed: bool = True,
+		prompt_store: RenderedPromptStore | None = None,
+		image_cache: PreparedImageCache | None = None,
+		cache: CompletionCache | None = None,
+		complete_options: dict[str, Any] | None = None,
+	) -> None:
+		"""
+		Complete the pending videos with a blocking function (e.g. calling a huggingface
+		InferenceClient), called by max_in_flight_per_model threads per model. An exception raised
+		by complete is journaled as the error of the video.
+
+		:param videos: The videos of the experiment, they can be streamed (e.g. a VideoDataset).
+		:param images_folder: The folder of the images named after image_filename_format.
+		:param prompt_store: The rendered prompts of the experiment attributes, rendered here if
+		None.
+		:param image_cache: The images prepared for every model, sent instead of the full quality
+		images if not None.
+		:param cache: The completions already known, complete is only called for the others and
+		their completions are stored in it. The errors are not stored.
+		:param complete_options: The generation options of complete (e.g. the temperature), part of
+		the cache key: complete itself is not.
+		"""
+		if cache is not None:
+			complete = partial(_cached_complete, complete, cache, complete_options)
+		max_in_flight = max_in_flight_per_model * len(self.models)
+		with ThreadPoolExecutor(max_in_flight) as executor:
+			in_flight: dict[Future, tuple[str, str]] = {}
+			for model, video in self._pending(videos, retry_failed):
+				if len(in_flight) >= max_in_flight:
+					self._journal_done(in_flight)
+				future = executor.submit(
+					complete,
+					model,
+					self.system_prompt,
+					self._user_prompt(video, prompt_store),
+					self._images_paths(video.id, images_folder, model, image_cache),
+				)
+				in_flight[future] = (model, video.id)
+			while in_flight:
+				self._journal_done(in_flight)
+
+	def run_ollama(
+		self,
+		videos: Iterable[RenderableVideo],
+		engine: OllamaInferenceEngine | OllamaModelScheduler,
+		images_folder: str | None = None,
+		retry_failed: bool = True,
+		prompt_store: RenderedPromptStore | None = None,
+		image_cache: PreparedImageCache | None = None,
+	) -> None:
+		"""
+		Complete the pending videos with an OllamaInferenceEngine, the requests of all the models
+		share the max_in_flight of the engine. With an OllamaModelScheduler the models run one
+		after the other instead of together, so that the server does not swap them.
+		"""
+		requests = (
+			InferenceRequest(
+				video_id=video.id,
+				model_name=model,
+				system_prompt=self.system_prompt,
+				user_prompt=self._user_prompt(video, prompt_store),
+				images_paths=self._images_paths(video.id, images_folder, model, image_cache),
+			)
+			for model, video in self._pending(videos, retry_failed)
+		)
+		for result in engine.iter_results(requests):
+			self.journals_by_model[result.model_name].append(
+				result.video_id, result.response, result.error
+			)
+
+	def to_experiment(self, end_time: datetime | None = None) -> Experiment:
+		"""The Experiment of the journaled completions, ended at end_time (now if None)."""
+		return Experiment.from_completions(
+			completions_by_model={
+				model: journal.completions() for model, journal in self.journals_by_model.items()
+			},
+			end_time=end_time or datetime.now(timezone.utc),
+			**self._settings(),
+		)
+
+	def close(self) -> None:
+		for journal in self.journals_by_model.values():
+			journal.close()
+
+	def _settings(self) -> dict[str, Any]:
+		return {
+			"attributes_settings": self.attributes_settings,
+			"attributes": self.attributes,
+			"description": self.description,
+			"id": self.id,
+			"image_filename_format": self.image_filename_format,
+			"models": self.models,
+			"start_time": self.start_time,
+			"system_prompt": self.system_prompt,
+		}
+
+	def _pending(
+		self, videos: Iterable[RenderableVideo], retry_failed: bool
+	) -> Iterator[tuple[str, RenderableVideo]]:
+		# Video by video, so that the models progress together
+		for video in videos:
+			for model in self.models:
+				if self.is_pending(model, video.id, retry_failed):
+					yield model, video
+
+	def _user_prompt(self, video: RenderableVideo, prompt_store: RenderedPromptStore | None) -> str:
+		if prompt_store is not None:
+			return prompt_store.get(video)
+		return video.to_string_for_model_input(self.attributes, **self.attributes_settings)
+
+	def _images_paths(
+		self,
+		video_id: str,
+		images_folder: str | None,
+		model: str,
+		image_cache: PreparedImageCache | None,
+	) -> list[str]:
+		if images_folder is None or self.image_filename_format is None:
+			return []
+		image_path = os.path.join(images_folder, self.image_filename_format.format(video_id))
+		if image_cache is not None:
+			return [image_cache.prepared_path(image_path, model)]
+		return [image_path]
+
+	def _journal_done(self, in_flight: dict[Future, tuple[str, str]]) -> None:
+		done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+		for future in done:
+			model, video_id = in_flight.pop(future)
+			try:
+				self.journals_by_model[model].append(video_id, future.result())
+			except Exception as exception:
+				self.journals_by_model[model].append(video_id, error=str(exception))
+
+
+def _cached_complete(
+	complete: CompleteFunction,
+	cache: CompletionCache,
+	options: dict[str, Any] | None,
+	model: str,
+	system_prompt: str,
+	user_prompt: str,
+	images_paths: list[str],
+) -> Any:
+	# The key of the content of the images, as OllamaInferenceEngine does
+	key = completion_key(model, system_prompt, user_prompt, read_images(images_paths), options)
+	return cache.get_or_generate(
+		key, lambda: complete(model, system_prompt, user_prompt, images_paths)
+	)
+
+
+def _journal_name(model: str) -> str:
+	# Model names hold slashes (e.g. mistralai/Mistral-7B-Instruct-v0.2), the hash avoids clashes
+	readable_name = re.sub(r"[^\w.-]", "_", model)
+	return f"{readable_name}-{hashlib.sha1(model.encode('utf-8')).hexdigest()[:8]}"
+
+
+def _read_header(journal_path: str) -> dict[str, Any] | None:
+	if not os.path.exists(journal_path):
+		return None
+	with open(journal_path, "rb") as journal_file:
+		first_line = journal_file.readline()
+	try:
+		entry = json.loads(first_line)
+	except json.JSONDecodeError:
+		if first_line.endswith(b"\n"):
+			raise
+		# Empty, or truncated while the header was written
+		return None
+	if "header" not in entry:
+		raise ValueError(f"{journal_path} has no settings header")
+	return entry["header"]
+
+
+def _open_for_append(file_path: str):
+	append_file = open(file_path, "ab")
+	if append_file.tell() > 0:
+		with open(file_path, "rb") as read_file:
+			read_file.seek(-1, os.SEEK_END)
+			if read_file.read(1) != b"\n":
+				# Do not append the next entry to the truncated line
+				append_file.write(b"\n")
+	return append_file
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import Any
+
+import ollama
+
+from project.llm_models.inference import OllamaModel
+
+# The prompts ask for 1 (conspiracy) or 0, a single token: the second token only lets a model
+# answering with a leading backtick, space or newline reach the label
+MAX_LABEL_TOKENS = 2
+# Decoding stops at the end of the label, before the justification some models add anyway.
+# Whitespace is not a stop sequence: a model answering " 1" or "\n1" would stop before the label
+LABEL_STOP_SEQUENCES = ["."]
+# The ollama options of a classification, e.g. OllamaInferenceEngine(options=...)
+CLASSIFICATION_OPTIONS = {
+	"num_predict": MAX_LABEL_TOKENS,
+	"stop": LABEL_STOP_SEQUENCES,
+	"temperature": 0.0,
+}
+# The arguments of a classification with the huggingface InferenceClient, e.g.
+# hf.chat.completions.create(model=model, messages=messages, **CHAT_CLASSIFICATION_KWARGS)
+CHAT_CLASSIFICATION_KWARGS = {
+	"max_tokens": MAX_LABEL_TOKENS,
+	"stop": LABEL_STOP_SEQUENCES,
+	"temperature": 0.0,
+	"logprobs": True,
+	"top_logprobs": 5,
+}
+# Wrapping the label in backticks, as in the prompt, is not a format error
+_LABEL_STRIPPED_CHARACTERS = " \t\r\n`"
+
+
+@dataclass(frozen=True, slots=True)
+class Classification:
+	"""
+	The label parsed from a completion, None if the output is not exactly 0 or 1, and the
+	probability of the conspiracy label (1) from the logprobs of the label token, None if the
+	completion has no logprobs.
+	"""
+
+	label: int | None
+	probability: float | None
+	output: str
+
+
+def generate_classification(
+	model_name: OllamaModel,
+	system_prompt: str,
+	user_prompt: str,
+	images_paths: list[str] | None = None,
+) -> Classification:
+	"""generate, decoding the label only."""
+	response = ollama.generate(
+		model=model_name,
+		system=system_prompt,
+		prompt=user_prompt,
+		images=images_paths,
+		options=CLASSIFICATION_OPTIONS,
+	)
+	return classify(response)
+
+
+def classify(completion: Any) -> Classification:
+	"""
+	The Classification of a completion of any of the formats of completion_content, e.g. a
+	completion journaled by an ExperimentRunner, so that the probabilities of an experiment can be
+	computed again without running it again.
+	"""
+	output = completion_content(completion)
+	label = parse_label(output)
+	return Classification(label=label, probability=label_probability(completion), output=output)
+
+
+def parse_label(output: str) -> int | None:
+	stripped_output = output.strip(_LABEL_STRIPPED_CHARACTERS)
+	if stripped_output in ("0", "1"):
+		return int(stripped_output)
+	return None
+
+
+def label_probability(completion: Any) -> float | None:
+	"""
+	The probability of the label 1 given the label token: the probabilities of the top logprobs
+	alternatives of the first token that is not whitespace or a backtick, summed by label and
+	normalized over 0 and 1. Without alternatives, the probability of the generated token (or its
+	complement if it is 0). None if the completion has no logprobs or the token is not a label.
+	"""
+	for token in _tokens_logprobs(completion) or ():
+		token_text = _get(token, "token")
+		if not token_text.strip(_LABEL_STRIPPED_CHARACTERS):
+			continue
+		label = parse_label(token_text)
+		if label is None:
+			return None
+		alternatives = _get(token, "top_logprobs") or []
+		probabilities = [0.0, 0.0]
+		for alternative in alternatives:
+			alternative_label = parse_label(_get(alternative, "token"))
+			if alternative_label is not None:
+				probabilities[alternative_label] += math.exp(_get(alternative, "logprob"))
+		if sum(probabilities) > 0.0:
+			return probabilities[1] / sum(probabilities)
+		probability = math.exp(_get(token, "logprob"))
+		return probability if label == 1 else 1.0 - probability
+	return None
+
+
+def completion_content(completion: Any) -> str:
+	"""
+	The text generated by the model: completion is a huggingface chat completion, its json (e.g.
+	loaded from an experiment file) or an ollama generate response. The error message of a failed
+	completion stored as a string is raised.
+	"""
+	if isinstance(completion, str):
+		raise ValueError(completion)
+	if isinstance(completion, dict):
+		if "response" in completion:
+			return completion["response"]
+		return completion["choices"][0]["message"]["content"]
+	return completion.choices[0].message.content
+
+
+def _tokens_logprobs(completion: Any) -> list[Any] | None:
+	# The logprobs of an ollama response are a list of tokens, the ones of a chat completion are
+	# in the content of the logprobs of its first choice
+	if isinstance(completion, dict) and "response" in completion:
+		return completion.get("logprobs")
+	logprobs = _get(_get(completion, "choices")[0], "logprobs")
+	return _get(logprobs, "content") if logprobs is not None else None
+
+
+def _get(value: Any, name: str) -> Any:
+	# The completions are json or huggingface dataclasses
+	if isinstance(value, dict):
+		return value.get(name)
+	return getattr(value, name, None)
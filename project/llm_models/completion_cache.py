@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Callable, Sequence
+
+from project.utils import json_utils
+
+# Bumped when the key or the entries change, so that old entries are never returned
+KEY_VERSION = 1
+
+
+def completion_key(
+	model_name: str,
+	system_prompt: str,
+	user_prompt: str,
+	images: Sequence[bytes] = (),
+	options: dict[str, Any] | None = None,
+) -> str:
+	"""
+	The sha1 of everything the completion depends on: the model, the prompts, the content of the
+	images (not their paths, so that copies of a dataset share the completions) and the model
+	options (e.g. the temperature).
+	"""
+	# str() of an OllamaModel is "OllamaModel.LLAVA", its value is the name used by the server
+	model_name = getattr(model_name, "value", model_name)
+	key_hash = hashlib.sha1(
+		json.dumps(
+			[KEY_VERSION, model_name, system_prompt, user_prompt, options or {}],
+			sort_keys=True,
+		).encode("utf-8")
+	)
+	for image in images:
+		key_hash.update(hashlib.sha1(image).digest())
+	return key_hash.hexdigest()
+
+
+class CompletionCache:
+	"""
+	The completions of the models keyed by completion_key, persisted as an append-only JSON lines
+	file shared by all the experiments, resumes and notebooks using it: a prompt already sent to a
+	model with the same images and options is never sent again. Only the byte offset of every
+	completion is kept in memory, the completions are read back from the file on a hit.
+	A truncated last line (e.g. an interrupted run) is ignored.
+
+	hits and misses count the lookups of get and get_or_generate since the cache was opened.
+	"""
+
+	def __init__(self, file_path: str) -> None:
+		self.file_path = file_path
+		self.hits = 0
+		self.misses = 0
+		self._offsets_by_key: dict[str, int] = {}
+		self._lock = threading.Lock()
+		byte_offset = 0
+		line = b"\n"
+		if os.path.exists(file_path):
+			with open(file_path, "rb") as cache_file:
+				for line in cache_file:
+					try:
+						key = json.loads(line)["key"]
+					except json.JSONDecodeError:
+						byte_offset += len(line)
+						continue
+					self._offsets_by_key[key] = byte_offset
+					byte_offset += len(line)
+		self._file = open(file_path, "ab")
+		if not line.endswith(b"\n"):
+			# Do not append the next completion to the truncated line
+			self._file.write(b"\n")
+		self._file_size = self._file.tell()
+
+	def __enter__(self) -> CompletionCache:
+		return self
+
+	def __exit__(self, *exc_info) -> None:
+		self.close()
+
+	def __len__(self) -> int:
+		return len(self._offsets_by_key)
+
+	def __contains__(self, key: str) -> bool:
+		return key in self._offsets_by_key
+
+	def get(self, key: str) -> Any | None:
+		"""The completion stored for the key as json, None if the key was never stored."""
+		with self._lock:
+			byte_offset = self._offsets_by_key.get(key)
+			if byte_offset is None:
+				self.misses += 1
+				return None
+			self.hits += 1
+			self._file.flush()
+			with open(self.file_path, "rb") as cache_file:
+				cache_file.seek(byte_offset)
+				return json.loads(cache_file.readline())["completion"]
+
+	def put(self, key: str, completion: Any) -> None:
+		"""Store the completion, it can be any value json_utils can serialize (e.g. a dataclass)."""
+		line = (json_utils.dumps({"key": key, "completion": completion}) + "\n").encode("utf-8")
+		with self._lock:
+			self._file.write(line)
+			self._file.flush()
+			self._offsets_by_key[key] = self._file_size
+			self._file_size += len(line)
+
+	def get_or_generate(self, key: str, generate: Callable[[], Any]) -> Any:
+		"""
+		The stored completion of the key, or the completion returned by generate, stored. A stored
+		completion is returned as json, as get does, e.g. a dict instead of a dataclass.
+		"""
+		completion = self.get(key)
+		if completion is None:
+			completion = generate()
+			self.put(key, completion)
+		return completion
+
+	def stats(self) -> dict[str, Any]:
+		lookups = self.hits + self.misses
+		return {
+			"completions": len(self),
+			"hits": self.hits,
+			"misses": self.misses,
+			"hit_rate": self.hits / lookups if lookups else 0.0,
+		}
+
+	def close(self) -> None:
+		self._file.close()
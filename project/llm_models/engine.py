@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import asyncio
+import queue
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator
+
+import httpx
+import ollama
+
+from project.llm_models.completion_cache import CompletionCache, completion_key
+from project.llm_models.inference import OllamaModel
+
+DEFAULT_MAX_IN_FLIGHT = 4
+DEFAULT_TIMEOUT_S = 300.0
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_S = 1.0
+DEFAULT_MAX_BACKOFF_S = 60.0
+
+
+@dataclass(frozen=True, slots=True)
+class InferenceRequest:
+	video_id: str
+	model_name: OllamaModel | str
+	system_prompt: str
+	user_prompt: str
+	images_paths: list[str] | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class InferenceResult:
+	"""The ollama response of a request, or the error of its last attempt."""
+
+	video_id: str
+	model_name: OllamaModel | str
+	response: dict[str, Any] | None
+	error: str | None
+	attempts: int
+	duration_s: float
+	from_cache: bool = False
+
+
+class OllamaInferenceEngine:
+	"""
+	Runs generate requests concurrently against an Ollama server, keeping up to max_in_flight
+	requests in flight so that all the parallel slots of the server (OLLAMA_NUM_PARALLEL) are busy.
+
+	Timed out requests, connection errors and 429/5xx responses are retried with an exponential
+	backoff, the other errors (e.g. an unknown model) are returned right away. A failed request
+	does not stop the others: its InferenceResult holds the error instead of the response.
+
+	With a CompletionCache the requests already answered, by this engine or by another run using
+	the same cache file, are answered from the cache without being sent, and the new responses are
+	stored in it.
+	"""
+
+	def __init__(
+		self,
+		host: str | None = None,
+		max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+		timeout_s: float = DEFAULT_TIMEOUT_S,
+		max_retries: int = DEFAULT_MAX_RETRIES,
+		backoff_s: float = DEFAULT_BACKOFF_S,
+		max_backoff_s: float = DEFAULT_MAX_BACKOFF_S,
+		options: dict[str, Any] | None = None,
+		keep_alive: float | str | None = None,
+		cache: CompletionCache | None = None,
+	) -> None:
+		"""
+		:param host: The ollama server, OLLAMA_HOST or the local server if None.
+		:param max_in_flight: Maximum number of requests sent and not answered yet.
+		:param timeout_s: Maximum duration of one attempt of a request.
+		:param max_retries: Number of retries of a request after its first attempt.
+		:param backoff_s: Delay before the first retry, doubled at every retry.
+		:param max_backoff_s: Maximum delay between two attempts.
+		:param options: The ollama model options (e.g. temperature, num_predict) of every request.
+		:param keep_alive: How long the server keeps the model loaded after the requests.
+		:param cache: The completions already known, where the new ones are stored.
+		"""
+		self.host = host
+		self.max_in_flight = max_in_flight
+		self.timeout_s = timeout_s
+		self.max_retries = max_retries
+		self.backoff_s = backoff_s
+		self.max_backoff_s = max_backoff_s
+		self.options = options
+		self.keep_alive = keep_alive
+		self.cache = cache
+
+	async def generate_all(
+		self, requests: Iterable[InferenceRequest]
+	) -> AsyncIterator[InferenceResult]:
+		"""
+		Yield the result of every request as soon as it completes, in completion order. The
+		requests are taken from the iterable only when a slot is free, so they can be streamed.
+		"""
+		requests = iter(requests)
+		client = self.client()
+		in_flight = set()
+		try:
+			while True:
+				while len(in_flight) < self.max_in_flight:
+					request = next(requests, None)
+					if request is None:
+						break
+					in_flight.add(asyncio.create_task(self.generate(client, request)))
+				if not in_flight:
+					break
+				done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+				for task in done:
+					yield task.result()
+		finally:
+			for task in in_flight:
+				task.cancel()
+			await asyncio.gather(*in_flight, return_exceptions=True)
+			await close_client(client)
+
+	def iter_results(self, requests: Iterable[InferenceRequest]) -> Iterator[InferenceResult]:
+		"""
+		generate_all for synchronous code, e.g. a script or a notebook cell. The event loop runs in
+		a thread, the requests left are cancelled if the iteration is stopped.
+		"""
+		return iterate_in_thread(lambda: self.generate_all(requests))
+
+	def client(self) -> ollama.AsyncClient:
+		"""An async client of the server sized for max_in_flight, closed with close_client."""
+		return ollama.AsyncClient(
+			self.host,
+			timeout=self.timeout_s,
+			limits=httpx.Limits(max_connections=self.max_in_flight),
+		)
+
+	async def generate(
+		self,
+		client: ollama.AsyncClient,
+		request: InferenceRequest,
+		keep_alive: float | str | None = None,
+	) -> InferenceResult:
+		"""
+		Send the request, with the retries, and return its result. keep_alive overrides the
+		keep_alive of the engine.
+		"""
+		start = time.perf_counter()
+		attempts = 0
+		error = None
+		try:
+			images = None
+			if request.images_paths:
+				images = await asyncio.to_thread(read_images, request.images_paths)
+			key = None
+			if self.cache is not None:
+				key = completion_key(
+					request.model_name,
+					request.system_prompt,
+					request.user_prompt,
+					images or (),
+					self.options,
+				)
+				response = self.cache.get(key)
+				if response is not None:
+					return InferenceResult(
+						video_id=request.video_id,
+						model_name=request.model_name,
+						response=response,
+						error=None,
+						attempts=0,
+						duration_s=time.perf_counter() - start,
+						from_cache=True,
+					)
+			while True:
+				attempts += 1
+				try:
+					response = await asyncio.wait_for(
+						client.generate(
+							model=request.model_name,
+							system=request.system_prompt,
+							prompt=request.user_prompt,
+							images=images,
+							options=self.options,
+							keep_alive=self.keep_alive if keep_alive is None else keep_alive,
+						),
+						self.timeout_s,
+					)
+					if self.cache is not None:
+						self.cache.put(key, response)
+					return InferenceResult(
+						video_id=request.video_id,
+						model_name=request.model_name,
+						response=response,
+						error=None,
+						attempts=attempts,
+						duration_s=time.perf_counter() - start,
+					)
+				except Exception as exception:
+					if attempts > self.max_retries or not is_retryable(exception):
+						raise
+				await asyncio.sleep(self.backoff_delay_s(attempts))
+		except Exception as exception:
+			error = f"{type(exception).__name__}: {exception}"
+		return InferenceResult(
+			video_id=request.video_id,
+			model_name=request.model_name,
+			response=None,
+			error=error,
+			attempts=attempts,
+			duration_s=time.perf_counter() - start,
+		)
+
+	def backoff_delay_s(self, attempts: int) -> float:
+		"""Exponential backoff with jitter, the retries of a burst of failures are spread."""
+		delay_s = min(self.max_backoff_s, self.backoff_s * 2 ** (attempts - 1))
+		return delay_s * random.uniform(0.5, 1.0)
+
+
+def iterate_in_thread(
+	results_iterator: Callable[[], AsyncIterator[InferenceResult]],
+) -> Iterator[InferenceResult]:
+	"""
+	Iterate an async iterator of results from synchronous code. The event loop runs in a thread,
+	the async iterator is closed (cancelling the requests left) if the iteration is stopped.
+	"""
+	results = queue.Queue()
+	stopped = threading.Event()
+
+	async def run() -> None:
+		iterator = results_iterator()
+		try:
+			async for result in iterator:
+				results.put(result)
+				if stopped.is_set():
+					break
+		finally:
+			await iterator.aclose()
+
+	def run_in_thread() -> None:
+		try:
+			asyncio.run(run())
+		except BaseException as exception:
+			results.put(exception)
+		results.put(None)
+
+	thread = threading.Thread(target=run_in_thread, daemon=True)
+	thread.start()
+	try:
+		while (result := results.get()) is not None:
+			if isinstance(result, BaseException):
+				raise result
+			yield result
+	finally:
+		stopped.set()
+
+
+async def close_client(client: ollama.AsyncClient) -> None:
+	# ollama.AsyncClient has no close method before ollama 0.4, its httpx client is closed instead
+	close = getattr(client, "close", None)
+	if close is not None:
+		await close()
+		return
+	httpx_client = getattr(client, "_client", None)
+	if isinstance(httpx_client, httpx.AsyncClient):
+		await httpx_client.aclose()
+
+
+def is_retryable(exception: Exception) -> bool:
+	# asyncio.wait_for raises asyncio.TimeoutError, not a TimeoutError before Python 3.11
+	if isinstance(exception, (asyncio.TimeoutError, TimeoutError, httpx.TransportError)):
+		return True
+	if isinstance(exception, ollama.ResponseError):
+		return exception.status_code == 429 or exception.status_code >= 500
+	return False
+
+
+def read_images(images_paths: list[str]) -> list[bytes]:
+	images = []
+	for image_path in images_paths:
+		with open(image_path, "rb") as image_file:
+			images.append(image_file.read())
+	return images
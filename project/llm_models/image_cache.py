@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any
+
+from PIL import Image
+
+from project.utils.dataset_utils import (
+	generate_images_path_from_video_id,
+	generate_thumbnail_path_from_video_id,
+)
+
+INDEX_FILENAME = "index.jsonl"
+IMAGE_FILENAME_FORMAT = "{}.jpg"
+BASE64_FILENAME_FORMAT = "{}.b64"
+
+
+@dataclass(frozen=True, slots=True)
+class ImageSpec:
+	"""The input resolution of a model (the longest side) and the JPEG quality of its images."""
+
+	max_size: int
+	quality: int = 85
+
+
+# The vision encoders downscale larger images anyway: mllama (llama 3.2 vision) works on 560px
+# tiles, llava on the 336px input of its CLIP encoder. An OllamaModel is equal to its name
+DEFAULT_IMAGE_SPEC = ImageSpec(max_size=672)
+IMAGE_SPECS_BY_MODEL = {
+	"llama3.2-vision": ImageSpec(max_size=560),
+	"llava": ImageSpec(max_size=336),
+	"meta-llama/Llama-3.2-11B-Vision-Instruct": ImageSpec(max_size=560),
+}
+
+
+class PreparedImageCache:
+	"""
+	The images of the dataset (thumbnails and frames) prepared once for every model: downscaled to
+	the input resolution of the model and re-encoded as JPEG at the quality of its ImageSpec, so
+	that the requests carry a fraction of the bytes of the full quality images and no request
+	encodes an image.
+
+	The prepared JPEG and its base64 (the payload of a chat completion) are files of the cache
+	folder named after the sha1 of the source image and the spec, so that copies of an image and
+	models with the same spec share them. The sha1 of every source image is indexed by path, size
+	and modification time in an append-only JSON lines file, so that an image already prepared is
+	not even read again by later runs, and a source changed since (another size or modification
+	time) is hashed and prepared again. The files are written to a temporary file renamed once
+	complete, so that an interrupted run leaves no half-written image to be taken for a prepared
+	one. A prepared image is never larger than its source: a source already small enough is kept
+	as it is if re-encoding it would make it larger.
+
+	prepared counts the images prepared since the cache was opened, hits the ones found prepared.
+	"""
+
+	def __init__(
+		self, folder: str, image_specs_by_model: dict[str, ImageSpec] | None = None
+	) -> None:
+		"""
+		:param folder: The folder of the prepared images, created if missing.
+		:param image_specs_by_model: The ImageSpec of every model, IMAGE_SPECS_BY_MODEL if None,
+		DEFAULT_IMAGE_SPEC for the models missing.
+		"""
+		self.folder = folder
+		self.image_specs_by_model = (
+			IMAGE_SPECS_BY_MODEL if image_specs_by_model is None else image_specs_by_model
+		)
+		self.prepared = 0
+		self.hits = 0
+		self._lock = threading.Lock()
+		self._hashes_by_source: dict[tuple[str, int, int], str] = {}
+		os.makedirs(folder, exist_ok=True)
+		index_path = os.path.join(folder, INDEX_FILENAME)
+		line = b"\n"
+		if os.path.exists(index_path):
+			with open(index_path, "rb") as index_file:
+				for line in index_file:
+					try:
+						entry = json.loads(line)
+					except json.JSONDecodeError:
+						continue
+					source = (entry["path"], entry["size"], entry["mtime_ns"])
+					self._hashes_by_source[source] = entry["sha1"]
+		self._index_file = open(index_path, "ab")
+		if not line.endswith(b"\n"):
+			# Do not append the next entry to the truncated line
+			self._index_file.write(b"\n")
+
+	def __enter__(self) -> PreparedImageCache:
+		return self
+
+	def __exit__(self, *exc_info) -> None:
+		self.close()
+
+	def image_spec(self, model_name: str) -> ImageSpec:
+		return self.image_specs_by_model.get(model_name, DEFAULT_IMAGE_SPEC)
+
+	def prepared_path(self, image_path: str, model_name: str) -> str:
+		"""The path of the image prepared for the model, e.g. the images of an ollama request."""
+		key = self._prepare(image_path, model_name)
+		return os.path.join(self._key_folder(key), IMAGE_FILENAME_FORMAT.format(key))
+
+	def prepared_bytes(self, image_path: str, model_name: str) -> bytes:
+		with open(self.prepared_path(image_path, model_name), "rb") as image_file:
+			return image_file.read()
+
+	def base64(self, image_path: str, model_name: str) -> str:
+		key = self._prepare(image_path, model_name)
+		base64_path = os.path.join(self._key_folder(key), BASE64_FILENAME_FORMAT.format(key))
+		with open(base64_path, "r", encoding="ascii") as base64_file:
+			return base64_file.read()
+
+	def chat_image(self, image_path: str, model_name: str) -> dict[str, Any]:
+		"""The image prepared for the model as content of a chat completion message."""
+		return {
+			"type": "image_url",
+			"image_url": {
+				"url": f"data:image/jpeg;base64,{self.base64(image_path, model_name)}",
+			},
+		}
+
+	def video_images_paths(
+		self, video_id: str, dataset_path: str, model_name: str, thumbnail_only: bool = False
+	) -> list[str]:
+		"""The prepared images of a video of the dataset, its thumbnail and frames."""
+		if thumbnail_only:
+			images_paths = generate_thumbnail_path_from_video_id(video_id, dataset_path)
+		else:
+			images_paths = sorted(generate_images_path_from_video_id(video_id, dataset_path))
+		return [self.prepared_path(image_path, model_name) for image_path in images_paths]
+
+	def close(self) -> None:
+		self._index_file.close()
+
+	def _prepare(self, image_path: str, model_name: str) -> str:
+		spec = self.image_spec(model_name)
+		source_hash, source = self._source_hash(image_path)
+		key = f"{source_hash}-{spec.max_size}-q{spec.quality}"
+		key_folder = self._key_folder(key)
+		image_path_prepared = os.path.join(key_folder, IMAGE_FILENAME_FORMAT.format(key))
+		base64_path = os.path.join(key_folder, BASE64_FILENAME_FORMAT.format(key))
+		if _is_prepared(image_path_prepared, base64_path):
+			with self._lock:
+				self.hits += 1
+			return key
+		if source is None:
+			with open(image_path, "rb") as image_file:
+				source = image_file.read()
+		prepared = prepare_image(source, spec)
+		os.makedirs(key_folder, exist_ok=True)
+		_write_atomically(prepared, image_path_prepared)
+		_write_atomically(base64.b64encode(prepared), base64_path)
+		with self._lock:
+			self.prepared += 1
+		return key
+
+	def _source_hash(self, image_path: str) -> tuple[str, bytes | None]:
+		# The content of the source too when it is read to be hashed, so that it is read once
+		image_path = os.path.abspath(image_path)
+		stat = os.stat(image_path)
+		source = (image_path, stat.st_size, stat.st_mtime_ns)
+		source_hash = self._hashes_by_source.get(source)
+		if source_hash is not None:
+			return source_hash, None
+		with open(image_path, "rb") as image_file:
+			content = image_file.read()
+		source_hash = hashlib.sha1(content).hexdigest()
+		entry = {
+			"path": image_path,
+			"size": stat.st_size,
+			"mtime_ns": stat.st_mtime_ns,
+			"sha1": source_hash,
+		}
+		with self._lock:
+			self._index_file.write((json.dumps(entry) + "\n").encode("utf-8"))
+			self._index_file.flush()
+			self._hashes_by_source[source] = source_hash
+		return source_hash, content
+
+	def _key_folder(self, key: str) -> str:
+		# Two levels, so that no folder holds all the images of a dataset
+		return os.path.join(self.folder, key[:2])
+
+
+def prepare_image(source: bytes, spec: ImageSpec) -> bytes:
+	"""The image downscaled to fit spec.max_size (never upscaled), as JPEG of spec.quality."""
+	with Image.open(io.BytesIO(source)) as image:
+		source_format = image.format
+		fits = max(image.size) <= spec.max_size
+		# A JPEG is decoded at the smallest 1/2, 1/4 or 1/8 scale still larger than the target
+		image.draft("RGB", (spec.max_size, spec.max_size))
+		image = image.convert("RGB")
+		image.thumbnail((spec.max_size, spec.max_size), Image.Resampling.LANCZOS)
+		output = io.BytesIO()
+		image.save(output, "JPEG", quality=spec.quality)
+	prepared = output.getvalue()
+	if fits and source_format == "JPEG" and len(source) <= len(prepared):
+		return source
+	return prepared
+
+
+def _is_prepared(image_path: str, base64_path: str) -> bool:
+	# Both files are written to a temporary file renamed once complete, the base64 last. The size
+	# of the base64 must also be the one of the image, e.g. not a leftover of a deleted image
+	try:
+		image_size = os.path.getsize(image_path)
+		base64_size = os.path.getsize(base64_path)
+	except FileNotFoundError:
+		return False
+	return base64_size == 4 * -(-image_size // 3)
+
+
+def _write_atomically(content: bytes, file_path: str) -> None:
+	# Another process preparing the same image writes the same content
+	tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+	with open(tmp_path, "wb") as tmp_file:
+		tmp_file.write(content)
+	os.replace(tmp_path, file_path)
@@ -1,7 +1,11 @@
+from __future__ import annotations
+
 from enum import Enum
 
 import ollama
 
+from project.llm_models.image_cache import PreparedImageCache
+
 
 class OllamaModel(str, Enum):
 	LLAMA_3_2 = "llama3.2"
@@ -18,9 +22,15 @@ def generate(model_name: OllamaModel, system_prompt: str, user_prompt: str) -> d
 
 
 def generate_multimodal(
-	model_name: OllamaModel, system_prompt: str, user_prompt: str, images_paths: list[str]
+	model_name: OllamaModel,
+	system_prompt: str,
+	user_prompt: str,
+	images_paths: list[str],
+	image_cache: PreparedImageCache | None = None,
 ) -> dict[str, str]:
-	response = ollama.generate(
+	if image_cache is not None:
+		images_paths = [image_cache.prepared_path(p, model_name) for p in images_paths]
+	return ollama.generate(
 		model=model_name,
 		prompt=user_prompt,
 		system=system_prompt,
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Callable
+
+from project.models import YouTubeVideoInfo
+from project.utils.subtitles_utils import cached_text_from_subtitles
+
+# The truncatable attributes, from the first to get tokens
+DEFAULT_PRIORITIES = ("description", "subtitles", "comments")
+DEFAULT_MAX_CACHED_COUNTS = 100_000
+PARTS_SEPARATOR = "\n\n"
+
+# The to_string_for_model_input setting limiting each truncatable attribute, the subtitles limit
+# applies to both subtitles
+_SETTING_BY_PRIORITY = {
+	"description": "max_description_length",
+	"subtitles": "max_subtitles_length",
+	"comments": "max_comments",
+}
+# The settings of to_string_for_model_input changing the part of each attribute
+_SETTINGS_BY_ATTRIBUTE = {
+	"description": ("max_description_length",),
+	"subtitles": ("max_subtitles_length",),
+	"auto_subtitles": ("max_subtitles_length",),
+	"comments": ("max_comments", "include_comments_replies"),
+}
+_ATTRIBUTES_BY_PRIORITY = {
+	"description": ("description",),
+	"subtitles": ("subtitles", "auto_subtitles"),
+	"comments": ("comments",),
+}
+
+
+class TokenBudgetPromptBuilder:
+	"""
+	Builds the largest to_string_for_model_input prompt of a video that fits in a token budget,
+	instead of hand tuned max_subtitles_length and max_comments that either waste the context of
+	the model or exceed it.
+
+	The truncatable attributes get the tokens by priority: every attribute is first reduced to its
+	minimum, then the first attribute of priorities gets all the tokens it needs or the largest
+	length that fits (found by binary search), then the next one the tokens left, and so on. The
+	prompt is the "\\n\\n" join of one part per attribute, so only the part being truncated is
+	rendered and tokenized while searching, the token counts are cached by video id, attribute and
+	settings. The final prompt is tokenized whole, and allocated again with a smaller budget in the
+	rare case the tokens merged across the parts make it exceed the budget: the prompt returned
+	always fits.
+	"""
+
+	def __init__(
+		self,
+		count_tokens: Callable[[str], int],
+		attributes: list[str],
+		attributes_settings: dict[str, Any] | None = None,
+		priorities: tuple[str, ...] = DEFAULT_PRIORITIES,
+		max_cached_counts: int = DEFAULT_MAX_CACHED_COUNTS,
+	) -> None:
+		"""
+		:param count_tokens: Number of tokens of a text for the model, e.g.
+		lambda text: len(tokenizer.encode(text, add_special_tokens=False)).
+		:param attributes: The attributes_to_include of to_string_for_model_input.
+		:param attributes_settings: The other settings of to_string_for_model_input, the limits of
+		the truncatable attributes are chosen by the builder.
+		:param priorities: The truncatable attributes among description, subtitles (both
+		subtitles) and comments, from the most important.
+		:param max_cached_counts: Maximum number of token counts kept in memory.
+		"""
+		unknown_priorities = set(priorities) - set(_SETTING_BY_PRIORITY)
+		if unknown_priorities:
+			raise ValueError(f"Unknown priorities {unknown_priorities}")
+		self.count_tokens = count_tokens
+		self.attributes = list(attributes)
+		self.attributes_settings = dict(attributes_settings or {})
+		self.priorities = [
+			priority
+			for priority in priorities
+			if any(a in self.attributes for a in _ATTRIBUTES_BY_PRIORITY[priority])
+		]
+		self.max_cached_counts = max_cached_counts
+		self.cache_hits = 0
+		self.cache_misses = 0
+		self._counts: OrderedDict[tuple, int] = OrderedDict()
+		self._separator_tokens = count_tokens(PARTS_SEPARATOR)
+
+	def build(self, video: YouTubeVideoInfo, max_tokens: int) -> str:
+		"""
+		The largest prompt of the video within max_tokens, raises ValueError if even the
+		attributes that cannot be truncated do not fit.
+		"""
+		return self.build_with_settings(video, max_tokens)[0]
+
+	def build_with_settings(
+		self, video: YouTubeVideoInfo, max_tokens: int
+	) -> tuple[str, dict[str, Any]]:
+		"""build, together with the to_string_for_model_input settings of the prompt."""
+		budget = max_tokens
+		while True:
+			settings = self._allocate(video, budget)
+			prompt = video.to_string_for_model_input(self.attributes, **settings)
+			prompt_tokens = self._count((video.id, None, *sorted(settings.items())), lambda: prompt)
+			if prompt_tokens <= max_tokens:
+				return prompt, settings
+			# The parts tokenized together take more tokens than apart
+			budget -= prompt_tokens - max_tokens
+
+	def _allocate(self, video: YouTubeVideoInfo, budget: int) -> dict[str, Any]:
+		settings = dict(self.attributes_settings)
+		lengths = {}
+		for priority in self.priorities:
+			lengths[priority] = self._full_length(video, priority)
+			settings[_SETTING_BY_PRIORITY[priority]] = self._min_length(priority)
+		if self._prompt_tokens(video, settings) > budget:
+			raise ValueError(
+				f"The prompt of {video.id} takes more than {budget} tokens with every attribute "
+				f"truncated"
+			)
+		for priority in self.priorities:
+			setting = _SETTING_BY_PRIORITY[priority]
+			low, high = settings[setting], lengths[priority]
+			if self._prompt_tokens(video, settings | {setting: high}) <= budget:
+				settings[setting] = high
+				continue
+			# Largest length that fits, low always fits and high never does
+			while high - low > 1:
+				middle = (low + high) // 2
+				if self._prompt_tokens(video, settings | {setting: middle}) <= budget:
+					low = middle
+				else:
+					high = middle
+			settings[setting] = low
+		return settings
+
+	def _prompt_tokens(self, video: YouTubeVideoInfo, settings: dict[str, Any]) -> int:
+		parts_tokens = sum(
+			self._count(
+				(
+					video.id,
+					attribute,
+					*(settings.get(name) for name in _SETTINGS_BY_ATTRIBUTE.get(attribute, ())),
+				),
+				lambda: video.to_string_for_model_input([attribute], **settings),
+			)
+			for attribute in self.attributes
+		)
+		return parts_tokens + self._separator_tokens * (len(self.attributes) - 1)
+
+	def _count(self, key: tuple, render: Callable[[], str]) -> int:
+		count = self._counts.get(key)
+		if count is not None:
+			self.cache_hits += 1
+			self._counts.move_to_end(key)
+			return count
+		self.cache_misses += 1
+		count = self.count_tokens(render())
+		self._counts[key] = count
+		if len(self._counts) > self.max_cached_counts:
+			self._counts.popitem(last=False)
+		return count
+
+	def _full_length(self, video: YouTubeVideoInfo, priority: str) -> int:
+		if priority == "description":
+			return len(video.description or "")
+		if priority == "comments":
+			return len(video.comments or ())
+		subtitles_lengths = [
+			len(cached_text_from_subtitles(getattr(video, attribute)))
+			for attribute in _ATTRIBUTES_BY_PRIORITY[priority]
+			if attribute in self.attributes and getattr(video, attribute) is not None
+		]
+		return max(subtitles_lengths, default=self._min_length(priority))
+
+	@staticmethod
+	def _min_length(priority: str) -> int:
+		# A max_subtitles_length of 0 means no limit
+		return 1 if priority == "subtitles" else 0
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable, Iterator
+
+import ollama
+
+from project.llm_models.engine import (
+	InferenceRequest,
+	InferenceResult,
+	OllamaInferenceEngine,
+	close_client,
+	iterate_in_thread,
+)
+
+DEFAULT_KEEP_ALIVE = "30m"
+DEFAULT_MAX_RESIDENCY_S = 600.0
+DEFAULT_MAX_QUEUED = 10_000
+
+
+@dataclass(slots=True)
+class ModelResidencyStats:
+	"""
+	Where the time of a model went: load_s is spent switching to the model (unloading the previous
+	one and preloading it), inference_s answering its requests while it is resident.
+	"""
+
+	loads: int = 0
+	load_s: float = 0.0
+	inference_s: float = 0.0
+	requests: int = 0
+
+
+class OllamaModelScheduler:
+	"""
+	Runs the requests of several models with an OllamaInferenceEngine so that the server holds a
+	single model at a time, instead of swapping multi-GB weights in and out of memory whenever the
+	requests of the models interleave (e.g. the video by video requests of an ExperimentRunner).
+
+	The requests are queued by model (up to max_queued requests are read ahead from the iterable).
+	The scheduler preloads one model with keep_alive, sends only its requests, and switches to the
+	next model with queued requests (round robin) once the queue of the model is drained, or once
+	the model has been resident for max_residency_s while the other models wait. Switching waits
+	for the requests in flight, unloads the resident model (keep_alive 0) and preloads the next.
+
+	stats holds the load time of every model separately from its inference time.
+	"""
+
+	def __init__(
+		self,
+		engine: OllamaInferenceEngine,
+		keep_alive: float | str = DEFAULT_KEEP_ALIVE,
+		max_residency_s: float = DEFAULT_MAX_RESIDENCY_S,
+		max_queued: int = DEFAULT_MAX_QUEUED,
+	) -> None:
+		"""
+		:param engine: Sends the requests, with its max_in_flight, retries and cache.
+		:param keep_alive: How long the server keeps the resident model loaded, for the preload
+		and every request, long enough to never unload it between two requests.
+		:param max_residency_s: The fairness deadline, after which the resident model is switched
+		if another model has queued requests.
+		:param max_queued: Maximum number of requests read ahead from the iterable.
+		"""
+		self.engine = engine
+		self.keep_alive = keep_alive
+		self.max_residency_s = max_residency_s
+		self.max_queued = max_queued
+		self.stats: dict[str, ModelResidencyStats] = {}
+		self.resident_model: str | None = None
+
+	async def generate_all(
+		self, requests: Iterable[InferenceRequest]
+	) -> AsyncIterator[InferenceResult]:
+		"""Yield the result of every request as soon as it completes, model by model."""
+		requests = iter(requests)
+		queues: dict[str, deque[InferenceRequest]] = {}
+		queued = 0
+
+		def read_ahead() -> None:
+			nonlocal queued
+			while queued < self.max_queued:
+				request = next(requests, None)
+				if request is None:
+					break
+				# An OllamaModel is equal to its name, their requests share a queue
+				queues.setdefault(request.model_name, deque()).append(request)
+				queued += 1
+
+		client = self.engine.client()
+		in_flight = set()
+		try:
+			read_ahead()
+			while model := self._next_model(queues):
+				if model != self.resident_model:
+					await self._switch(client, model)
+				stats = self.stats[model]
+				deadline = time.perf_counter() + self.max_residency_s
+				start = time.perf_counter()
+				while True:
+					while (
+						queues[model]
+						and len(in_flight) < self.engine.max_in_flight
+						and not self._is_past_deadline(queues, model, deadline)
+					):
+						request = queues[model].popleft()
+						queued -= 1
+						in_flight.add(
+							asyncio.create_task(
+								self.engine.generate(client, request, keep_alive=self.keep_alive)
+							)
+						)
+					if not in_flight:
+						break
+					done, in_flight = await asyncio.wait(
+						in_flight, return_when=asyncio.FIRST_COMPLETED
+					)
+					for task in done:
+						stats.requests += 1
+						yield task.result()
+					read_ahead()
+				stats.inference_s += time.perf_counter() - start
+		finally:
+			for task in in_flight:
+				task.cancel()
+			await asyncio.gather(*in_flight, return_exceptions=True)
+			await close_client(client)
+
+	def iter_results(self, requests: Iterable[InferenceRequest]) -> Iterator[InferenceResult]:
+		"""generate_all for synchronous code, as OllamaInferenceEngine.iter_results."""
+		return iterate_in_thread(lambda: self.generate_all(requests))
+
+	def _next_model(self, queues: dict[str, deque[InferenceRequest]]) -> str | None:
+		# The models in the order of their first request, from the one after the resident model,
+		# which comes last: it only stays resident if no other model has queued requests
+		models = list(queues)
+		if self.resident_model in queues:
+			resident_index = models.index(self.resident_model)
+			models = models[resident_index + 1 :] + models[: resident_index + 1]
+		return next((model for model in models if queues[model]), None)
+
+	def _is_past_deadline(
+		self, queues: dict[str, deque[InferenceRequest]], model: str, deadline: float
+	) -> bool:
+		if time.perf_counter() < deadline:
+			return False
+		return any(queue for other_model, queue in queues.items() if other_model != model)
+
+	async def _switch(self, client: ollama.AsyncClient, model: str) -> None:
+		stats = self.stats.setdefault(model, ModelResidencyStats())
+		start = time.perf_counter()
+		if self.resident_model is not None:
+			# Free the memory now rather than when the keep_alive of the model expires
+			await self._generate_empty(client, self.resident_model, keep_alive=0)
+			self.resident_model = None
+		await self._generate_empty(client, model, keep_alive=self.keep_alive)
+		self.resident_model = model
+		stats.loads += 1
+		stats.load_s += time.perf_counter() - start
+
+	async def _generate_empty(
+		self, client: ollama.AsyncClient, model: str, keep_alive: float | str
+	) -> None:
+		# An empty prompt only loads (or with keep_alive 0 unloads) the model. A failure is not
+		# fatal: the requests of the model load it anyway or return the error (e.g. unknown model)
+		try:
+			await asyncio.wait_for(
+				client.generate(model=model, keep_alive=keep_alive), self.engine.timeout_s
+			)
+		except Exception as exception:
+			print(f"Could not {'unload' if keep_alive == 0 else 'load'} {model}: {exception}")
@@ -1,15 +1,32 @@
 from __future__ import annotations
 
-import json
+import operator
+import sys
+from collections.abc import Sequence
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Any
+from typing import Any, Iterator
 
-from project.utils.json_utils import EnhancedJSONEncoder
-from project.utils.subtitles_utils import text_from_subtitles
+import numpy as np
 
+from project.utils import json_utils
+from project.utils.subtitles_utils import cached_text_from_subtitles
 
-@dataclass(frozen=True)
+# Fields whose strings repeat across comments and videos (authors, channels, tags), the strings read
+# from json are interned so that every distinct value is stored once
+COMMENT_INTERNED_FIELDS = ("author_id", "author_name", "parent_id")
+VIDEO_INTERNED_FIELDS = ("categories", "channel_id", "channel_title", "tags")
+
+
+def _intern(value: Any) -> Any:
+	if isinstance(value, str):
+		return sys.intern(value)
+	if isinstance(value, list):
+		return [sys.intern(v) if isinstance(v, str) else v for v in value]
+	return value
+
+
+@dataclass(frozen=True, slots=True)
 class HeatmapItem:
 	end_s: float
 	intensity: float
@@ -28,7 +45,89 @@ class HeatmapItem:
 		return [HeatmapItem.from_yt_dlp_heatmap_item(hm_item) for hm_item in heatmap_data]
 
 
-@dataclass
+class Heatmap:
+	"""
+	The heatmap of a video as read-only arrays with one element per bucket, for the vectorized
+	sampling of sampling_utils. It is serialized as the list of its HeatmapItem and iterating over
+	it yields HeatmapItem, like the list it replaces.
+	"""
+
+	__slots__ = ("start_s", "end_s", "intensity")
+
+	def __init__(self, start_s: np.ndarray, end_s: np.ndarray, intensity: np.ndarray) -> None:
+		self.start_s = np.asarray(start_s, dtype=np.float64)
+		self.end_s = np.asarray(end_s, dtype=np.float64)
+		self.intensity = np.asarray(intensity, dtype=np.float64)
+		for array in (self.start_s, self.end_s, self.intensity):
+			array.flags.writeable = False
+
+	@classmethod
+	def from_items(cls, heatmap_items: list[HeatmapItem]) -> Heatmap:
+		return cls(
+			start_s=[hmi.start_s for hmi in heatmap_items],
+			end_s=[hmi.end_s for hmi in heatmap_items],
+			intensity=[hmi.intensity for hmi in heatmap_items],
+		)
+
+	@classmethod
+	def from_yt_dlp_heatmap(cls, heatmap_data: list[dict[str, float]]) -> Heatmap:
+		return cls(
+			start_s=[hm_item["start_time"] for hm_item in heatmap_data],
+			end_s=[hm_item["end_time"] for hm_item in heatmap_data],
+			intensity=[hm_item["value"] for hm_item in heatmap_data],
+		)
+
+	@classmethod
+	def from_json(cls, json_data: list[dict[str, float]]) -> Heatmap:
+		return cls(
+			start_s=[hmi["start_s"] for hmi in json_data],
+			end_s=[hmi["end_s"] for hmi in json_data],
+			intensity=[hmi["intensity"] for hmi in json_data],
+		)
+
+	def __len__(self) -> int:
+		return len(self.start_s)
+
+	def __getitem__(self, index: int) -> HeatmapItem:
+		return HeatmapItem(
+			end_s=float(self.end_s[index]),
+			intensity=float(self.intensity[index]),
+			start_s=float(self.start_s[index]),
+		)
+
+	def __iter__(self) -> Iterator[HeatmapItem]:
+		for end_s, intensity, start_s in zip(
+			self.end_s.tolist(), self.intensity.tolist(), self.start_s.tolist()
+		):
+			yield HeatmapItem(end_s=end_s, intensity=intensity, start_s=start_s)
+
+	def __eq__(self, other: object) -> bool:
+		if isinstance(other, Heatmap):
+			return (
+				np.array_equal(self.start_s, other.start_s)
+				and np.array_equal(self.end_s, other.end_s)
+				and np.array_equal(self.intensity, other.intensity)
+			)
+		return isinstance(other, list) and list(self) == other
+
+	def __repr__(self) -> str:
+		return f"Heatmap({len(self)} buckets)"
+
+	def __deepcopy__(self, memo: dict) -> Heatmap:
+		# dataclasses.asdict deep copies the values it does not know, the arrays are read-only
+		return self
+
+	def to_json(self) -> list[dict[str, float]]:
+		"""The json of the list of HeatmapItem."""
+		return [
+			{"end_s": end_s, "intensity": intensity, "start_s": start_s}
+			for end_s, intensity, start_s in zip(
+				self.end_s.tolist(), self.intensity.tolist(), self.start_s.tolist()
+			)
+		]
+
+
+@dataclass(slots=True)
 class YouTubeComment:
 	author_id: str
 	author_is_uploader: bool
@@ -45,14 +144,14 @@ class YouTubeComment:
 	@classmethod
 	def from_yt_dlp_comment(cls, comment_data: dict[str, Any]) -> YouTubeComment:
 		return cls(
-			author_id=comment_data["author_id"],
+			author_id=_intern(comment_data["author_id"]),
 			author_is_uploader=comment_data["author_is_uploader"],
-			author_name=comment_data["author"],
+			author_name=_intern(comment_data["author"]),
 			id=comment_data["id"],
 			is_favorited=comment_data["is_favorited"],
 			is_pinned=comment_data["is_pinned"],
 			like_count=comment_data["like_count"],
-			parent_id=comment_data["parent"],
+			parent_id=_intern(comment_data["parent"]),
 			publish_date=datetime.fromtimestamp(comment_data["timestamp"]),
 			replies=[],
 			text=comment_data["text"],
@@ -60,29 +159,32 @@ class YouTubeComment:
 
 	@classmethod
 	def from_yt_dlp_comments(cls, comments_data: list[dict[str, Any]]) -> list[YouTubeComment]:
-		# Comments are retrieved in reply order so we could leverage this order to parse replies
-		# I don't like this method so much, it's not very robust imho.
-		# Replies have an ID format that is parent_id.reply_id, I will leverage this to parse the
-		# replies.
-		# Not optimized at all, but do we really need to optimize this?
+		"""
+		Build the comment trees in linear time: the comments are indexed by id, then every comment
+		is appended to the replies of its parent. Replies can be nested at any depth and keep the
+		yt-dlp order, replies whose parent is missing (e.g. cut by max_comments) are dropped.
+		"""
 		all_comments = [
 			YouTubeComment.from_yt_dlp_comment(comment_data) for comment_data in comments_data
 		]
-		root_comments = [comment for comment in all_comments if comment.parent_id == "root"]
-		for root_comment in root_comments:
-			replies = [comment for comment in all_comments if comment.parent_id == root_comment.id]
-			root_comment.replies = replies
+		comments_by_id = {comment.id: comment for comment in all_comments}
+		root_comments = []
+		for comment in all_comments:
+			if comment.parent_id == "root":
+				root_comments.append(comment)
+			elif comment.parent_id in comments_by_id and comment.parent_id != comment.id:
+				comments_by_id[comment.parent_id].replies.append(comment)
 		return root_comments
 
 	@classmethod
 	def from_json(cls, json_data: Any) -> YouTubeComment:
 		replies = (
-			[YouTubeComment(**reply_data) for reply_data in json_data["replies"]]
+			[YouTubeComment.from_json(reply_data) for reply_data in json_data["replies"]]
 			if json_data.get("replies")
 			else []
 		)
-		json_data |= {"replies": replies}
-		return cls(**json_data)
+		interned = {field: _intern(json_data.get(field)) for field in COMMENT_INTERNED_FIELDS}
+		return cls(**(json_data | interned | {"replies": replies}))
 
 	def to_string_for_model_input(self, include_replies: bool, leading_tabs: int = 0):
 		tabs = "\t" * leading_tabs
@@ -96,7 +198,94 @@ class YouTubeComment:
 		return "\n".join(string_parts)
 
 
-@dataclass(frozen=True)
+_COMMENT_FIELDS = tuple(YouTubeComment.__dataclass_fields__)
+_COMMENT_INTERNED_INDEXES = tuple(_COMMENT_FIELDS.index(f) for f in COMMENT_INTERNED_FIELDS)
+_COMMENT_REPLIES_INDEX = _COMMENT_FIELDS.index("replies")
+_comment_values = operator.itemgetter(*_COMMENT_FIELDS)
+# None as the missing interned fields of YouTubeComment.from_json, an empty text still renders
+_COMMENT_DEFAULTS = dict.fromkeys(_COMMENT_FIELDS) | {"replies": [], "text": ""}
+
+
+class LazyComments(Sequence):
+	"""
+	The comments of a video read from json, a YouTubeComment is built only when its comment is
+	accessed, so that reading a video with thousands of comments costs little more than reading
+	one without comments when only the first max_comments are used. Slices return lists.
+
+	Until it is accessed a comment is kept as the tuple of its field values (replies included),
+	which takes about the memory of the built comment instead of the much larger json dict.
+	"""
+
+	__slots__ = ("_comments",)
+
+	def __init__(self, comments_json: list[dict[str, Any]]) -> None:
+		self._comments: list[tuple | YouTubeComment] = [
+			self._compact(comment_json) for comment_json in comments_json
+		]
+
+	@staticmethod
+	def _compact(comment_json: dict[str, Any]) -> tuple:
+		try:
+			values = list(_comment_values(comment_json))
+		except KeyError:
+			# A comment written without some of the fields
+			values = list(_comment_values(_COMMENT_DEFAULTS | comment_json))
+		for index in _COMMENT_INTERNED_INDEXES:
+			values[index] = _intern(values[index])
+		values[_COMMENT_REPLIES_INDEX] = tuple(
+			LazyComments._compact(reply_json) for reply_json in values[_COMMENT_REPLIES_INDEX] or ()
+		)
+		return tuple(values)
+
+	@staticmethod
+	def _build(values: tuple) -> YouTubeComment:
+		comment = YouTubeComment(*values)
+		comment.replies = [LazyComments._build(reply) for reply in values[_COMMENT_REPLIES_INDEX]]
+		return comment
+
+	@staticmethod
+	def _compact_to_json(values: tuple) -> dict[str, Any]:
+		comment_json = dict(zip(_COMMENT_FIELDS, values))
+		comment_json["replies"] = [
+			LazyComments._compact_to_json(reply) for reply in values[_COMMENT_REPLIES_INDEX]
+		]
+		return comment_json
+
+	def __len__(self) -> int:
+		return len(self._comments)
+
+	def __getitem__(self, index: int | slice) -> YouTubeComment | list[YouTubeComment]:
+		if isinstance(index, slice):
+			return [self[i] for i in range(*index.indices(len(self)))]
+		comment = self._comments[index]
+		if isinstance(comment, tuple):
+			comment = self._build(comment)
+			self._comments[index] = comment
+		return comment
+
+	def __eq__(self, other: object) -> bool:
+		if other is self:
+			return True
+		return isinstance(other, Sequence) and list(self) == list(other)
+
+	def __repr__(self) -> str:
+		return f"LazyComments({len(self)} comments)"
+
+	def __deepcopy__(self, memo: dict) -> LazyComments:
+		# dataclasses.asdict deep copies the values it does not know, the comments are never mutated
+		return self
+
+	def to_json(self) -> list[dict[str, Any]]:
+		"""The json of the comments, the comments that were never accessed are not built."""
+		return [
+			self._compact_to_json(comment)
+			if isinstance(comment, tuple)
+			else json_utils.dataclass_to_json(comment)
+			for comment in self._comments
+		]
+
+
+@dataclass(frozen=True, slots=True)
 class YouTubeVideoInfo:
 	"""Youtube video dataclass holding the informations that will be persisted in the final dataset"""
 
@@ -106,10 +295,10 @@ class YouTubeVideoInfo:
 	channel_subscribers: int
 	channel_title: str
 	comment_count: int
-	comments: list[YouTubeComment] | None
+	comments: Sequence[YouTubeComment] | None
 	description: str
 	duration_s: int
-	heatmap: list[HeatmapItem] | None
+	heatmap: Heatmap | None
 	id: str
 	like_count: int
 	location_description: str | None
@@ -144,7 +333,7 @@ class YouTubeVideoInfo:
 			description=yt_dlp_info["description"],
 			duration_s=yt_dlp_info["duration"],
 			heatmap=(
-				HeatmapItem.from_yt_dlp_heatmap(yt_dlp_info.get("heatmap"))
+				Heatmap.from_yt_dlp_heatmap(yt_dlp_info.get("heatmap"))
 				if yt_dlp_info.get("heatmap")
 				else None
 			),
@@ -165,21 +354,25 @@ class YouTubeVideoInfo:
 
 	@classmethod
 	def from_json(cls, json_data: Any) -> YouTubeVideoInfo:
-		heatmap = (
-			[HeatmapItem(**hmi) for hmi in json_data["heatmap"]]
-			if json_data.get("heatmap")
-			else None
-		)
-		comments = (
-			[YouTubeComment.from_json(comment) for comment in json_data["comments"]]
-			if json_data["comments"]
-			else None
-		)
-		json_data |= {"heatmap": heatmap, "comments": comments}
+		json_data |= {
+			field: cls.field_from_json(field, json_data.get(field))
+			for field in ("heatmap", "comments", *VIDEO_INTERNED_FIELDS)
+		}
 		return cls(**json_data)
 
+	@staticmethod
+	def field_from_json(field_name: str, json_value: Any) -> Any:
+		"""Convert the json value of a single field to the type used by this class."""
+		if field_name == "heatmap":
+			return Heatmap.from_json(json_value) if json_value else None
+		if field_name == "comments":
+			return LazyComments(json_value) if json_value else None
+		if field_name in VIDEO_INTERNED_FIELDS:
+			return _intern(json_value)
+		return json_value
+
 	def __str__(self) -> str:
-		return json.dumps(self, cls=EnhancedJSONEncoder)
+		return json_utils.dumps(self)
 
 	def to_string_for_model_input(
 		self,
@@ -195,7 +388,7 @@ class YouTubeVideoInfo:
 				if self.__getattribute__(attribute) is None:  # CHeck if the subs are available
 					str_parts.append(f"**{attribute}**: (not available)")
 					continue
-				pretty_subs = text_from_subtitles(self.__getattribute__(attribute))
+				pretty_subs = cached_text_from_subtitles(self.__getattribute__(attribute))
 				pretty_subs = (
 					pretty_subs[:max_subtitles_length] if max_subtitles_length > 0 else pretty_subs
 				)
@@ -3,6 +3,10 @@ import os
 import ffmpeg
 
 
+def frame_filename(frame_prefix: str, index: int, timestamp: float) -> str:
+	return f"{frame_prefix}_{index:02}_{timestamp}s.jpg"
+
+
 def extract_frames_at_times(
 	video_path: str, timestamps_s: list[float], output_folder: str, frame_prefix: str
 ) -> None:
@@ -12,8 +16,7 @@ def extract_frames_at_times(
 	for i, timestamp in enumerate(timestamps_s):
 		# Format the timestamp in seconds for the filename
 		timestamp = round(timestamp, 1)
-		frame_filename = f"{frame_prefix}_{i:02}_{timestamp}s.jpg"
-		frame_path = os.path.join(output_folder, frame_filename)
+		frame_path = os.path.join(output_folder, frame_filename(frame_prefix, i, timestamp))
 
 		# Run ffmpeg to extract the frame at the specified timestamp
 		try:
@@ -28,5 +31,35 @@ def extract_frames_at_times(
 			print(f"Error extracting frame at {timestamp}s: {e.stderr.decode()}")
 
 
+def extract_section_frames(
+	sections_paths: dict[float, str],
+	timestamps_s: list[float],
+	output_folder: str,
+	frame_prefix: str,
+) -> None:
+	"""
+	Same output as extract_frames_at_times, but every frame is the first frame of the section of
+	the video starting at its rounded timestamp (see download_video_and_metadata).
+	"""
+	os.makedirs(output_folder, exist_ok=True)
+	for i, timestamp in enumerate(timestamps_s):
+		timestamp = round(timestamp, 1)
+		frame_path = os.path.join(output_folder, frame_filename(frame_prefix, i, timestamp))
+		section_path = sections_paths.get(timestamp)
+		if section_path is None or not os.path.isfile(section_path):
+			print(f"Error extracting frame at {timestamp}s: missing section {section_path}")
+			continue
+		try:
+			(
+				ffmpeg.input(section_path)
+				.output(frame_path, vframes=1, qscale=2)
+				.overwrite_output()
+				.run(capture_stdout=True, capture_stderr=True)
+			)
+			print(f"Extracted frame at {timestamp}s to {frame_path}")
+		except ffmpeg.Error as e:
+			print(f"Error extracting frame at {timestamp}s: {e.stderr.decode()}")
+
+
 if __name__ == "__main__":
 	extract_frames_at_times("dQw4w9WgXcQ.mp4", [1.0235093405, 4.4, 5.5], "frames", "manual_test")
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from PIL import Image
+
+# The quality convert_webp_to_jpg.py used (the Pillow default)
+DEFAULT_JPEG_QUALITY = 75
+TRANSCODED_EXTENSIONS = (".webp",)
+# Stored in the JPEG comment, the transcoded image is up to date while it matches its source
+SOURCE_HASH_COMMENT_FORMAT = "source-sha1:{}"
+
+
+@dataclass(slots=True)
+class TranscodeStats:
+	transcoded: int = 0
+	skipped: int = 0
+	failed: int = 0
+	source_bytes: int = 0
+	seconds: float = 0.0
+
+	@property
+	def images_per_s(self) -> float:
+		images = self.transcoded + self.skipped + self.failed
+		return images / self.seconds if self.seconds else 0.0
+
+
+def jpeg_path_of(image_path: str) -> str:
+	return os.path.splitext(image_path)[0] + ".jpg"
+
+
+def transcode_to_jpeg(image_path: str, quality: int = DEFAULT_JPEG_QUALITY) -> bool:
+	"""
+	Write the image (e.g. a webp thumbnail) as a JPEG with the same name next to it, unless the
+	JPEG was already transcoded from the same content: the sha1 of the source is stored in the
+	comment of the JPEG, so running it again is free and a source that changed (e.g. downloaded
+	again) is transcoded again. The JPEG is written to a temporary file first, a crash never leaves
+	a partial JPEG.
+
+	:return: True if the image was transcoded, False if the JPEG was up to date.
+	"""
+	with open(image_path, "rb") as image_file:
+		source = image_file.read()
+	comment = SOURCE_HASH_COMMENT_FORMAT.format(hashlib.sha1(source).hexdigest())
+	jpeg_path = jpeg_path_of(image_path)
+	if os.path.exists(jpeg_path):
+		try:
+			# Only the header is read
+			with Image.open(jpeg_path) as jpeg:
+				if jpeg.info.get("comment") == comment.encode("ascii"):
+					return False
+		except OSError:
+			pass  # Not a valid JPEG, transcoded again
+	tmp_path = f"{jpeg_path}.{os.getpid()}.tmp"
+	try:
+		with Image.open(image_path) as image:
+			image.convert("RGB").save(tmp_path, "JPEG", quality=quality, comment=comment)
+		os.replace(tmp_path, jpeg_path)
+	finally:
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
+	return True
+
+
+def transcode_folder(
+	folder: str, workers: int | None = None, quality: int = DEFAULT_JPEG_QUALITY
+) -> TranscodeStats:
+	"""
+	transcode_to_jpeg every webp image of the folder with a pool of workers processes (one per core
+	if None). The failures are printed and counted, they do not stop the others.
+	"""
+	start = time.perf_counter()
+	images_paths = sorted(
+		os.path.join(folder, filename)
+		for filename in os.listdir(folder)
+		if filename.lower().endswith(TRANSCODED_EXTENSIONS)
+	)
+	stats = TranscodeStats()
+	workers = workers or os.cpu_count() or 1
+	with ProcessPoolExecutor(max_workers=workers) as executor:
+		futures = [
+			executor.submit(transcode_to_jpeg, image_path, quality) for image_path in images_paths
+		]
+		for image_path, future in zip(images_paths, futures):
+			try:
+				transcoded = future.result()
+			except Exception as exception:
+				print(f"Error converting {image_path}: {exception}")
+				stats.failed += 1
+				continue
+			if transcoded:
+				stats.transcoded += 1
+				stats.source_bytes += os.path.getsize(image_path)
+			else:
+				stats.skipped += 1
+	stats.seconds = time.perf_counter() - start
+	return stats
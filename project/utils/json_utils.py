@@ -1,6 +1,10 @@
 import dataclasses
 import json
 from datetime import date, datetime
+from typing import IO, Any, Callable, Iterable
+
+# Values the json encoder writes as they are
+_ATOMIC_TYPES = frozenset({str, int, float, bool, type(None)})
 
 
 class EnhancedJSONEncoder(json.JSONEncoder):
@@ -9,4 +13,133 @@ class EnhancedJSONEncoder(json.JSONEncoder):
 			return dataclasses.asdict(obj)
 		if isinstance(obj, (datetime, date)):
 			return obj.isoformat()
+		if hasattr(obj, "to_json"):  # e.g. LazyComments
+			return obj.to_json()
 		return super().default(obj)
+
+
+def dumps(obj: Any) -> str:
+	"""
+	Same as json.dumps(obj, cls=EnhancedJSONEncoder), but the dataclasses are converted by a field
+	walker compiled once per class instead of dataclasses.asdict, which deep copies every value
+	that is not a dataclass, a list, a tuple or a dict.
+	"""
+	return _ENCODER.encode(obj)
+
+
+def dump(obj: Any, file: IO[str], stream_depth: int = 3) -> None:
+	"""
+	Same output as json.dump(obj, file, cls=EnhancedJSONEncoder), without building the whole json
+	in memory: the dataclasses, lists and dicts of the first stream_depth levels are written to the
+	file item by item, the items below are encoded one at a time by the C encoder (json.dump uses
+	the pure Python one). The default depth streams an Experiment completion by completion.
+	"""
+	_write_json(obj, file, _identity, stream_depth)
+
+
+def dataclass_to_json(obj: Any) -> dict[str, Any]:
+	"""
+	The dict of dataclasses.asdict(obj) for json encoding, without deep copying the values that
+	are not dataclasses, lists, tuples or dicts (e.g. datetimes, left to the encoder).
+	"""
+	return _dataclass_walker(type(obj))(obj)
+
+
+def _default(obj: Any) -> Any:
+	if _is_dataclass_instance(obj):
+		return _dataclass_walker(type(obj))(obj)
+	if isinstance(obj, (datetime, date)):
+		return obj.isoformat()
+	if hasattr(obj, "to_json"):
+		return obj.to_json()
+	raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+_ENCODER = json.JSONEncoder(default=_default)
+
+
+def _asdict_json_data(obj: Any) -> Any:
+	"""
+	A value of a dataclass field as converted by dataclasses.asdict, which converts the nested
+	dataclasses before the encoder sees them, even when they are dict or list subclasses. The other
+	values are left to the encoder as they are, instead of deep copies of them.
+	"""
+	if type(obj) in _ATOMIC_TYPES:
+		return obj
+	if _is_dataclass_instance(obj):
+		return _dataclass_walker(type(obj))(obj)
+	if isinstance(obj, (list, tuple)):
+		return [_asdict_json_data(v) for v in obj]
+	if isinstance(obj, dict):
+		return {_asdict_json_data(k): _asdict_json_data(v) for k, v in obj.items()}
+	return obj
+
+
+_walkers: dict[type, Callable[[Any], dict[str, Any]]] = {}
+
+
+def _dataclass_walker(cls: type) -> Callable[[Any], dict[str, Any]]:
+	"""
+	A function converting an instance of the dataclass to the dict of its field values, generated
+	once per class with one direct attribute read per field like the __init__ generated by
+	dataclasses. Atomic values are put in the dict as they are, without a function call.
+	"""
+	walker = _walkers.get(cls)
+	if walker is not None:
+		return walker
+	field_values = [
+		f"{field.name!r}: (v{i} if type(v{i} := obj.{field.name}) in atomic_types "
+		f"else asdict_json_data(v{i}))"
+		for i, field in enumerate(dataclasses.fields(cls))
+	]
+	source = "def walker(obj):\n\treturn {" + ", ".join(field_values) + "}\n"
+	namespace = {"atomic_types": _ATOMIC_TYPES, "asdict_json_data": _asdict_json_data}
+	exec(source, namespace)
+	walker = namespace["walker"]
+	_walkers[cls] = walker
+	return walker
+
+
+def _write_json(obj: Any, file: IO[str], convert: Callable[[Any], Any], depth: int) -> None:
+	if depth > 0:
+		# The encoder writes the dataclasses that are dicts or lists as such, asdict converts them
+		if _is_dataclass_instance(obj) and (
+			convert is _asdict_json_data
+			or not isinstance(obj, (str, int, float, list, tuple, dict))
+		):
+			fields = ((f.name, getattr(obj, f.name)) for f in dataclasses.fields(obj))
+			_write_json_object(fields, file, _asdict_json_data, depth)
+			return
+		if isinstance(obj, (list, tuple)):
+			file.write("[")
+			for i, element in enumerate(obj):
+				if i:
+					file.write(", ")
+				_write_json(element, file, convert, depth - 1)
+			file.write("]")
+			return
+		if isinstance(obj, dict) and all(isinstance(key, str) for key in obj):
+			_write_json_object(obj.items(), file, convert, depth)
+			return
+	file.write(_ENCODER.encode(convert(obj)))
+
+
+def _write_json_object(
+	items: Iterable[tuple[str, Any]], file: IO[str], convert: Callable[[Any], Any], depth: int
+) -> None:
+	file.write("{")
+	for i, (key, value) in enumerate(items):
+		if i:
+			file.write(", ")
+		file.write(_ENCODER.encode(key))
+		file.write(": ")
+		_write_json(value, file, convert, depth - 1)
+	file.write("}")
+
+
+def _is_dataclass_instance(obj: Any) -> bool:
+	return dataclasses.is_dataclass(obj) and not isinstance(obj, type)
+
+
+def _identity(obj: Any) -> Any:
+	return obj
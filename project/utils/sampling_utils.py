@@ -1,14 +1,105 @@
 import random
 
-from project.models import HeatmapItem
+import numpy as np
 
+from project.models import Heatmap, HeatmapItem
 
-def sample_heatmap(heatmap: list[HeatmapItem], samples: int) -> list[float]:
+
+def sample_heatmap(
+	heatmap: Heatmap | list[HeatmapItem], samples: int, min_separation_s: float = 0.0
+) -> list[float]:
+	"""
+	The starts of the samples most intense buckets of the heatmap, from the most intense. Equally
+	intense buckets are taken in order.
+
+	:param min_separation_s: When positive, apply non-maximum suppression: a bucket is skipped if
+	it starts less than min_separation_s seconds from an already sampled one, so that the samples
+	come from different peaks instead of adjacent buckets of the same peak. Less than samples
+	timestamps are returned if the heatmap has not enough separated buckets.
+	"""
+	if not isinstance(heatmap, Heatmap):
+		heatmap = Heatmap.from_items(heatmap)
+	if samples <= 0 or len(heatmap) == 0:
+		return []
+	if min_separation_s > 0:
+		return _sample_separated(heatmap, samples, min_separation_s)
+
+	keys = -heatmap.intensity
+	if samples < len(heatmap):
+		top_indices = np.argpartition(keys, samples - 1)[:samples]
+		# argpartition picks any of the buckets tied at the boundary, take the first ones
+		kth_key = keys[top_indices].max()
+		above = np.flatnonzero(keys < kth_key)
+		tied = np.flatnonzero(keys == kth_key)[: samples - len(above)]
+		top_indices = np.concatenate((above, tied))
+	else:
+		top_indices = np.arange(len(heatmap))
+	top_indices = top_indices[np.lexsort((top_indices, keys[top_indices]))]
+	return heatmap.start_s[top_indices].tolist()
+
+
+def sample_heatmaps(
+	heatmaps: list[Heatmap | list[HeatmapItem]], samples: int, min_separation_s: float = 0.0
+) -> list[list[float]]:
+	"""
+	sample_heatmap for many videos at once. Without min_separation_s the top samples buckets of all
+	the heatmaps are selected together, padded to the longest heatmap, with a single argpartition.
+	With min_separation_s the suppression is sequential and every heatmap is sampled on its own.
+	"""
+	heatmaps = [h if isinstance(h, Heatmap) else Heatmap.from_items(h) for h in heatmaps]
+	if samples <= 0 or not heatmaps:
+		return [[] for _ in heatmaps]
+	if min_separation_s > 0:
+		return [_sample_separated(h, samples, min_separation_s) for h in heatmaps]
+
+	buckets_count = max(len(h) for h in heatmaps)
+	if buckets_count == 0:
+		return [[] for _ in heatmaps]
+	# Sort key of every bucket, the padding never gets selected
+	keys = np.full((len(heatmaps), buckets_count), np.inf)
+	starts = np.zeros((len(heatmaps), buckets_count))
+	for row, heatmap in enumerate(heatmaps):
+		keys[row, : len(heatmap)] = -heatmap.intensity
+		starts[row, : len(heatmap)] = heatmap.start_s
+
+	top_count = min(samples, buckets_count)
+	if top_count < buckets_count:
+		top_indices = np.argpartition(keys, top_count - 1, axis=1)[:, :top_count]
+		# argpartition picks any of the buckets tied at the boundary, take the first ones
+		kth_keys = np.take_along_axis(keys, top_indices, axis=1).max(axis=1, keepdims=True)
+		above = keys < kth_keys
+		tied_needed = top_count - above.sum(axis=1, keepdims=True)
+		tied = (keys == kth_keys) & (np.cumsum(keys == kth_keys, axis=1) <= tied_needed)
+		selected = above | tied
+		# Exactly top_count buckets are selected in every row
+		top_indices = np.nonzero(selected)[1].reshape(len(heatmaps), top_count)
+	else:
+		top_indices = np.broadcast_to(np.arange(buckets_count), keys.shape)
+	top_keys = np.take_along_axis(keys, top_indices, axis=1)
+	order = np.lexsort((top_indices, top_keys), axis=1)
+	top_indices = np.take_along_axis(top_indices, order, axis=1)
+	top_keys = np.take_along_axis(top_keys, order, axis=1)
+	top_starts = np.take_along_axis(starts, top_indices, axis=1)
 	return [
-		hmi.start_s for hmi in sorted(heatmap, key=lambda e: e.intensity, reverse=True)[:samples]
+		row_starts[np.isfinite(row_keys)].tolist()
+		for row_starts, row_keys in zip(top_starts, top_keys)
 	]
 
 
+def _sample_separated(heatmap: Heatmap, samples: int, min_separation_s: float) -> list[float]:
+	# Greedy non-maximum suppression, from the most intense bucket
+	suppressed = np.zeros(len(heatmap), dtype=bool)
+	sampled = []
+	for index in np.argsort(-heatmap.intensity, kind="stable"):
+		if suppressed[index]:
+			continue
+		sampled.append(float(heatmap.start_s[index]))
+		if len(sampled) == samples:
+			break
+		suppressed |= np.abs(heatmap.start_s - heatmap.start_s[index]) < min_separation_s
+	return sampled
+
+
 def sample_fixed_interval(duration_s: float, samples: int) -> list[float]:
 	# + 0.1 to avoid the first black frame that is there sometimes
 	return [i * duration_s / samples + 0.1 for i in range(samples)]
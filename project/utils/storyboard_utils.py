@@ -0,0 +1,75 @@
+import io
+import os
+import urllib.request
+from typing import Any, Callable
+
+from PIL import Image
+
+from project.utils.ffmpeg_utils import frame_filename
+
+
+def fetch_url(url: str) -> bytes:
+	with urllib.request.urlopen(url) as response:
+		return response.read()
+
+
+def select_storyboard_format(formats: list[dict[str, Any]]) -> dict[str, Any] | None:
+	"""The storyboard format of the yt-dlp formats list with the largest tiles, if any."""
+	storyboard_formats = [
+		f for f in formats if f.get("format_note") == "storyboard" and f.get("fragments")
+	]
+	if not storyboard_formats:
+		return None
+	return max(storyboard_formats, key=lambda f: f["width"] * f["height"])
+
+
+def storyboard_tile_position(
+	storyboard_format: dict[str, Any], timestamp: float
+) -> tuple[int, int, int]:
+	"""
+	Position of the tile nearest to the timestamp as (sprite sheet index, row, column).
+
+	A storyboard is a sequence of sprite sheets (the fragments of the format), every sheet is a
+	grid of rows x columns tiles and every tile covers 1 / fps seconds of the video.
+	"""
+	tiles_per_sheet = storyboard_format["rows"] * storyboard_format["columns"]
+	duration_s = sum(fragment["duration"] for fragment in storyboard_format["fragments"])
+	tiles_count = max(round(duration_s * storyboard_format["fps"]), 1)
+	tile_index = min(max(round(timestamp * storyboard_format["fps"]), 0), tiles_count - 1)
+	sheet_index, tile_in_sheet = divmod(tile_index, tiles_per_sheet)
+	row, column = divmod(tile_in_sheet, storyboard_format["columns"])
+	return sheet_index, row, column
+
+
+def extract_frames_from_storyboard(
+	storyboard_format: dict[str, Any],
+	timestamps_by_frame_prefix: dict[str, list[float]],
+	output_folder: str,
+	fetch: Callable[[str], bytes] = fetch_url,
+) -> None:
+	"""
+	Write the storyboard tile nearest to every timestamp with the same file names used by
+	extract_frames_at_times, without downloading the video. Every sprite sheet is fetched once.
+
+	:param storyboard_format: A storyboard format of the yt-dlp info, see select_storyboard_format.
+	:param fetch: Called with the url of a sprite sheet, returns its bytes. Tests can use it to read local sprite sheets.
+	"""
+	os.makedirs(output_folder, exist_ok=True)
+	sheets: dict[int, Image.Image] = {}
+	width, height = storyboard_format["width"], storyboard_format["height"]
+	for frame_prefix, timestamps_s in timestamps_by_frame_prefix.items():
+		for i, timestamp in enumerate(timestamps_s):
+			timestamp = round(timestamp, 1)
+			frame_path = os.path.join(output_folder, frame_filename(frame_prefix, i, timestamp))
+			sheet_index, row, column = storyboard_tile_position(storyboard_format, timestamp)
+			try:
+				if sheet_index not in sheets:
+					sheet_url = storyboard_format["fragments"][sheet_index]["url"]
+					sheets[sheet_index] = Image.open(io.BytesIO(fetch(sheet_url))).convert("RGB")
+				tile = sheets[sheet_index].crop(
+					(column * width, row * height, (column + 1) * width, (row + 1) * height)
+				)
+				tile.save(frame_path, "JPEG")
+				print(f"Extracted frame at {timestamp}s to {frame_path}")
+			except Exception as e:
+				print(f"Error extracting frame at {timestamp}s: {e}")
@@ -1,5 +1,28 @@
+import hashlib
+import html
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import IO, Iterable, Iterator
+from xml.etree import ElementTree
+
 import srt
 
+# Formatting tags kept by the SRT format, every other WebVTT tag (<c>, <v>, inline timestamps...)
+# is removed like ffmpeg does
+SRT_TAGS = ("b", "i", "u")
+SUPPORTED_SUBTITLES_FORMATS = ("vtt", "json3", "srv3")
+# Transcripts are a few KB to a few hundred KB, the cache must not grow with the dataset
+DEFAULT_MAX_CACHED_TEXTS = 1_000
+# The file of the transcript cache persisted by the prompt stores and the experiment runners, in
+# their folder
+TRANSCRIPT_CACHE_FILENAME = "transcripts.jsonl"
+
+_VTT_TAG_PATTERN = re.compile(r"<(/?)([^>\s./]*)[^>]*>")
+_VTT_TIMESTAMP_PATTERN = re.compile(r"(?:(\d+):)?(\d{2}):(\d{2})\.(\d{3})")
+
 
 def text_from_subtitles(raw_subtitles: str) -> str:
 	subs = []
@@ -20,3 +43,223 @@ def text_from_subtitles(raw_subtitles: str) -> str:
 			last_pretty_sub = pretty_sub
 
 	return "\n".join(pretty_subs)
+
+
+class TranscriptCache:
+	"""
+	The text_from_subtitles of every subtitles keyed by the sha1 of the raw SRT, so that every
+	subtitles are parsed once. At most max_cached_texts texts are kept in memory, the least recently
+	used ones are dropped first. With a file path the cache is persisted as an append-only JSON
+	lines file shared by all the runs using the same file: only the byte offset of every text is
+	kept in memory, the texts dropped from memory are read back from the file.
+	A truncated last line (e.g. an interrupted run) is ignored.
+	"""
+
+	def __init__(
+		self, file_path: str | None = None, max_cached_texts: int = DEFAULT_MAX_CACHED_TEXTS
+	) -> None:
+		self.file_path = file_path
+		self.max_cached_texts = max_cached_texts
+		self._cached_texts: OrderedDict[str, str] = OrderedDict()
+		self._offsets_by_hash: dict[str, int] = {}
+		self._lock = threading.Lock()
+		self._file = None
+		if file_path is None:
+			return
+		byte_offset = 0
+		line = b"\n"
+		if os.path.exists(file_path):
+			with open(file_path, "rb") as cache_file:
+				for line in cache_file:
+					try:
+						subtitles_hash = json.loads(line)["sha1"]
+					except json.JSONDecodeError:
+						byte_offset += len(line)
+						continue
+					self._offsets_by_hash[subtitles_hash] = byte_offset
+					byte_offset += len(line)
+		self._file = open(file_path, "ab")
+		if not line.endswith(b"\n"):
+			# Do not append the next entry to the truncated line
+			self._file.write(b"\n")
+		self._file_size = self._file.tell()
+
+	def __len__(self) -> int:
+		if self.file_path is None:
+			return len(self._cached_texts)
+		return len(self._offsets_by_hash)
+
+	def text_from_subtitles(self, raw_subtitles: str) -> str:
+		subtitles_hash = hashlib.sha1(raw_subtitles.encode("utf-8")).hexdigest()
+		with self._lock:
+			text = self._get(subtitles_hash)
+		if text is not None:
+			return text
+		text = text_from_subtitles(raw_subtitles)
+		with self._lock:
+			if self._file is not None and subtitles_hash not in self._offsets_by_hash:
+				line = (json.dumps({"sha1": subtitles_hash, "text": text}) + "\n").encode("utf-8")
+				self._file.write(line)
+				self._file.flush()
+				self._offsets_by_hash[subtitles_hash] = self._file_size
+				self._file_size += len(line)
+			self._cache(subtitles_hash, text)
+		return text
+
+	def close(self) -> None:
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+
+	def _get(self, subtitles_hash: str) -> str | None:
+		if subtitles_hash in self._cached_texts:
+			self._cached_texts.move_to_end(subtitles_hash)
+			return self._cached_texts[subtitles_hash]
+		byte_offset = self._offsets_by_hash.get(subtitles_hash)
+		if byte_offset is None or self._file is None:
+			return None
+		with open(self.file_path, "rb") as cache_file:
+			cache_file.seek(byte_offset)
+			text = json.loads(cache_file.readline())["text"]
+		self._cache(subtitles_hash, text)
+		return text
+
+	def _cache(self, subtitles_hash: str, text: str) -> None:
+		self._cached_texts[subtitles_hash] = text
+		self._cached_texts.move_to_end(subtitles_hash)
+		if len(self._cached_texts) > self.max_cached_texts:
+			self._cached_texts.popitem(last=False)
+
+
+_transcript_cache = TranscriptCache()
+
+
+def use_transcript_cache(
+	file_path: str | None, max_cached_texts: int = DEFAULT_MAX_CACHED_TEXTS
+) -> TranscriptCache:
+	"""
+	Replace the transcript cache used by cached_text_from_subtitles (an in-memory one holding at
+	most DEFAULT_MAX_CACHED_TEXTS texts by default) with one persisted to file_path, or with a new
+	in-memory one if file_path is None. The cache already persisted to file_path is kept.
+	"""
+	global _transcript_cache
+	if file_path is not None and _transcript_cache.file_path == file_path:
+		return _transcript_cache
+	_transcript_cache.close()
+	_transcript_cache = TranscriptCache(file_path, max_cached_texts)
+	return _transcript_cache
+
+
+def cached_text_from_subtitles(raw_subtitles: str) -> str:
+	return _transcript_cache.text_from_subtitles(raw_subtitles)
+
+
+def format_srt_timestamp(milliseconds: int) -> str:
+	hours, milliseconds = divmod(max(milliseconds, 0), 3_600_000)
+	minutes, milliseconds = divmod(milliseconds, 60_000)
+	seconds, milliseconds = divmod(milliseconds, 1000)
+	return f"{hours:02}:{minutes:02}:{seconds:02},{milliseconds:03}"
+
+
+def parse_vtt_timestamp(timestamp: str) -> int:
+	"""A WebVTT timestamp (hh:mm:ss.ttt or mm:ss.ttt) in milliseconds."""
+	match = _VTT_TIMESTAMP_PATTERN.fullmatch(timestamp.strip())
+	if match is None:
+		raise ValueError(f"Invalid WebVTT timestamp: {timestamp!r}")
+	hours, minutes, seconds, milliseconds = match.groups()
+	return ((int(hours or 0) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(milliseconds)
+
+
+def _clean_cue_line(line: str) -> str:
+	line = _VTT_TAG_PATTERN.sub(
+		lambda m: f"<{m.group(1)}{m.group(2)}>" if m.group(2) in SRT_TAGS else "", line
+	)
+	return html.unescape(line).rstrip()
+
+
+def vtt_cues(lines: Iterable[str]) -> Iterator[tuple[int, int, str]]:
+	"""
+	Parse WebVTT lines into (start ms, end ms, text) cues, one cue block at a time. Cue settings,
+	identifiers, NOTE/STYLE/REGION blocks and the tags SRT does not support are dropped.
+	"""
+	block: list[str] = []
+	for line in _with_trailing_blank(lines):
+		line = line.rstrip("\r\n")
+		if line:
+			block.append(line)
+			continue
+		if not block:
+			continue
+		timing_index = next((i for i, b in enumerate(block[:2]) if "-->" in b), None)
+		if timing_index is not None:
+			start, end = block[timing_index].split("-->", 1)
+			text_lines = [_clean_cue_line(b) for b in block[timing_index + 1 :]]
+			text = "\n".join(t for t in text_lines if t.strip())
+			if text:
+				yield parse_vtt_timestamp(start), parse_vtt_timestamp(end.split()[0]), text
+		block = []
+
+
+def _with_trailing_blank(lines: Iterable[str]) -> Iterator[str]:
+	yield from lines
+	yield ""
+
+
+def json3_cues(json3_data: dict) -> Iterator[tuple[int, int, str]]:
+	"""Parse the events of YouTube json3 subtitles into (start ms, end ms, text) cues."""
+	for event in json3_data.get("events", []):
+		if "segs" not in event or "tStartMs" not in event:
+			continue
+		text = "".join(seg.get("utf8", "") for seg in event["segs"])
+		text = "\n".join(t.rstrip() for t in text.splitlines() if t.strip())
+		if text:
+			start = event["tStartMs"]
+			yield start, start + event.get("dDurationMs", 0), text
+
+
+def srv3_cues(file: IO[bytes] | str) -> Iterator[tuple[int, int, str]]:
+	"""Parse the <p> elements of YouTube srv3 subtitles into (start ms, end ms, text) cues."""
+	for _, element in ElementTree.iterparse(file):
+		if element.tag != "p":
+			continue
+		if element.get("t") is not None:
+			text = "".join(element.itertext())
+			text = "\n".join(t.rstrip() for t in text.splitlines() if t.strip())
+			if text:
+				start = int(element.get("t"))
+				yield start, start + int(element.get("d", 0)), text
+		element.clear()
+
+
+def write_srt(cues: Iterable[tuple[int, int, str]], file: IO[str]) -> int:
+	"""Write the cues to the file in SRT format and return the number of cues written."""
+	count = 0
+	for count, (start, end, text) in enumerate(cues, start=1):
+		file.write(
+			f"{count}\n{format_srt_timestamp(start)} --> {format_srt_timestamp(end)}\n{text}\n\n"
+		)
+	return count
+
+
+def convert_subtitles_file_to_srt(
+	subtitles_path: str, srt_path: str, subtitles_format: str | None = None
+) -> int:
+	"""
+	Convert a WebVTT, json3 or srv3 subtitles file to SRT in process. WebVTT and srv3 are streamed,
+	the cues are written as they are parsed.
+
+	:param subtitles_format: One of SUPPORTED_SUBTITLES_FORMATS, the extension of subtitles_path by default.
+	:return: The number of cues written.
+	"""
+	subtitles_format = subtitles_format or subtitles_path.rsplit(".", 1)[-1]
+	if subtitles_format not in SUPPORTED_SUBTITLES_FORMATS:
+		raise ValueError(f"Unsupported subtitles format: {subtitles_format}")
+	with open(srt_path, "w", encoding="utf-8") as srt_file:
+		if subtitles_format == "vtt":
+			with open(subtitles_path, "r", encoding="utf-8-sig") as vtt_file:
+				return write_srt(vtt_cues(vtt_file), srt_file)
+		if subtitles_format == "json3":
+			with open(subtitles_path, "r", encoding="utf-8") as json3_file:
+				return write_srt(json3_cues(json.load(json3_file)), srt_file)
+		with open(subtitles_path, "rb") as srv3_file:
+			return write_srt(srv3_cues(srv3_file), srt_file)
@@ -1,14 +1,99 @@
 import os.path
+from typing import Any, Callable, Iterator
 
 from yt_dlp.postprocessor.ffmpeg import FFmpegSubtitlesConvertorPP
 
+from project.utils.subtitles_utils import (
+	SUPPORTED_SUBTITLES_FORMATS,
+	convert_subtitles_file_to_srt,
+)
+
 
 def convert_subtitles_to_srt(old_file_path: str, new_file_path: str) -> None:
+	"""
+	Convert WebVTT, json3 and srv3 subtitles in process, only the other formats are converted by an
+	ffmpeg subprocess.
+	"""
 	if os.path.exists(new_file_path):
 		return
+	if old_file_path.rsplit(".", 1)[-1] in SUPPORTED_SUBTITLES_FORMATS:
+		convert_subtitles_file_to_srt(old_file_path, new_file_path)
+		return
 	pp = FFmpegSubtitlesConvertorPP()
 	pp.run_ffmpeg(old_file_path, new_file_path, ["-f", "srt"])
 
 
+def format_size(video_format: dict[str, Any], duration_s: float | None = None) -> float | None:
+	"""Size in bytes of a yt-dlp format, estimated from its bitrate when yt-dlp does not know it."""
+	if video_format.get("filesize") or video_format.get("filesize_approx"):
+		return video_format.get("filesize") or video_format.get("filesize_approx")
+	if video_format.get("tbr") and duration_s:
+		return video_format["tbr"] * 1000 / 8 * duration_s
+	return None
+
+
+def best_muxed_format(formats: list[dict[str, Any]]) -> dict[str, Any] | None:
+	"""The format picked by the "best" format spec, yt-dlp sorts the formats from worst to best."""
+	muxed_formats = [
+		f
+		for f in formats
+		if f.get("vcodec") not in (None, "none") and f.get("acodec") not in (None, "none")
+	]
+	return muxed_formats[-1] if muxed_formats else None
+
+
+def select_frames_format(
+	formats: list[dict[str, Any]],
+	min_height: int,
+	ext: str = "mp4",
+	duration_s: float | None = None,
+) -> dict[str, Any] | None:
+	"""
+	Select the smallest video-only format with at least min_height lines, or the highest video-only
+	format if none is high enough. Audio is useless when only frames are extracted.
+
+	:param formats: The "formats" list of the yt-dlp info of a video.
+	:param min_height: The height needed by the frames.
+	:param ext: Only formats with this container are considered.
+	:param duration_s: The duration of the video, used to estimate the size of the formats without one.
+	:return: The selected format or None if the video has no video-only format.
+	"""
+	video_only_formats = [
+		f
+		for f in formats
+		if f.get("vcodec") not in (None, "none")
+		and f.get("acodec") == "none"
+		and f.get("ext") == ext
+		and f.get("height")
+	]
+	if not video_only_formats:
+		return None
+	high_enough_formats = [f for f in video_only_formats if f["height"] >= min_height]
+	if not high_enough_formats:
+		return max(video_only_formats, key=lambda f: f["height"])
+	return min(
+		high_enough_formats,
+		key=lambda f: (format_size(f, duration_s) or float("inf"), f["height"]),
+	)
+
+
+def frames_format_selector(
+	min_height: int,
+) -> Callable[[dict[str, Any]], Iterator[dict[str, Any]]]:
+	"""yt-dlp "format" option using select_frames_format, falls back to the best muxed format."""
+
+	def selector(ctx: dict[str, Any]) -> Iterator[dict[str, Any]]:
+		formats = ctx["formats"]
+		selected_format = (
+			select_frames_format(formats, min_height)
+			or best_muxed_format(formats)
+			or (formats[-1] if formats else None)
+		)
+		if selected_format is not None:
+			yield selected_format
+
+	return selector
+
+
 if __name__ == "__main__":
 	convert_subtitles_to_srt("dQw4w9WgXcQ.auto-subs.en.vtt", "test.srt")
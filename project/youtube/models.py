@@ -6,7 +6,7 @@ from typing import Any, Literal
 
 import dateutil
 
-from project.utils.json_utils import EnhancedJSONEncoder
+from project.utils import json_utils
 
 
 @dataclass(frozen=True)
@@ -172,7 +172,7 @@ if __name__ == "__main__":
 		models = [SearchResult.from_api_response(item_raw) for item_raw in response["items"]]
 
 	with open("project/youtube/serialized_searchresult.json", "w") as serialize_file:
-		json.dump(models, serialize_file, cls=EnhancedJSONEncoder)
+		json_utils.dump(models, serialize_file)
 
 	with open("project/youtube/serialized_searchresult.json") as serialize_file:
 		raw_samples = json.load(serialize_file)
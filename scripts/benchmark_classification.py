@@ -0,0 +1,154 @@
+# Latency of a classification decoding the label only (CLASSIFICATION_OPTIONS) compared to an
+# unbounded generate, against a local fake Ollama server decoding one token every TOKEN_S and
+# answering the label followed by a justification, as models often do despite the prompt, and
+# applying the num_predict and stop options. Then
+# checks the strict parsing of the labels and the probabilities computed from the logprobs of
+# chat completions, and tunes the decision threshold on them without any new request.
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from project.llm_models.classification import (
+	CLASSIFICATION_OPTIONS,
+	classify,
+	label_probability,
+	parse_label,
+)
+from project.llm_models.engine import InferenceRequest, OllamaInferenceEngine
+
+PROMPT_S = 0.01
+TOKEN_S = 0.002
+JUSTIFICATION_TOKENS = 80
+REQUESTS_COUNT = 100
+COMPLETIONS_COUNT = 2_000
+
+random.seed(42)
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+	def do_POST(self) -> None:
+		request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+		options = request.get("options") or {}
+		num_predict = options.get("num_predict", -1)
+		response = ""
+		tokens_count = 0
+		for token in ["1", ".", " The"] + [" word"] * JUSTIFICATION_TOKENS:
+			if tokens_count == num_predict:
+				break
+			tokens_count += 1
+			response += token
+			stops = [response.find(stop) for stop in options.get("stop", [])]
+			if any(stop >= 0 for stop in stops):
+				response = response[: min(stop for stop in stops if stop >= 0)]
+				break
+		time.sleep(PROMPT_S + TOKEN_S * tokens_count)
+		content = json.dumps(
+			{"model": request["model"], "response": response, "done": True}
+		).encode("utf-8")
+		self.send_response(200)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(content)))
+		self.end_headers()
+		self.wfile.write(content)
+
+	def log_message(self, *args) -> None:
+		pass
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllamaHandler)
+server.daemon_threads = True
+threading.Thread(target=server.serve_forever, daemon=True).start()
+host = f"http://127.0.0.1:{server.server_address[1]}"
+
+requests = [
+	InferenceRequest(
+		video_id=f"video{i}",
+		model_name="llama3.2",
+		system_prompt="Is it a conspiracy video?",
+		user_prompt=f"video {i}",
+	)
+	for i in range(REQUESTS_COUNT)
+]
+print(f"{REQUESTS_COUNT} requests, {PROMPT_S}s prompt, {TOKEN_S}s per token")
+for label, options in [("unbounded generate", None), ("classification", CLASSIFICATION_OPTIONS)]:
+	engine = OllamaInferenceEngine(host, max_in_flight=1, options=options)
+	results = list(engine.iter_results(requests))
+	milliseconds = sum(r.duration_s for r in results) / len(results) * 1000
+	classifications = [classify(r.response) for r in results]
+	well_formed = sum(c.label is not None for c in classifications)
+	print(f"{label}: {milliseconds:.1f}ms per video, {well_formed} well formed labels")
+	if options is not None:
+		assert all(c.label == 1 and c.probability is None for c in classifications)
+
+for output, label in [
+	("1", 1),
+	("0", 0),
+	(" 1", 1),
+	("`0`", 0),
+	("`1", 1),
+	("1.", None),
+	("10", None),
+	("1 The video", None),
+	("", None),
+	("Yes", None),
+]:
+	assert parse_label(output) == label, output
+
+
+def chat_completion(is_conspiracy_probability: float) -> dict:
+	# A chat completion json with the logprobs of the label token and of its alternatives, a bit
+	# of the probability going to other tokens
+	top_logprobs = [
+		{"token": "1", "logprob": math.log(is_conspiracy_probability * 0.9)},
+		{"token": "0", "logprob": math.log((1 - is_conspiracy_probability) * 0.9)},
+		{"token": "The", "logprob": math.log(0.1)},
+	]
+	top_logprobs.sort(key=lambda alternative: -alternative["logprob"])
+	label_token = top_logprobs[0] if top_logprobs[0]["token"] != "The" else top_logprobs[1]
+	return {
+		"choices": [
+			{
+				"message": {"role": "assistant", "content": label_token["token"]},
+				"logprobs": {"content": [label_token | {"top_logprobs": top_logprobs}]},
+			}
+		]
+	}
+
+
+# Models calibrated so that a video is a conspiracy with the probability they give
+probabilities = [random.betavariate(0.5, 0.5) * 0.98 + 0.01 for _ in range(COMPLETIONS_COUNT)]
+completions = [chat_completion(probability) for probability in probabilities]
+truths = [random.random() < probability for probability in probabilities]
+start = time.perf_counter()
+scores = [label_probability(completion) for completion in completions]
+seconds = time.perf_counter() - start
+assert all(abs(s - p) < 1e-9 for s, p in zip(scores, probabilities))
+labels = [classify(completion).label for completion in completions]
+assert all(label == (score > 0.5) for label, score in zip(labels, scores))
+print(f"probabilities of {COMPLETIONS_COUNT} completions: {seconds * 1000:.1f}ms")
+
+
+def f1(threshold: float) -> float:
+	true_positives = sum(s >= threshold and t for s, t in zip(scores, truths))
+	predicted_positives = sum(s >= threshold for s in scores)
+	positives = sum(truths)
+	return 2 * true_positives / (predicted_positives + positives)
+
+
+best_threshold = max((t / 100 for t in range(1, 100)), key=f1)
+print(f"F1 at threshold 0.5: {f1(0.5):.3f}, at {best_threshold:.2f}: {f1(best_threshold):.3f}")
+
+# Without alternatives the probability is the one of the generated token
+assert (
+	abs(
+		label_probability(
+			{"choices": [{"logprobs": {"content": [{"token": "0", "logprob": math.log(0.8)}]}}]}
+		)
+		- 0.2
+	)
+	< 1e-9
+)
+assert label_probability({"model": "llama3.2", "response": "1", "done": True}) is None
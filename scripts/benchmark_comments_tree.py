@@ -0,0 +1,76 @@
+# Compare the previous quadratic construction of the comment trees with
+# YouTubeComment.from_yt_dlp_comments on synthetic yt-dlp comments, and check that both build the
+# same trees when the replies are one level deep.
+import random
+import time
+
+from project.models import YouTubeComment
+
+COMMENTS_COUNT = 50_000
+ROOT_COMMENTS_COUNT = 5_000
+
+random.seed(42)
+
+
+def quadratic_from_yt_dlp_comments(comments_data):
+	all_comments = [
+		YouTubeComment.from_yt_dlp_comment(comment_data) for comment_data in comments_data
+	]
+	root_comments = [comment for comment in all_comments if comment.parent_id == "root"]
+	for root_comment in root_comments:
+		replies = [comment for comment in all_comments if comment.parent_id == root_comment.id]
+		root_comment.replies = replies
+	return root_comments
+
+
+def yt_dlp_comment(comment_id: str, parent_id: str) -> dict:
+	return {
+		"author_id": f"author-{random.randrange(1000)}",
+		"author_is_uploader": False,
+		"author": "author",
+		"id": comment_id,
+		"is_favorited": False,
+		"is_pinned": False,
+		"like_count": random.randrange(1000),
+		"parent": parent_id,
+		"timestamp": 1_700_000_000 + random.randrange(10**6),
+		"text": "text",
+	}
+
+
+# yt-dlp lists every root comment followed by its replies, reply ids are {parent id}.{reply id}
+replies_counts = [0] * ROOT_COMMENTS_COUNT
+for _ in range(COMMENTS_COUNT - ROOT_COMMENTS_COUNT):
+	replies_counts[int(random.paretovariate(1.2)) % ROOT_COMMENTS_COUNT] += 1
+comments_data = []
+for i, replies_count in enumerate(replies_counts):
+	comments_data.append(yt_dlp_comment(f"c{i}", "root"))
+	comments_data += [yt_dlp_comment(f"c{i}.r{j}", f"c{i}") for j in range(replies_count)]
+
+start = time.perf_counter()
+expected_roots = quadratic_from_yt_dlp_comments(comments_data)
+quadratic_s = time.perf_counter() - start
+
+start = time.perf_counter()
+roots = YouTubeComment.from_yt_dlp_comments(comments_data)
+linear_s = time.perf_counter() - start
+
+assert roots == expected_roots
+print(
+	f"{len(comments_data)} comments, {ROOT_COMMENTS_COUNT} threads: quadratic {quadratic_s:.2f}s, "
+	f"linear {linear_s:.2f}s, speedup {quadratic_s / linear_s:.0f}x"
+)
+
+# Nested replies and orphan replies (parent cut by max_comments), in shuffled order
+nested_comments_data = [
+	yt_dlp_comment("a", "root"),
+	yt_dlp_comment("a.1", "a"),
+	yt_dlp_comment("a.1.1", "a.1"),
+	yt_dlp_comment("b.1", "b"),
+	yt_dlp_comment("c", "root"),
+	yt_dlp_comment("a.2", "a"),
+]
+roots = YouTubeComment.from_yt_dlp_comments(nested_comments_data)
+assert [root.id for root in roots] == ["a", "c"]
+assert [reply.id for reply in roots[0].replies] == ["a.1", "a.2"]
+assert [reply.id for reply in roots[0].replies[0].replies] == ["a.1.1"]
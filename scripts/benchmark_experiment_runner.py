@@ -0,0 +1,117 @@
+# Checkpointing and resume cost of the ExperimentRunner journals compared to the notebook loop,
+# which rewrites the whole experiment json every 50 videos and loads it back to resume. The
+# completions are made up instantly, so only the bookkeeping is measured. The runner is
+# interrupted halfway and resumed, and must complete every video exactly once.
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from project.experiments.models import Experiment
+from project.experiments.runner import ExperimentRunner
+from project.utils import json_utils
+
+VIDEOS_COUNT = 2_000
+MODELS = ["meta-llama/Llama-3.1-8B-Instruct", "mistralai/Mistral-7B-Instruct-v0.2", "llava"]
+SAVE_EVERY_N_VIDEOS = 50
+# An ollama response holds the tokens of the prompt in its context
+CONTEXT_TOKENS = 500
+
+
+@dataclass
+class SyntheticVideo:
+	id: str
+
+	def to_string_for_model_input(self, attributes_to_include: list[str], **kwargs) -> str:
+		return f"video title: {self.id}"
+
+
+class Interrupted(BaseException):
+	"""A crash, e.g. the notebook kernel interrupted."""
+
+
+def complete(model: str, system_prompt: str, user_prompt: str, images_paths: list[str]) -> dict:
+	return {"model": model, "response": "1", "done": True, "context": [1] * CONTEXT_TOKENS}
+
+
+videos = [SyntheticVideo(f"video{i}") for i in range(VIDEOS_COUNT)]
+settings = {
+	"attributes_settings": {},
+	"attributes": ["title"],
+	"description": "benchmark",
+	"image_filename_format": None,
+	"models": MODELS,
+	"system_prompt": "Is it a conspiracy video?",
+}
+print(f"{VIDEOS_COUNT} videos, {len(MODELS)} models")
+
+with tempfile.TemporaryDirectory() as tmp_folder:
+	experiment_path = os.path.join(tmp_folder, "experiment.json")
+	start = time.perf_counter()
+	completions_by_model = {model: {} for model in MODELS}
+	for i, video in enumerate(videos):
+		for model in MODELS:
+			completions_by_model[model][video.id] = complete(model, "", "", [])
+		if (i + 1) % SAVE_EVERY_N_VIDEOS == 0:
+			experiment = Experiment.from_completions(
+				completions_by_model=completions_by_model,
+				end_time=datetime.now(timezone.utc),
+				id="notebook",
+				start_time=datetime.now(timezone.utc),
+				**settings,
+			)
+			with open(experiment_path, "w") as experiment_file:
+				json_utils.dump(experiment, experiment_file)
+	seconds = time.perf_counter() - start
+	print(f"notebook loop, saved every {SAVE_EVERY_N_VIDEOS} videos: {seconds:.2f}s")
+	start = time.perf_counter()
+	with open(experiment_path) as experiment_file:
+		Experiment.from_json(json.load(experiment_file))
+	print(f"notebook loop, resume: {time.perf_counter() - start:.2f}s")
+
+	completed = 0
+
+	def interrupted_complete(*args) -> dict:
+		global completed
+		completed += 1
+		if completed > VIDEOS_COUNT * len(MODELS) // 2:
+			raise Interrupted()
+		return complete(*args)
+
+	start = time.perf_counter()
+	with ExperimentRunner(tmp_folder, id="runner", **settings) as runner:
+		try:
+			runner.run(videos, lambda *args: interrupted_complete(*args), max_in_flight_per_model=1)
+		except Interrupted:
+			pass
+	first_half_seconds = time.perf_counter() - start
+
+	start = time.perf_counter()
+	with ExperimentRunner.resume(tmp_folder, "runner") as runner:
+		resume_seconds = time.perf_counter() - start
+		journaled = sum(len(j.statuses_by_video_id) for j in runner.journals_by_model.values())
+		calls = 0
+
+		def counted_complete(*args) -> dict:
+			global calls
+			calls += 1
+			return complete(*args)
+
+		start = time.perf_counter()
+		runner.run(videos, counted_complete, max_in_flight_per_model=1)
+		second_half_seconds = time.perf_counter() - start
+		experiment = runner.to_experiment()
+
+	print(
+		f"runner, every completion journaled: {first_half_seconds + second_half_seconds:.2f}s, "
+		f"resume: {resume_seconds:.3f}s"
+	)
+	# Only the requests in flight when interrupted are lost
+	assert journaled >= VIDEOS_COUNT * len(MODELS) // 2 - len(MODELS)
+	assert calls == VIDEOS_COUNT * len(MODELS) - journaled
+	for model in MODELS:
+		assert len(experiment.completions_by_model_and_video_id[model]) == VIDEOS_COUNT
+		labels = experiment.predicted_labels_by_model_and_video_id[model].values()
+		assert all(label["is_conspiracy"] for label in labels)
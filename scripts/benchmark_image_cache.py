@@ -0,0 +1,103 @@
+# Payload size and encoding time of the images of multimodal requests: the full quality thumbnails
+# read and base64 encoded on every request (load_image_data_in_chat_format of the
+# explore_hf_mm_models notebook) compared to a PreparedImageCache, preparing them the first run
+# and only reading them back the next ones. The dataset is made of synthetic 1280x720 thumbnails
+# (noisy gradients, so that JPEG compresses them like photos) and a few 1920x1080 frames per video.
+import base64
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from project.llm_models.image_cache import PreparedImageCache
+from project.utils.dataset_utils import generate_thumbnail_path_from_video_id
+
+VIDEOS_COUNT = 50
+FRAMES_PER_VIDEO = 3
+MODELS = ["llava", "meta-llama/Llama-3.2-11B-Vision-Instruct"]
+
+rng = np.random.default_rng(42)
+
+
+def synthetic_image(path: str, width: int, height: int) -> None:
+	x = np.linspace(0, 255, width)[None, :, None]
+	y = np.linspace(0, 255, height)[:, None, None]
+	color = rng.uniform(0.2, 1.0, size=3)[None, None, :]
+	pixels = (x * color + y * (1 - color)) / 2 + rng.normal(0, 12, size=(height, width, 3))
+	Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(path, "JPEG", quality=95)
+
+
+def load_image_data_in_chat_format(image_path: str) -> dict:
+	with open(image_path, "rb") as f:
+		return {
+			"type": "image_url",
+			"image_url": {"url": f"data:image/jpeg;base64,{base64.b64encode(f.read()).decode()}"},
+		}
+
+
+def payload_size(chat_image: dict) -> int:
+	return len(chat_image["image_url"]["url"])
+
+
+with tempfile.TemporaryDirectory() as tmp_folder:
+	dataset_path = os.path.join(tmp_folder, "dataset")
+	os.makedirs(os.path.join(dataset_path, "images"))
+	video_ids = [f"video{i:04d}" for i in range(VIDEOS_COUNT)]
+	for video_id in video_ids:
+		synthetic_image(
+			os.path.join(dataset_path, "images", f"{video_id}_thumbnail.jpg"), 1280, 720
+		)
+		for i in range(FRAMES_PER_VIDEO):
+			synthetic_image(
+				os.path.join(dataset_path, "images", f"{video_id}_frame_{i}.jpg"), 1920, 1080
+			)
+	thumbnails_paths = [
+		generate_thumbnail_path_from_video_id(video_id, dataset_path)[0] for video_id in video_ids
+	]
+	print(f"{VIDEOS_COUNT} videos, {FRAMES_PER_VIDEO} frames per video, models {MODELS}")
+
+	start = time.perf_counter()
+	chat_images = [load_image_data_in_chat_format(path) for path in thumbnails_paths]
+	milliseconds = (time.perf_counter() - start) / len(chat_images) * 1000
+	size = sum(payload_size(chat_image) for chat_image in chat_images) / len(chat_images)
+	print(
+		f"full quality thumbnails: {size / 1024:.0f}KB per request, {milliseconds:.2f}ms per call"
+	)
+
+	cache_folder = os.path.join(tmp_folder, "prepared")
+	for run in ["first run", "re-run"]:
+		with PreparedImageCache(cache_folder) as cache:
+			for model in MODELS:
+				start = time.perf_counter()
+				chat_images = [cache.chat_image(path, model) for path in thumbnails_paths]
+				milliseconds = (time.perf_counter() - start) / len(chat_images) * 1000
+				size = sum(payload_size(chat_image) for chat_image in chat_images) / len(
+					chat_images
+				)
+				print(
+					f"{run}, {model} thumbnails: {size / 1024:.0f}KB per request, "
+					f"{milliseconds:.2f}ms per call"
+				)
+				start = time.perf_counter()
+				images_count = 0
+				for video_id in video_ids:
+					images_paths = cache.video_images_paths(video_id, dataset_path, model)
+					assert len(images_paths) == FRAMES_PER_VIDEO + 1
+					images_count += len(images_paths)
+				milliseconds = (time.perf_counter() - start) / images_count * 1000
+				print(f"{run}, {model} ollama images paths: {milliseconds:.2f}ms per image")
+			print(f"{run}: {cache.prepared} images prepared, {cache.hits} found prepared")
+			if run == "re-run":
+				assert cache.prepared == 0
+
+		# The prepared images fit the model input and decode
+		with PreparedImageCache(cache_folder) as cache:
+			for model in MODELS:
+				spec = cache.image_spec(model)
+				with Image.open(cache.prepared_path(thumbnails_paths[0], model)) as image:
+					assert max(image.size) == spec.max_size, image.size
+				assert base64.b64decode(cache.base64(thumbnails_paths[0], model)) == (
+					cache.prepared_bytes(thumbnails_paths[0], model)
+				)
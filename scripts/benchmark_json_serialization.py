@@ -0,0 +1,193 @@
+# json_utils.dumps and json_utils.dump compared to json.dumps and json.dump with the
+# EnhancedJSONEncoder, on a dataset of videos and on an experiment. The outputs are checked to be
+# identical, tests/test_json_utils.py checks them on random values.
+import dataclasses
+import io
+import json
+import random
+import time
+from datetime import datetime
+from typing import Any
+
+from project.experiments.models import Experiment
+from project.models import YouTubeComment, YouTubeVideoInfo
+from project.utils import json_utils
+from project.utils.json_utils import EnhancedJSONEncoder
+
+VIDEOS_COUNT = 500
+COMMENTS_PER_VIDEO = 200
+REPLIES_PER_COMMENT = 2
+MODELS_COUNT = 5
+WORDS = "the truth about the moon landing they do not want you to know".split()
+
+random.seed(42)
+
+
+@dataclasses.dataclass
+class Message:
+	role: str
+	content: str
+
+
+@dataclasses.dataclass
+class Choice(dict):
+	"""Like the huggingface_hub inference outputs: a dataclass that is also a dict."""
+
+	finish_reason: str
+	index: int
+	message: Message
+
+	def __post_init__(self) -> None:
+		self.update(dataclasses.asdict(self))
+
+
+@dataclasses.dataclass
+class Completion(dict):
+	choices: list[Choice]
+	created: int
+	id: str
+	model: str
+	usage: dict[str, int]
+
+	def __post_init__(self) -> None:
+		self.update(dataclasses.asdict(self))
+
+
+def random_completion(model: str, video_id: str) -> Completion:
+	message = Message(role="assistant", content=random.choice(["0", "1", "I cannot tell."]))
+	return Completion(
+		choices=[Choice(finish_reason="stop", index=0, message=message)],
+		created=1_700_000_000,
+		id=f"{model}-{video_id}",
+		model=model,
+		usage={"completion_tokens": 1, "prompt_tokens": random.randrange(10_000)},
+	)
+
+
+def synthetic_video_json(video_id: str) -> str:
+	comments = []
+	for i in range(COMMENTS_PER_VIDEO):
+		comment_id = f"{video_id}-{i}"
+		replies = [
+			synthetic_comment_json(f"{comment_id}.{j}", comment_id, [])
+			for j in range(REPLIES_PER_COMMENT)
+		]
+		comments.append(synthetic_comment_json(comment_id, "root", replies))
+	return json.dumps(
+		{
+			"auto_subtitles": None,
+			"categories": ["News & Politics"],
+			"channel_id": "UC0",
+			"channel_subscribers": 1000,
+			"channel_title": "Channel",
+			"comment_count": len(comments),
+			"comments": comments,
+			"description": " ".join(random.choices(WORDS, k=200)),
+			"duration_s": 600,
+			"heatmap": [
+				{"end_s": (i + 1) * 6.0, "intensity": random.random(), "start_s": i * 6.0}
+				for i in range(100)
+			],
+			"id": video_id,
+			"like_count": 10,
+			"location_description": None,
+			"location": None,
+			"publish_date": datetime(2024, 1, 1).isoformat(),
+			"subtitles": None,
+			"tags": random.sample(WORDS, 5),
+			"title": " ".join(random.choices(WORDS, k=10)),
+			"view_count": 100,
+		}
+	)
+
+
+def synthetic_comment_json(comment_id: str, parent_id: str, replies: list[dict]) -> dict:
+	return {
+		"author_id": f"UC{random.randrange(1000):022}",
+		"author_is_uploader": False,
+		"author_name": "author",
+		"id": comment_id,
+		"is_favorited": False,
+		"is_pinned": False,
+		"like_count": random.randrange(1000),
+		"parent_id": parent_id,
+		"publish_date": datetime(2024, 1, 1).isoformat(),
+		"replies": replies,
+		"text": " ".join(random.choices(WORDS, k=20)),
+	}
+
+
+def encoder_dump(obj: Any) -> str:
+	file = io.StringIO()
+	json.dump(obj, file, cls=EnhancedJSONEncoder)
+	return file.getvalue()
+
+
+def json_utils_dump(obj: Any) -> str:
+	file = io.StringIO()
+	json_utils.dump(obj, file)
+	return file.getvalue()
+
+
+def build_comments(video: YouTubeVideoInfo, count: int) -> list[YouTubeComment]:
+	"""Build the first count comments of the video, the others stay compact."""
+	return video.comments[:count]
+
+
+def report(label: str, seconds: float, reference_seconds: float) -> None:
+	print(f"{label}: {seconds:.2f}s, {reference_seconds / seconds:.1f}x")
+
+
+videos_json = [synthetic_video_json(f"video{i}") for i in range(VIDEOS_COUNT)]
+
+videos = [YouTubeVideoInfo.from_json(json.loads(video_json)) for video_json in videos_json]
+for video, video_json in zip(videos[:50], videos_json):
+	build_comments(video, 1)
+	assert json_utils.dumps(video) == video_json
+	assert YouTubeVideoInfo.from_json(json.loads(json_utils.dumps(video))) == video
+print("videos loaded back equal")
+
+experiment = Experiment.from_completions(
+	attributes_settings={"max_subtitles_length": 1000},
+	attributes=["title", "description"],
+	completions_by_model={
+		f"model{m}": {
+			f"video{i}": random_completion(f"model{m}", f"video{i}") for i in range(5_000)
+		}
+		for m in range(MODELS_COUNT)
+	},
+	description="benchmark",
+	end_time=datetime(2024, 1, 2),
+	id="benchmark",
+	image_filename_format=None,
+	models=[f"model{m}" for m in range(MODELS_COUNT)],
+	start_time=datetime(2024, 1, 1),
+	system_prompt="Is it a conspiracy video?",
+)
+
+# The videos of a dataset generation, with the comments built as YouTubeComment dataclasses
+built_videos = [YouTubeVideoInfo.from_json(json.loads(video_json)) for video_json in videos_json]
+for video in built_videos:
+	build_comments(video, len(video.comments))
+
+print(
+	f"{VIDEOS_COUNT} videos with {COMMENTS_PER_VIDEO} comments with {REPLIES_PER_COMMENT} replies"
+)
+for label, value in [
+	("dataset, comments not accessed", videos),
+	("dataset, comments built", built_videos),
+	(f"experiment, {MODELS_COUNT}x5000 completions", experiment),
+]:
+	start = time.perf_counter()
+	expected_json = json.dumps(value, cls=EnhancedJSONEncoder)
+	dumps_seconds = time.perf_counter() - start
+	start = time.perf_counter()
+	assert json_utils.dumps(value) == expected_json
+	report(f"{label}, dumps", time.perf_counter() - start, dumps_seconds)
+
+	start = time.perf_counter()
+	assert encoder_dump(value) == expected_json
+	dump_seconds = time.perf_counter() - start
+	start = time.perf_counter()
+	assert json_utils_dump(value) == expected_json
+	report(f"{label}, dump", time.perf_counter() - start, dump_seconds)
@@ -0,0 +1,135 @@
+# Memory held by a dataset loaded with YouTubeVideoInfo.from_json, in bytes per video, compared to
+# plain dataclasses with a __dict__ per instance and no string interning (the previous models).
+import dataclasses
+import gc
+import json
+import random
+import tracemalloc
+from datetime import datetime
+
+from project.models import HeatmapItem, YouTubeComment, YouTubeVideoInfo
+from project.utils.json_utils import EnhancedJSONEncoder
+
+VIDEOS_COUNT = 500
+CHANNELS_COUNT = 50
+AUTHORS_COUNT = 2_000
+COMMENTS_PER_VIDEO = 200
+REPLIES_PER_COMMENT = 2
+HEATMAP_BUCKETS = 100
+WORDS = "the truth about the moon landing they do not want you to know".split()
+
+random.seed(42)
+
+
+def plain_dataclass(cls: type, frozen: bool) -> type:
+	fields = [(f.name, f.type) for f in dataclasses.fields(cls)]
+	return dataclasses.make_dataclass(f"Plain{cls.__name__}", fields, frozen=frozen)
+
+
+PlainHeatmapItem = plain_dataclass(HeatmapItem, frozen=True)
+PlainYouTubeComment = plain_dataclass(YouTubeComment, frozen=False)
+PlainYouTubeVideoInfo = plain_dataclass(YouTubeVideoInfo, frozen=True)
+
+
+def plain_comment_from_json(json_data: dict) -> PlainYouTubeComment:
+	replies = [plain_comment_from_json(reply) for reply in json_data["replies"]]
+	return PlainYouTubeComment(**(json_data | {"replies": replies}))
+
+
+def plain_video_from_json(json_data: dict) -> PlainYouTubeVideoInfo:
+	heatmap = [PlainHeatmapItem(**hmi) for hmi in json_data["heatmap"]]
+	comments = [plain_comment_from_json(comment) for comment in json_data["comments"]]
+	return PlainYouTubeVideoInfo(**(json_data | {"heatmap": heatmap, "comments": comments}))
+
+
+def synthetic_comment_json(comment_id: str, parent_id: str, replies: list[dict]) -> dict:
+	author = random.randrange(AUTHORS_COUNT)
+	return {
+		"author_id": f"UC{author:022}",
+		"author_is_uploader": False,
+		"author_name": f"@author{author}",
+		"id": comment_id,
+		"is_favorited": False,
+		"is_pinned": False,
+		"like_count": random.randrange(1000),
+		"parent_id": parent_id,
+		"publish_date": datetime(2024, 1, 1).isoformat(),
+		"replies": replies,
+		"text": " ".join(random.choices(WORDS, k=20)),
+	}
+
+
+def synthetic_video_json(video_id: str) -> dict:
+	channel = random.randrange(CHANNELS_COUNT)
+	comments = []
+	for i in range(COMMENTS_PER_VIDEO):
+		comment_id = f"{video_id}-{i}"
+		replies = [
+			synthetic_comment_json(f"{comment_id}.{j}", comment_id, [])
+			for j in range(REPLIES_PER_COMMENT)
+		]
+		comments.append(synthetic_comment_json(comment_id, "root", replies))
+	return {
+		"auto_subtitles": None,
+		"categories": ["News & Politics"],
+		"channel_id": f"UC{channel:022}",
+		"channel_subscribers": 1000,
+		"channel_title": f"Channel {channel}",
+		"comment_count": len(comments),
+		"comments": comments,
+		"description": " ".join(random.choices(WORDS, k=200)),
+		"duration_s": 600,
+		"heatmap": [
+			{"end_s": (i + 1) * 6.0, "intensity": random.random(), "start_s": i * 6.0}
+			for i in range(HEATMAP_BUCKETS)
+		],
+		"id": video_id,
+		"like_count": 10,
+		"location_description": None,
+		"location": None,
+		"publish_date": datetime(2024, 1, 1).isoformat(),
+		"subtitles": None,
+		"tags": random.sample(WORDS, 5),
+		"title": " ".join(random.choices(WORDS, k=10)),
+		"view_count": 100,
+	}
+
+
+def access_all_comments(video: YouTubeVideoInfo) -> None:
+	for comment in video.comments:
+		for _ in comment.replies:
+			pass
+
+
+def measure(label: str, load) -> list:
+	gc.collect()
+	tracemalloc.start()
+	videos = [load(json.loads(video_json)) for video_json in videos_json]
+	gc.collect()
+	current, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	print(f"{label}: {current / len(videos):,.0f} bytes per video, peak {peak / 1e6:,.0f}MB")
+	return videos
+
+
+videos_json = [json.dumps(synthetic_video_json(f"video{i}")) for i in range(VIDEOS_COUNT)]
+print(
+	f"{VIDEOS_COUNT} videos, {COMMENTS_PER_VIDEO} comments with {REPLIES_PER_COMMENT} replies "
+	f"and {HEATMAP_BUCKETS} heatmap buckets each"
+)
+
+measure("plain dataclasses", plain_video_from_json)
+measure("slots, interning, comments not accessed", YouTubeVideoInfo.from_json)
+
+
+def load_and_access(json_data: dict) -> YouTubeVideoInfo:
+	video = YouTubeVideoInfo.from_json(json_data)
+	access_all_comments(video)
+	return video
+
+
+videos = measure("slots, interning, all comments accessed", load_and_access)
+
+# Same json once loaded and accessed
+for video, video_json in zip(videos, videos_json):
+	assert json.dumps(video, cls=EnhancedJSONEncoder) == video_json
@@ -0,0 +1,126 @@
+# OllamaInferenceEngine against a local fake Ollama server answering /api/generate after a fixed
+# latency with a fixed number of parallel slots, failing some requests with 503 and leaving some
+# unanswered past the engine timeout. Checks that every video gets exactly one result and that the
+# throughput scales with the requests in flight up to the slots of the server, then that a run
+# with a CompletionCache answered by a previous run sends no request.
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from project.llm_models.completion_cache import CompletionCache
+from project.llm_models.engine import InferenceRequest, OllamaInferenceEngine
+
+SERVER_SLOTS = 4
+LATENCY_S = 0.05
+FAILURE_RATE = 0.05
+HANG_RATE = 0.01
+REQUESTS_COUNT = 400
+
+random.seed(42)
+slots = threading.Semaphore(SERVER_SLOTS)
+received_requests = 0
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+	def do_POST(self) -> None:
+		global received_requests
+		received_requests += 1
+		request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+		if random.random() < FAILURE_RATE:
+			self.respond(503, {"error": "server busy"})
+			return
+		if random.random() < HANG_RATE:
+			time.sleep(1)
+		with slots:
+			time.sleep(LATENCY_S)
+		self.respond(
+			200,
+			{
+				"model": request["model"],
+				"response": "1" if "moon" in request["prompt"] else "0",
+				"done": True,
+				"images": len(request["images"]),
+			},
+		)
+
+	def respond(self, status: int, body: dict) -> None:
+		content = json.dumps(body).encode("utf-8")
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(content)))
+		self.end_headers()
+		try:
+			self.wfile.write(content)
+		except BrokenPipeError:
+			pass  # The engine timed out and closed the connection
+
+	def log_message(self, *args) -> None:
+		pass
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllamaHandler)
+server.daemon_threads = True
+threading.Thread(target=server.serve_forever, daemon=True).start()
+host = f"http://127.0.0.1:{server.server_address[1]}"
+
+requests = [
+	InferenceRequest(
+		video_id=f"video{i}",
+		model_name="llama3.2",
+		system_prompt="Is it a conspiracy video?",
+		user_prompt=f"video {i}: " + random.choice(["the moon landing", "a cooking video"]),
+		images_paths=[__file__] if i % 10 == 0 else None,
+	)
+	for i in range(REQUESTS_COUNT)
+]
+
+print(f"{REQUESTS_COUNT} requests, {SERVER_SLOTS} server slots, {LATENCY_S}s latency")
+for max_in_flight in [1, 2, 4, 8, 16]:
+	engine = OllamaInferenceEngine(
+		host, max_in_flight=max_in_flight, timeout_s=0.5, backoff_s=0.01, max_backoff_s=0.1
+	)
+	start = time.perf_counter()
+	results = list(engine.iter_results(iter(requests)))
+	seconds = time.perf_counter() - start
+
+	assert sorted(r.video_id for r in results) == sorted(r.video_id for r in requests)
+	for result, request in zip(
+		sorted(results, key=lambda r: r.video_id), sorted(requests, key=lambda r: r.video_id)
+	):
+		if result.error is None:
+			assert result.response["response"] == ("1" if "moon" in request.user_prompt else "0")
+			assert result.response["images"] == len(request.images_paths or [])
+	retried = sum(r.attempts > 1 for r in results)
+	failed = sum(r.error is not None for r in results)
+	print(
+		f"max_in_flight {max_in_flight}: {REQUESTS_COUNT / seconds:.0f} requests/s, "
+		f"{retried} retried, {failed} failed"
+	)
+
+# Stopping the iteration early cancels the requests left
+engine = OllamaInferenceEngine(host, max_in_flight=8)
+for i, result in enumerate(engine.iter_results(requests)):
+	if i == 10:
+		break
+
+with tempfile.TemporaryDirectory() as tmp_folder:
+	cache_path = os.path.join(tmp_folder, "completions.jsonl")
+	for run in ["first run", "re-run"]:
+		with CompletionCache(cache_path) as cache:
+			engine = OllamaInferenceEngine(
+				host, max_in_flight=8, timeout_s=0.5, backoff_s=0.01, max_backoff_s=0.1, cache=cache
+			)
+			received_requests = 0
+			start = time.perf_counter()
+			results = list(engine.iter_results(requests))
+			seconds = time.perf_counter() - start
+			assert len(results) == REQUESTS_COUNT
+			print(
+				f"cache, {run}: {REQUESTS_COUNT / seconds:.0f} requests/s, "
+				f"{received_requests} requests received by the server, {cache.stats()}"
+			)
+	assert received_requests == 0
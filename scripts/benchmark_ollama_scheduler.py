@@ -0,0 +1,136 @@
+# OllamaModelScheduler compared to the OllamaInferenceEngine alone on the requests of three models
+# interleaved video by video (as an ExperimentRunner sends them), against a local fake Ollama
+# server with the memory of a single model: a request for another model waits for the requests in
+# flight, then unloads the resident model and loads its own, which takes LOAD_S. An empty prompt
+# only loads the model, or unloads it with keep_alive 0. Checks that every video gets exactly one
+# result, that the scheduler loads every model once, and that a short fairness deadline makes it
+# switch models before their queues are drained.
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from project.llm_models.engine import InferenceRequest, OllamaInferenceEngine
+from project.llm_models.scheduler import OllamaModelScheduler
+
+SERVER_SLOTS = 4
+LATENCY_S = 0.02
+LOAD_S = 0.1
+MODELS = ["llama3.2", "llama3.2-vision", "llava"]
+VIDEOS_COUNT = 40
+
+random.seed(42)
+slots = threading.Semaphore(SERVER_SLOTS)
+memory = threading.Condition()
+resident_model = None
+running_requests = 0
+loads = 0
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+	def do_POST(self) -> None:
+		global resident_model, running_requests, loads
+		request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+		model = request["model"]
+		with memory:
+			if request.get("keep_alive") == 0 and not request.get("prompt"):
+				memory.wait_for(lambda: resident_model != model or running_requests == 0)
+				if resident_model == model:
+					resident_model = None
+				self.respond({"model": model, "response": "", "done": True})
+				return
+			memory.wait_for(lambda: resident_model == model or running_requests == 0)
+			if resident_model != model:
+				time.sleep(LOAD_S)
+				resident_model = model
+				loads += 1
+			running_requests += 1
+		try:
+			if request.get("prompt"):
+				with slots:
+					time.sleep(LATENCY_S)
+		finally:
+			with memory:
+				running_requests -= 1
+				memory.notify_all()
+		self.respond(
+			{"model": model, "response": "1" if request.get("prompt") else "", "done": True}
+		)
+
+	def respond(self, body: dict) -> None:
+		content = json.dumps(body).encode("utf-8")
+		self.send_response(200)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(content)))
+		self.end_headers()
+		try:
+			self.wfile.write(content)
+		except BrokenPipeError:
+			pass
+
+	def log_message(self, *args) -> None:
+		pass
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllamaHandler)
+server.daemon_threads = True
+threading.Thread(target=server.serve_forever, daemon=True).start()
+host = f"http://127.0.0.1:{server.server_address[1]}"
+
+requests = [
+	InferenceRequest(
+		video_id=f"video{i}",
+		model_name=model,
+		system_prompt="Is it a conspiracy video?",
+		user_prompt=f"video {i}",
+	)
+	for i in range(VIDEOS_COUNT)
+	for model in MODELS
+]
+
+
+def check(results: list) -> None:
+	assert sorted((r.model_name, r.video_id) for r in results) == sorted(
+		(r.model_name, r.video_id) for r in requests
+	)
+	assert all(r.error is None and r.response["response"] == "1" for r in results)
+
+
+print(
+	f"{len(requests)} requests of {len(MODELS)} models, {SERVER_SLOTS} server slots, "
+	f"{LATENCY_S}s latency, {LOAD_S}s to load a model"
+)
+engine = OllamaInferenceEngine(host, max_in_flight=SERVER_SLOTS)
+start = time.perf_counter()
+results = list(engine.iter_results(requests))
+seconds = time.perf_counter() - start
+check(results)
+print(f"engine alone: {seconds:.2f}s, {loads} model loads")
+
+for max_residency_s in [600.0, 0.05]:
+	loads = 0
+	resident_model = None
+	scheduler = OllamaModelScheduler(engine, max_residency_s=max_residency_s)
+	start = time.perf_counter()
+	results = list(scheduler.iter_results(requests))
+	seconds = time.perf_counter() - start
+	check(results)
+	print(f"scheduler, {max_residency_s}s fairness deadline: {seconds:.2f}s, {loads} model loads")
+	for model, stats in scheduler.stats.items():
+		print(
+			f"  {model}: {stats.loads} loads taking {stats.load_s:.2f}s, {stats.requests} requests "
+			f"taking {stats.inference_s:.2f}s"
+		)
+	if max_residency_s > seconds:
+		assert loads == len(MODELS)
+		assert all(stats.loads == 1 for stats in scheduler.stats.values())
+	else:
+		assert loads > len(MODELS)
+	assert loads == sum(stats.loads for stats in scheduler.stats.values())
+
+# Stopping the iteration early cancels the requests left
+scheduler = OllamaModelScheduler(engine)
+for i, result in enumerate(scheduler.iter_results(requests)):
+	if i == 10:
+		break
@@ -0,0 +1,133 @@
+# TokenBudgetPromptBuilder compared to the hand tuned settings of the notebooks on videos with
+# transcripts and comments of very different lengths: how many prompts exceed the 4096 tokens
+# input limit (rejected requests) and how much of the budget the prompts that fit use. The token
+# counts come from a regex tokenizer standing in for the tokenizer of the model, whitespace runs
+# are tokens so that the parts tokenized together take fewer tokens than apart.
+import random
+import re
+import time
+from datetime import datetime, timedelta
+
+import srt
+
+from project.llm_models.prompt_builder import TokenBudgetPromptBuilder
+from project.models import YouTubeComment, YouTubeVideoInfo
+
+VIDEOS_COUNT = 300
+MAX_TOKENS = 4096 - 100  # max_new_tokens of the notebooks
+ATTRIBUTES = [
+	"channel_title",
+	"title",
+	"description",
+	"categories",
+	"tags",
+	"subtitles",
+	"auto_subtitles",
+	"comments",
+]
+HAND_TUNED_SETTINGS = {"max_subtitles_length": 1000, "max_comments": 5}
+WORDS = "the truth about the moon landing they do not want you to know".split()
+
+random.seed(42)
+tokens_pattern = re.compile(r"\w+|\s+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+	return len(tokens_pattern.findall(text))
+
+
+def sentence(words_count: int) -> str:
+	return " ".join(random.choice(WORDS) for _ in range(words_count))
+
+
+def synthetic_comment(comment_id: str, replies: list[YouTubeComment]) -> YouTubeComment:
+	return YouTubeComment(
+		author_id="author",
+		author_is_uploader=False,
+		author_name="author",
+		id=comment_id,
+		is_favorited=False,
+		is_pinned=False,
+		like_count=0,
+		parent_id="root",
+		publish_date=datetime(2024, 1, 1),
+		replies=replies,
+		text=sentence(random.randrange(5, 60)),
+	)
+
+
+def synthetic_video(video_id: str) -> YouTubeVideoInfo:
+	captions_count = random.choice([0, 20, 200, 2000])
+	captions = srt.compose(
+		srt.Subtitle(i, timedelta(seconds=i), timedelta(seconds=i + 1), sentence(8))
+		for i in range(captions_count)
+	)
+	comments = [
+		synthetic_comment(
+			f"{video_id}-{i}",
+			[synthetic_comment(f"{video_id}-{i}.{j}", []) for j in range(random.randrange(20))],
+		)
+		for i in range(random.choice([0, 3, 30, 300]))
+	]
+	return YouTubeVideoInfo(
+		auto_subtitles=captions if captions_count else None,
+		categories=["News & Politics"],
+		channel_id="channel",
+		channel_subscribers=1000,
+		channel_title="channel",
+		comment_count=len(comments),
+		comments=comments,
+		description=sentence(random.choice([10, 100, 1000])),
+		duration_s=captions_count,
+		heatmap=None,
+		id=video_id,
+		like_count=10,
+		location_description=None,
+		location=None,
+		publish_date=datetime(2024, 1, 1),
+		subtitles=None,
+		tags=WORDS,
+		title=sentence(10),
+		view_count=100,
+	)
+
+
+videos = [synthetic_video(f"video{i}") for i in range(VIDEOS_COUNT)]
+
+
+def report(label: str, prompts_tokens: list[int], seconds: float) -> None:
+	fitting = [tokens for tokens in prompts_tokens if tokens <= MAX_TOKENS]
+	print(
+		f"{label}: {len(prompts_tokens) - len(fitting)} over the limit, fitting prompts use "
+		f"{sum(fitting) / len(fitting) / MAX_TOKENS:.0%} of the budget on average, "
+		f"{seconds / len(prompts_tokens) * 1000:.1f}ms per video"
+	)
+
+
+print(f"{VIDEOS_COUNT} videos, {MAX_TOKENS} tokens budget")
+start = time.perf_counter()
+prompts = [v.to_string_for_model_input(ATTRIBUTES, **HAND_TUNED_SETTINGS) for v in videos]
+report("hand tuned settings", [count_tokens(p) for p in prompts], time.perf_counter() - start)
+
+builder = TokenBudgetPromptBuilder(count_tokens, ATTRIBUTES)
+start = time.perf_counter()
+prompts_with_settings = [builder.build_with_settings(v, MAX_TOKENS) for v in videos]
+seconds = time.perf_counter() - start
+report("prompt builder", [count_tokens(p) for p, _ in prompts_with_settings], seconds)
+hit_rate = builder.cache_hits / (builder.cache_hits + builder.cache_misses)
+print(f"prompt builder: {hit_rate:.0%} of the token counts cached")
+
+# The prompts are the largest: one more character or comment of the first truncated attribute
+# does not fit, or does not add a token (the character extends the last word)
+not_largest = 0
+for video, (prompt, settings) in zip(videos, prompts_with_settings):
+	assert count_tokens(prompt) <= MAX_TOKENS
+	for setting in ["max_description_length", "max_subtitles_length", "max_comments"]:
+		larger_prompt = video.to_string_for_model_input(
+			ATTRIBUTES, **(settings | {setting: settings[setting] + 1})
+		)
+		if larger_prompt != prompt:
+			if count_tokens(prompt) < count_tokens(larger_prompt) <= MAX_TOKENS:
+				not_largest += 1
+			break
+print(f"prompt builder: {not_largest} prompts could take one more character or comment")
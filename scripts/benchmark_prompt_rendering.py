@@ -0,0 +1,124 @@
+# Bulk prompt rendering throughput: rendering every prompt with to_string_for_model_input compared
+# to rendering them once in a RenderedPromptStore and reading them back in later runs.
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import srt
+
+from project.dataset.rendered_prompts import RenderedPromptStore
+from project.models import YouTubeComment, YouTubeVideoInfo
+
+VIDEOS_COUNT = 2_000
+COMMENTS_PER_VIDEO = 200
+CAPTIONS_PER_VIDEO = 600
+ATTRIBUTES = [
+	"channel_title",
+	"title",
+	"description",
+	"categories",
+	"tags",
+	"subtitles",
+	"auto_subtitles",
+	"comments",
+]
+ATTRIBUTES_SETTINGS = {"max_subtitles_length": 1000, "include_comments_replies": True}
+WORDS = "the truth about the moon landing they do not want you to know".split()
+
+random.seed(42)
+
+
+def sentence(words_count: int) -> str:
+	return " ".join(random.choice(WORDS) for _ in range(words_count))
+
+
+def synthetic_comment(comment_id: str, replies: list[YouTubeComment]) -> YouTubeComment:
+	return YouTubeComment(
+		author_id="author",
+		author_is_uploader=False,
+		author_name="author",
+		id=comment_id,
+		is_favorited=False,
+		is_pinned=False,
+		like_count=random.randrange(1000),
+		parent_id="root",
+		publish_date=datetime(2024, 1, 1),
+		replies=replies,
+		text=sentence(20),
+	)
+
+
+def synthetic_video(video_id: str) -> YouTubeVideoInfo:
+	captions = srt.compose(
+		srt.Subtitle(i, timedelta(seconds=i), timedelta(seconds=i + 1), sentence(8))
+		for i in range(CAPTIONS_PER_VIDEO)
+	)
+	comments = [
+		synthetic_comment(f"{video_id}-{i}", [synthetic_comment(f"{video_id}-{i}.1", [])])
+		for i in range(COMMENTS_PER_VIDEO // 2)
+	]
+	return YouTubeVideoInfo(
+		auto_subtitles=captions,
+		categories=["News & Politics"],
+		channel_id="channel",
+		channel_subscribers=1000,
+		channel_title="channel",
+		comment_count=len(comments),
+		comments=comments,
+		description=sentence(200),
+		duration_s=CAPTIONS_PER_VIDEO,
+		heatmap=None,
+		id=video_id,
+		like_count=10,
+		location_description=None,
+		location=None,
+		publish_date=datetime(2024, 1, 1),
+		subtitles=None,
+		tags=WORDS,
+		title=sentence(10),
+		view_count=100,
+	)
+
+
+videos = [synthetic_video(f"video{i}") for i in range(VIDEOS_COUNT)]
+
+
+def report(label: str, seconds: float) -> None:
+	print(f"{label}: {seconds:.2f}s, {VIDEOS_COUNT / seconds:.0f} videos/s")
+
+
+start = time.perf_counter()
+expected_prompts = {
+	v.id: v.to_string_for_model_input(ATTRIBUTES, **ATTRIBUTES_SETTINGS) for v in videos
+}
+report("to_string_for_model_input", time.perf_counter() - start)
+
+start = time.perf_counter()
+for v in videos:
+	v.to_string_for_model_input(ATTRIBUTES, **ATTRIBUTES_SETTINGS)
+report("to_string_for_model_input, transcripts cached", time.perf_counter() - start)
+
+with tempfile.TemporaryDirectory() as tmp_folder:
+	with RenderedPromptStore(tmp_folder, ATTRIBUTES, ATTRIBUTES_SETTINGS) as prompt_store:
+		start = time.perf_counter()
+		prompt_store.render_all(videos)
+		report("render_all", time.perf_counter() - start)
+
+	# A later run (another model, a resume, a notebook) with the settings written differently
+	settings = ATTRIBUTES_SETTINGS | {"max_comments": -1}
+	with RenderedPromptStore(tmp_folder, ATTRIBUTES, settings, VIDEOS_COUNT) as prompt_store:
+		start = time.perf_counter()
+		prompts = dict(prompt_store.items())
+		report("items, new run", time.perf_counter() - start)
+		assert prompts == expected_prompts
+
+		start = time.perf_counter()
+		for v in random.sample(videos, len(videos)):
+			assert prompt_store.get(v) == expected_prompts[v.id]
+		report("get in random order, from disk", time.perf_counter() - start)
+
+		start = time.perf_counter()
+		for v in random.sample(videos, len(videos)):
+			prompt_store.get(v)
+		report("get in random order, from memory", time.perf_counter() - start)
@@ -0,0 +1,183 @@
+# Videos per second of the fine-tuned RoBERTa classifier on CPU: the notebook pipeline (one video
+# at a time) compared to RobertaClassifier batches, padded to the longest text of a batch of
+# videos in their order or sorted by length, with every backend. The videos are read from a
+# videos_infos.json of the in-the-wild 10k set (a synthetic one of the same format if missing)
+# and the checkpoint is the best model of notebooks/roberta_basemodel.ipynb (randomly initialized
+# weights of the same shape if missing, the throughput does not depend on them). The tokenizer is
+# roberta-base, or a byte-level BPE of the same kind trained on the texts if the hub cannot be
+# reached. Checks that the backends agree with the torch scores.
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import srt
+from tokenizers import ByteLevelBPETokenizer
+from transformers import (
+	RobertaConfig,
+	RobertaForSequenceClassification,
+	RobertaTokenizer,
+	pipeline,
+)
+
+from project.classifiers.roberta import (
+	DEFAULT_ATTRIBUTES,
+	DEFAULT_ATTRIBUTES_SETTINGS,
+	DEFAULT_TOKENIZER,
+	MAX_INPUT_LENGTH,
+	ONNX_BACKEND,
+	QUANTIZED_BACKEND,
+	TORCH_BACKEND,
+	RobertaClassifier,
+)
+from project.dataset.reader import VideoDataset
+from project.models import YouTubeComment, YouTubeVideoInfo
+from project.utils import json_utils
+
+DATASET_PATH = "data/youtube-common-10k/videos_infos.json"
+CHECKPOINT_PATH = "models/roberta/best_model"
+VIDEOS_COUNT = 10_000
+NOTEBOOK_PIPELINE_VIDEOS = 200
+BATCH_SIZE = 32
+THREADS = os.cpu_count()
+WORDS = "the truth about the moon landing they do not want you to know".split()
+
+random.seed(42)
+
+
+def sentence(words_count: int) -> str:
+	return " ".join(random.choice(WORDS) for _ in range(words_count))
+
+
+def synthetic_video(video_id: str) -> YouTubeVideoInfo:
+	# Lengths as different as in the wild: no transcript or a long one, no comments or many
+	captions_count = random.choice([0, 0, 30, 300])
+	captions = srt.compose(
+		srt.Subtitle(i, timedelta(seconds=i), timedelta(seconds=i + 1), sentence(8))
+		for i in range(captions_count)
+	)
+	comments = [
+		YouTubeComment(
+			author_id="author",
+			author_is_uploader=False,
+			author_name="author",
+			id=f"{video_id}-{i}",
+			is_favorited=False,
+			is_pinned=False,
+			like_count=0,
+			parent_id="root",
+			publish_date=datetime(2024, 1, 1),
+			replies=[],
+			text=sentence(random.randrange(5, 40)),
+		)
+		for i in range(random.choice([0, 0, 5, 50]))
+	]
+	return YouTubeVideoInfo(
+		auto_subtitles=captions if captions_count else None,
+		categories=["News & Politics"],
+		channel_id="channel",
+		channel_subscribers=1000,
+		channel_title="channel",
+		comment_count=len(comments),
+		comments=comments,
+		description=sentence(random.choice([5, 50, 300])),
+		duration_s=captions_count,
+		heatmap=None,
+		id=video_id,
+		like_count=10,
+		location_description=None,
+		location=None,
+		publish_date=datetime(2024, 1, 1),
+		subtitles=None,
+		tags=WORDS,
+		title=sentence(10),
+		view_count=100,
+	)
+
+
+def local_tokenizer(texts: list[str], folder: str) -> str:
+	"""A byte-level BPE tokenizer with the special tokens of roberta-base, trained on the texts."""
+	os.makedirs(folder, exist_ok=True)
+	bpe = ByteLevelBPETokenizer()
+	bpe.train_from_iterator(
+		texts, vocab_size=1000, special_tokens=["<s>", "<pad>", "</s>", "<unk>", "<mask>"]
+	)
+	bpe.save_model(folder)
+	RobertaTokenizer(
+		os.path.join(folder, "vocab.json"), os.path.join(folder, "merges.txt")
+	).save_pretrained(folder)
+	return folder
+
+
+with tempfile.TemporaryDirectory() as tmp_folder:
+	dataset_path = DATASET_PATH
+	if not os.path.exists(dataset_path):
+		dataset_path = os.path.join(tmp_folder, "videos_infos.json")
+		with open(dataset_path, "w") as dataset_file:
+			json_utils.dump(
+				[synthetic_video(f"video{i}") for i in range(VIDEOS_COUNT)], dataset_file
+			)
+	checkpoint_path = CHECKPOINT_PATH
+	if not os.path.exists(checkpoint_path):
+		checkpoint_path = os.path.join(tmp_folder, "best_model")
+		config = RobertaConfig(max_position_embeddings=514, type_vocab_size=1, num_labels=2)
+		RobertaForSequenceClassification(config).save_pretrained(checkpoint_path)
+
+	videos = list(VideoDataset(dataset_path))
+	texts = [
+		v.to_string_for_model_input(DEFAULT_ATTRIBUTES, **DEFAULT_ATTRIBUTES_SETTINGS)
+		for v in videos
+	]
+	tokenizer = DEFAULT_TOKENIZER
+	try:
+		RobertaTokenizer.from_pretrained(tokenizer)
+	except OSError:
+		tokenizer = local_tokenizer(texts, os.path.join(tmp_folder, "tokenizer"))
+	print(
+		f"{len(videos)} videos, {THREADS} threads, batches of {BATCH_SIZE}, {tokenizer} tokenizer"
+	)
+
+	evaluation_pipeline = pipeline(
+		"text-classification",
+		model=RobertaForSequenceClassification.from_pretrained(checkpoint_path),
+		tokenizer=RobertaTokenizer.from_pretrained(tokenizer),
+	)
+	start = time.perf_counter()
+	for text in texts[:NOTEBOOK_PIPELINE_VIDEOS]:
+		evaluation_pipeline(text, truncation=True, padding=True, max_length=MAX_INPUT_LENGTH)
+	seconds = time.perf_counter() - start
+	print(f"notebook pipeline: {NOTEBOOK_PIPELINE_VIDEOS / seconds:.1f} videos/s")
+
+	scores_by_configuration = {}
+	for label, backend, sort_window_batches in [
+		("torch, batches in order", TORCH_BACKEND, 1),
+		("torch, batches sorted by length", TORCH_BACKEND, 32),
+		("int8 dynamic quantization, sorted", QUANTIZED_BACKEND, 32),
+		("onnx, sorted", ONNX_BACKEND, 32),
+	]:
+		try:
+			classifier = RobertaClassifier(
+				checkpoint_path,
+				backend=backend,
+				batch_size=BATCH_SIZE,
+				threads=THREADS,
+				tokenizer=tokenizer,
+				sort_window_batches=sort_window_batches,
+			)
+		except ImportError as exception:
+			print(f"{label}: skipped, {exception}")
+			continue
+		start = time.perf_counter()
+		scores = dict(classifier.score_videos(videos))
+		seconds = time.perf_counter() - start
+		assert list(scores) == [v.id for v in videos]
+		scores_by_configuration[label] = scores
+		print(f"{label}: {len(videos) / seconds:.1f} videos/s")
+
+	reference = scores_by_configuration["torch, batches in order"]
+	for label, scores in scores_by_configuration.items():
+		max_difference = max(abs(scores[video_id] - reference[video_id]) for video_id in reference)
+		print(f"{label}: largest score difference with torch {max_difference:.2e}")
+		tolerance = 0.05 if "quantization" in label else 1e-4
+		assert max_difference < tolerance, label
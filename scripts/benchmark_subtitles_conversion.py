@@ -0,0 +1,119 @@
+# Compare the in-process subtitles conversion with the ffmpeg one on synthetic YouTube automatic
+# captions (rolling two-line cues with per-word timestamps), and check that both produce the same
+# cues. The same captions are also written as json3 and srv3 to check that the three parsers agree.
+import json
+import os
+import random
+import tempfile
+import time
+from xml.sax.saxutils import escape
+
+import srt
+from yt_dlp.postprocessor.ffmpeg import FFmpegSubtitlesConvertorPP
+
+from project.utils.subtitles_utils import convert_subtitles_file_to_srt, format_srt_timestamp
+
+VIDEOS_COUNT = 20
+VIDEO_DURATION_S = 600
+WORDS = ["the", "truth", "about", "we're", "moon", "&", "landing", "they", "don't", "<want>", "you"]
+
+random.seed(42)
+
+
+def vtt_timestamp(milliseconds: int) -> str:
+	return format_srt_timestamp(milliseconds).replace(",", ".")
+
+
+def generate_captions() -> list[tuple[int, int, list[tuple[int, str]]]]:
+	"""(start ms, end ms, [(word offset ms, word)]) lines of captions."""
+	captions = []
+	start = 0
+	while start < VIDEO_DURATION_S * 1000:
+		duration = random.randint(1500, 4000)
+		words = [(i * duration // 8, random.choice(WORDS)) for i in range(random.randint(3, 8))]
+		captions.append((start, start + duration, words))
+		start += duration
+	return captions
+
+
+def write_vtt(captions, file_path: str) -> None:
+	with open(file_path, "w") as file:
+		file.write("WEBVTT\nKind: captions\nLanguage: en\n\n")
+		previous_line = " "
+		for start, end, words in captions:
+			line = escape(words[0][1]) + "".join(
+				f"<{vtt_timestamp(start + offset)}><c> {escape(word)}</c>"
+				for offset, word in words[1:]
+			)
+			file.write(f"{vtt_timestamp(start)} --> {vtt_timestamp(end)} align:start position:0%\n")
+			file.write(f"{previous_line}\n{line}\n\n")
+			previous_line = escape(" ".join(word for _, word in words))
+
+
+def write_json3(captions, file_path: str) -> None:
+	events = []
+	previous_line = None
+	for start, end, words in captions:
+		segs = [{"utf8": words[0][1]}]
+		segs += [{"utf8": f" {word}", "tOffsetMs": offset} for offset, word in words[1:]]
+		if previous_line is not None:
+			segs.insert(0, {"utf8": f"{previous_line}\n"})
+		events.append({"tStartMs": start, "dDurationMs": end - start, "segs": segs})
+		previous_line = " ".join(word for _, word in words)
+	with open(file_path, "w") as file:
+		json.dump({"wireMagic": "pb3", "events": events}, file)
+
+
+def write_srv3(captions, file_path: str) -> None:
+	with open(file_path, "w") as file:
+		file.write('<?xml version="1.0" encoding="utf-8" ?><timedtext format="3"><body>\n')
+		previous_line = None
+		for start, end, words in captions:
+			text = f"{escape(previous_line)}\n" if previous_line is not None else ""
+			text += f"<s>{escape(words[0][1])}</s>"
+			text += "".join(f'<s t="{offset}"> {escape(word)}</s>' for offset, word in words[1:])
+			file.write(f'<p t="{start}" d="{end - start}" w="1">{text}</p>\n')
+			previous_line = " ".join(word for _, word in words)
+		file.write("</body></timedtext>\n")
+
+
+def normalized_cues(srt_path: str) -> list[tuple]:
+	with open(srt_path, "r", encoding="utf-8") as file:
+		subtitles = srt.parse(file.read())
+	# ffmpeg writes \r before the line breaks and keeps the blank first line of the cues
+	return sorted((sub.start, sub.end, " ".join(sub.content.split())) for sub in subtitles)
+
+
+ffmpeg_convertor = FFmpegSubtitlesConvertorPP()
+with tempfile.TemporaryDirectory() as tmp_folder:
+	vtt_paths = []
+	for i in range(VIDEOS_COUNT):
+		captions = generate_captions()
+		vtt_paths.append(os.path.join(tmp_folder, f"video{i}.vtt"))
+		write_vtt(captions, vtt_paths[-1])
+		write_json3(captions, os.path.join(tmp_folder, f"video{i}.json3"))
+		write_srv3(captions, os.path.join(tmp_folder, f"video{i}.srv3"))
+
+	start = time.perf_counter()
+	for vtt_path in vtt_paths:
+		ffmpeg_convertor.run_ffmpeg(vtt_path, vtt_path + ".ffmpeg.srt", ["-f", "srt"])
+	ffmpeg_s = time.perf_counter() - start
+
+	native_s = {}
+	for subtitles_format in ["vtt", "json3", "srv3"]:
+		start = time.perf_counter()
+		for vtt_path in vtt_paths:
+			subtitles_path = vtt_path.replace(".vtt", f".{subtitles_format}")
+			convert_subtitles_file_to_srt(subtitles_path, subtitles_path + ".srt")
+		native_s[subtitles_format] = time.perf_counter() - start
+
+	for vtt_path in vtt_paths:
+		expected_cues = normalized_cues(vtt_path + ".ffmpeg.srt")
+		for subtitles_format in ["vtt", "json3", "srv3"]:
+			srt_path = vtt_path.replace(".vtt", f".{subtitles_format}") + ".srt"
+			assert normalized_cues(srt_path) == expected_cues, f"{srt_path} differs from ffmpeg"
+
+	print(f"{VIDEOS_COUNT} files of {VIDEO_DURATION_S}s captions, same cues as ffmpeg")
+	print(f"ffmpeg vtt: {ffmpeg_s:.2f}s")
+	for subtitles_format, seconds in native_s.items():
+		print(f"in-process {subtitles_format}: {seconds:.2f}s, speedup {ffmpeg_s / seconds:.1f}x")
@@ -0,0 +1,67 @@
+# transcode_folder compared to the serial loop of the former convert_webp_to_jpg.py on synthetic
+# 1280x720 webp thumbnails: the first run with 1 to all the cores, then a second run that must
+# skip every thumbnail, then a thumbnail downloaded again with a different content that must be
+# transcoded again.
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from project.utils.image_utils import jpeg_path_of, transcode_folder
+
+THUMBNAILS_COUNT = 200
+
+rng = np.random.default_rng(42)
+
+
+def synthetic_thumbnail(path: str) -> None:
+	x = np.linspace(0, 255, 1280)[None, :, None]
+	y = np.linspace(0, 255, 720)[:, None, None]
+	color = rng.uniform(0.2, 1.0, size=3)[None, None, :]
+	pixels = (x * color + y * (1 - color)) / 2 + rng.normal(0, 12, size=(720, 1280, 3))
+	Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(path, "WEBP")
+
+
+def serial_convert(folder: str) -> None:
+	# The loop of convert_webp_to_jpg.py, without its prints
+	for filename in os.listdir(folder):
+		if filename.lower().endswith(".webp"):
+			webp_path = os.path.join(folder, filename)
+			with Image.open(webp_path) as img:
+				img.convert("RGB").save(os.path.splitext(webp_path)[0] + ".jpg", "JPEG")
+
+
+with tempfile.TemporaryDirectory() as folder:
+	for i in range(THUMBNAILS_COUNT):
+		synthetic_thumbnail(os.path.join(folder, f"video{i:04d}_thumbnail.webp"))
+	print(f"{THUMBNAILS_COUNT} thumbnails, {os.cpu_count()} cores")
+
+	start = time.perf_counter()
+	serial_convert(folder)
+	seconds = time.perf_counter() - start
+	print(f"serial loop: {seconds:.2f}s, {THUMBNAILS_COUNT / seconds:.0f} images/s")
+
+	for workers in sorted({1, 2, 4, os.cpu_count()}):
+		for filename in os.listdir(folder):
+			if filename.endswith(".jpg"):
+				os.remove(os.path.join(folder, filename))
+		stats = transcode_folder(folder, workers)
+		assert stats.transcoded == THUMBNAILS_COUNT and stats.failed == 0
+		print(
+			f"transcode_folder, {workers} workers: {stats.seconds:.2f}s, "
+			f"{stats.images_per_s:.0f} images/s"
+		)
+
+	stats = transcode_folder(folder)
+	assert stats.skipped == THUMBNAILS_COUNT
+	print(f"transcode_folder, second run: {stats.seconds:.2f}s, {stats.images_per_s:.0f} images/s")
+
+	# A thumbnail downloaded again
+	thumbnail_path = os.path.join(folder, "video0000_thumbnail.webp")
+	synthetic_thumbnail(thumbnail_path)
+	stats = transcode_folder(folder)
+	assert stats.transcoded == 1 and stats.skipped == THUMBNAILS_COUNT - 1
+	with Image.open(jpeg_path_of(thumbnail_path)) as jpeg, Image.open(thumbnail_path) as webp:
+		assert jpeg.size == webp.size
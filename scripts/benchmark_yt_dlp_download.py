@@ -0,0 +1,127 @@
+# download_video_and_metadata compared to the flow it replaced, on videos served over HTTP by a
+# local server: a new YoutubeDL per video extracting the info, then a second YoutubeDL with
+# writeautomaticsub processing the extracted info again for the automatic subtitles. The single
+# extraction is timed with a new YoutubeDL per video and with a YoutubeDLPool, to separate the
+# saving of the second pass from the one of the pool. The flows write the metadata only (as
+# generate_dataset_from_video_ids without frames), then download the videos too, and must write
+# the same files. The served videos have no subtitles: only the yt-dlp passes are timed, not the
+# subtitles conversion.
+import contextlib
+import glob
+import io
+import os
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import ffmpeg
+import yt_dlp
+
+import project.utils.yt_dlp_utils as yt_dlp_utils
+from project.dataset_generation.yt_dlp_download import (
+	YoutubeDLPool,
+	_ydl_options,
+	download_video_and_metadata,
+)
+
+VIDEOS_COUNT = 20
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+	def log_message(self, *args) -> None:
+		pass
+
+
+def two_extractions_download(
+	video_id: str, download_folder: str, download_video: bool, video_url: str
+) -> dict:
+	# The former download_video_and_metadata, with the options of the current one (metadata only
+	# is its skip_video_download)
+	ydl_opts = _ydl_options(download_folder, download_video, None, False)
+	with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+		video_info = ydl.extract_info(video_url)
+	auto_subs_opts = {
+		"outtmpl": f"{download_folder}/%(id)s.auto-subs.%(ext)s",
+		"writesubtitles": True,
+		"writeautomaticsub": True,
+		"subtitleslangs": ["en"],
+		"skip_download": True,
+		"subtitlesformat": "srt",
+		"postprocessors": [{"key": "FFmpegSubtitlesConvertor", "format": "srt"}],
+	}
+	with yt_dlp.YoutubeDL(auto_subs_opts) as ydl:
+		ydl.process_ie_result(video_info)
+		auto_subs_paths = glob.glob(f"{download_folder}/{video_id}.auto-subs.en.*")
+		if auto_subs_paths:
+			yt_dlp_utils.convert_subtitles_to_srt(
+				auto_subs_paths[0], f"{download_folder}/{video_id}.auto-subs.en.srt"
+			)
+	return video_info
+
+
+def single_extraction_download(
+	video_id: str,
+	download_folder: str,
+	download_video: bool,
+	video_url: str,
+	ydl_pool: YoutubeDLPool | None = None,
+) -> dict:
+	return download_video_and_metadata(
+		video_id, download_folder, download_video, video_url=video_url, ydl_pool=ydl_pool
+	)
+
+
+def run(download, download_folder: str, download_video: bool, host: str, **kwargs) -> float:
+	start = time.perf_counter()
+	# Without the yt-dlp progress and the timings printed for every video
+	with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+		for i in range(VIDEOS_COUNT):
+			video_info = download(
+				f"video{i}", download_folder, download_video, f"{host}/video{i}.mp4", **kwargs
+			)
+			assert video_info["id"] == f"video{i}"
+	return time.perf_counter() - start
+
+
+with tempfile.TemporaryDirectory() as folder:
+	served_folder = os.path.join(folder, "served")
+	os.makedirs(served_folder)
+	ffmpeg.input("testsrc=duration=5:size=320x240:rate=25", f="lavfi").output(
+		os.path.join(served_folder, "video0.mp4"), pix_fmt="yuv420p"
+	).run(capture_stdout=True, capture_stderr=True)
+	for i in range(1, VIDEOS_COUNT):
+		os.link(
+			os.path.join(served_folder, "video0.mp4"), os.path.join(served_folder, f"video{i}.mp4")
+		)
+	server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=served_folder))
+	server.daemon_threads = True
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	host = f"http://127.0.0.1:{server.server_address[1]}"
+
+	print(f"{VIDEOS_COUNT} videos served by {host}")
+	for download_video in [False, True]:
+		seconds_by_flow = {}
+		files_by_flow = {}
+		ydl_pool = YoutubeDLPool()
+		for flow, download, kwargs in [
+			("two extractions", two_extractions_download, {}),
+			("single extraction", single_extraction_download, {}),
+			("single extraction with a pool", single_extraction_download, {"ydl_pool": ydl_pool}),
+		]:
+			download_folder = os.path.join(folder, f"{flow}-{download_video}")
+			seconds_by_flow[flow] = run(download, download_folder, download_video, host, **kwargs)
+			files_by_flow[flow] = sorted(os.listdir(download_folder))
+		ydl_pool.close()
+		# The same files are written by every flow
+		assert all(files == files_by_flow["two extractions"] for files in files_by_flow.values())
+		print(
+			f"{'video and metadata' if download_video else 'metadata only'}: "
+			+ ", ".join(
+				f"{flow} {seconds / VIDEOS_COUNT * 1000:.0f}ms per video"
+				for flow, seconds in seconds_by_flow.items()
+			)
+		)
+	server.shutdown()
+	server.server_close()
@@ -1,28 +1,23 @@
-import os
-from PIL import Image
+# Transcode the webp thumbnails of a dataset images folder to JPEG with all the cores, e.g.
+#   python scripts/convert_webp_to_jpg.py data/myyounicon-01/images
+# Idempotent: the thumbnails already transcoded from the same content are skipped, see
+# transcode_to_jpeg. New datasets transcode them while they are generated.
+import argparse
 
-def convert_webp_to_jpeg(folder_path):
-    # Check if the folder exists
-    if not os.path.isdir(folder_path):
-        print(f"Folder {folder_path} does not exist.")
-        return
-    
-    # Loop through all files in the folder
-    for filename in os.listdir(folder_path):
-        # Only process files with .webp extension
-        if filename.lower().endswith('.webp'):
-            webp_path = os.path.join(folder_path, filename)
-            jpeg_path = os.path.splitext(webp_path)[0] + '.jpg'
-            
-            try:
-                # Open the .webp image
-                with Image.open(webp_path) as img:
-                    # Convert and save as .jpg
-                    img.convert('RGB').save(jpeg_path, 'JPEG')
-                    print(f"Converted {filename} to {jpeg_path}")
-            except Exception as e:
-                print(f"Error converting {filename}: {e}")
+from project.utils.image_utils import DEFAULT_JPEG_QUALITY, transcode_folder
 
-# Example usage
-folder_path = '/home/leoli/Uni/Polimi/Thesis/master-thesis/data/myyounicon-01/images'  # Replace with the folder path
-convert_webp_to_jpeg(folder_path)
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Transcode the webp images of a folder to JPEG.")
+	parser.add_argument("folder", help="The images folder of the dataset.")
+	parser.add_argument(
+		"--workers", type=int, default=None, help="Processes, one per core if unset."
+	)
+	parser.add_argument("--quality", type=int, default=DEFAULT_JPEG_QUALITY, help="JPEG quality.")
+	args = parser.parse_args()
+
+	stats = transcode_folder(args.folder, args.workers, args.quality)
+	print(
+		f"{stats.transcoded} transcoded, {stats.skipped} up to date, {stats.failed} failed in "
+		f"{stats.seconds:.2f}s: {stats.images_per_s:.0f} images/s, "
+		f"{stats.source_bytes / 2**20 / stats.seconds if stats.seconds else 0.0:.1f}MB/s transcoded"
+	)
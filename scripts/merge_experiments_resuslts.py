@@ -1,5 +1,5 @@
 import json
-from project.utils.json_utils import EnhancedJSONEncoder
+from project.utils import json_utils
 from project.experiments.models import Experiment
 from datetime import datetime
 
@@ -25,7 +25,7 @@ for experiment_to_merge in experiments[1:]:
         end_time = max(end_time, experiment_to_merge.end_time)
 
 with open(f"notebooks/experiment-{'+'.join([e.id for e in experiments])}.json", "w") as f:
-        json.dump(experiment, f, cls=EnhancedJSONEncoder)
+        json_utils.dump(experiment, f)
     
 
 
@@ -2,13 +2,12 @@
 # Plus, requests are limited to 100 per day :ush: find workarounds
 # Best workaround so far: fiddle with published before/after.
 
-import json
 from datetime import datetime, timedelta
 
 import google.auth
 import google.auth.transport.requests
 
-from project.utils.json import EnhancedJSONEncoder
+from project.utils import json_utils
 from project.youtube.client import YouTubeClient
 
 sample_interval = timedelta(minutes=10)
@@ -55,4 +54,4 @@ with open(
 	f"data/random_sample_{len(search_results)}_from_{from_date.date()}_to_{sample_datetime.date()}_interval_{sample_interval}.json",
 	"w",
 ) as serialize_file:
-	json.dump(search_results, serialize_file, cls=EnhancedJSONEncoder)
+	json_utils.dump(search_results, serialize_file)
@@ -0,0 +1,49 @@
+import pytest
+
+from project.llm_models.classification import (
+	CLASSIFICATION_OPTIONS,
+	MAX_LABEL_TOKENS,
+	classify,
+	parse_label,
+)
+
+
+def apply_classification_options(tokens: list[str]) -> str:
+	"""The response of ollama to a model generating tokens, with CLASSIFICATION_OPTIONS."""
+	response = ""
+	for token in tokens[:MAX_LABEL_TOKENS]:
+		response += token
+		stops = [response.find(stop) for stop in CLASSIFICATION_OPTIONS["stop"]]
+		if any(stop >= 0 for stop in stops):
+			return response[: min(stop for stop in stops if stop >= 0)]
+	return response
+
+
+@pytest.mark.parametrize(
+	"tokens,label",
+	[
+		(["1", "\n"], 1),
+		(["0", "."], 0),
+		([" ", "1"], 1),
+		(["\n", "0"], 0),
+		(["`", "1"], 1),
+		(["Yes", "."], None),
+	],
+)
+def test_classification_options_keep_the_label(tokens, label):
+	assert parse_label(apply_classification_options(tokens)) == label
+
+
+@pytest.mark.parametrize(
+	"output,label",
+	[("1", 1), ("0", 0), (" 1", 1), ("\n0", 0), ("`1`", 1), ("1.", None), ("10", None), ("", None)],
+)
+def test_parse_label(output, label):
+	assert parse_label(output) == label
+
+
+def test_classify_ollama_response():
+	classification = classify({"model": "llama3.2", "response": "\n1", "done": True})
+	assert classification.label == 1
+	assert classification.probability is None
+	assert classification.output == "\n1"
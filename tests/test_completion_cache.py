@@ -0,0 +1,98 @@
+import dataclasses
+
+from project.experiments.runner import ExperimentRunner
+from project.llm_models.completion_cache import CompletionCache, completion_key
+from project.llm_models.inference import OllamaModel
+
+
+@dataclasses.dataclass
+class Choice:
+	finish_reason: str
+	index: int
+
+
+@dataclasses.dataclass
+class Video:
+	id: str
+
+	def to_string_for_model_input(self, attributes_to_include: list[str], **kwargs) -> str:
+		return f"title: {self.id}"
+
+
+def test_completion_key_is_the_same_for_an_ollama_model_and_its_name():
+	assert completion_key(OllamaModel.LLAVA, "system", "user") == completion_key(
+		"llava", "system", "user"
+	)
+
+
+def test_completion_key_depends_on_the_model():
+	assert completion_key("llava", "system", "user") != completion_key("llama3.2", "system", "user")
+
+
+def test_cache_survives_reopening(tmp_path):
+	cache_path = str(tmp_path / "completions.jsonl")
+	key = completion_key("llava", "system", "user", [b"image"])
+	with CompletionCache(cache_path) as cache:
+		cache.put(key, Choice(finish_reason="stop", index=0))
+		assert cache.get(key) == {"finish_reason": "stop", "index": 0}
+
+	with CompletionCache(cache_path) as cache:
+		assert len(cache) == 1
+		assert cache.get(key) == {"finish_reason": "stop", "index": 0}
+		assert cache.get(completion_key("llava", "system", "user", [b"other image"])) is None
+		assert cache.stats() == {"completions": 1, "hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_truncated_trailing_line_is_ignored(tmp_path):
+	cache_path = tmp_path / "completions.jsonl"
+	with CompletionCache(str(cache_path)) as cache:
+		cache.put("first", "1")
+		cache.put("second", "0")
+	# An interrupted run
+	cache_path.write_bytes(cache_path.read_bytes()[:-10])
+
+	with CompletionCache(str(cache_path)) as cache:
+		assert "second" not in cache
+		assert cache.get("first") == "1"
+		cache.put("second", "1")
+	with CompletionCache(str(cache_path)) as cache:
+		assert len(cache) == 2
+		assert cache.get("second") == "1"
+
+
+def test_experiment_runner_completes_from_the_cache(tmp_path):
+	videos = [Video(f"video{i}") for i in range(3)] + [Video("failing")]
+	cache_path = str(tmp_path / "completions.jsonl")
+	calls = []
+
+	def complete(model, system_prompt, user_prompt, images_paths):
+		calls.append((model, user_prompt))
+		if "failing" in user_prompt:
+			raise ValueError("model overloaded")
+		return {"choices": [{"message": {"role": "assistant", "content": "1"}}]}
+
+	completions_by_id = {}
+	for experiment_id in ["first", "second"]:
+		with (
+			CompletionCache(cache_path) as cache,
+			ExperimentRunner(
+				str(tmp_path / "experiments"),
+				attributes_settings={},
+				attributes=["title"],
+				description=None,
+				id=experiment_id,
+				image_filename_format=None,
+				models=["llava", "llama3.2"],
+				system_prompt="Is it a conspiracy video?",
+			) as runner,
+		):
+			runner.run(videos, complete, cache=cache, complete_options={"temperature": 0})
+			completions_by_id[experiment_id] = (
+				runner.to_experiment().completions_by_model_and_video_id
+			)
+
+	# The second experiment only sends the failed requests again
+	assert len(calls) == 2 * len(videos) + 2
+	assert calls[-2:] == [("llava", "title: failing"), ("llama3.2", "title: failing")]
+	assert completions_by_id["first"] == completions_by_id["second"]
+	assert completions_by_id["second"]["llava"]["failing"] == "model overloaded"
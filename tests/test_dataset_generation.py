@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+from project.dataset_generation.dataset_generation import (
+	extract_dataset_entry_frames,
+	generate_dataset_entry_from_video_id,
+	generate_dataset_from_video_ids,
+)
+
+
+def test_partial_download_and_storyboards_are_rejected(tmp_path):
+	with pytest.raises(ValueError):
+		generate_dataset_entry_from_video_id(
+			None, "dQw4w9WgXcQ", str(tmp_path), 5, partial_download=True, use_storyboards=True
+		)
+	with pytest.raises(ValueError):
+		generate_dataset_from_video_ids(
+			None, ["dQw4w9WgXcQ"], str(tmp_path), 5, partial_download=True, use_storyboards=True
+		)
+
+
+def test_corrupt_thumbnail_does_not_fail_the_video(tmp_path):
+	images_folder = tmp_path / "images"
+	images_folder.mkdir()
+	(images_folder / "dQw4w9WgXcQ_thumbnail.webp").write_bytes(b"not a webp")
+	working_folder = tmp_path / "ytdlp-metadata"
+	working_folder.mkdir()
+
+	extract_dataset_entry_frames("dQw4w9WgXcQ", {}, str(tmp_path), True, str(working_folder))
+	assert os.listdir(images_folder) == ["dQw4w9WgXcQ_thumbnail.webp"]
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+
+import ollama
+import pytest
+
+from project.llm_models.engine import (
+	InferenceRequest,
+	OllamaInferenceEngine,
+	close_client,
+	is_retryable,
+)
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+	"""
+	Answers /api/generate with the prompt upper-cased. The prompt "fail once" is answered with a
+	503 and "hang once" past the engine timeout the first time they are received, the model
+	"unknown" is answered with a 404.
+	"""
+
+	seen_prompts: set[str] = set()
+	lock = threading.Lock()
+
+	def do_POST(self) -> None:
+		self.answer(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+
+	def answer(self, request: dict) -> None:
+		with self.lock:
+			first_time = request["prompt"] not in self.seen_prompts
+			self.seen_prompts.add(request["prompt"])
+		if request["model"] == "unknown":
+			self.respond(404, {"error": "model 'unknown' not found"})
+			return
+		if request["prompt"] == "fail once" and first_time:
+			self.respond(503, {"error": "server busy"})
+			return
+		if request["prompt"] == "hang once" and first_time:
+			time.sleep(1)
+		self.respond(
+			200, {"model": request["model"], "response": request["prompt"].upper(), "done": True}
+		)
+
+	def respond(self, status: int, body: dict) -> None:
+		content = json.dumps(body).encode("utf-8")
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(content)))
+		self.end_headers()
+		try:
+			self.wfile.write(content)
+		except BrokenPipeError:
+			pass  # The engine timed out and closed the connection
+
+	def log_message(self, *args) -> None:
+		pass
+
+
+def serve(handler: type[BaseHTTPRequestHandler]) -> Iterator[str]:
+	"""Yield the host of a local server answering with the handler until the test ends."""
+	server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+	server.daemon_threads = True
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	yield f"http://127.0.0.1:{server.server_address[1]}"
+	server.shutdown()
+	server.server_close()
+
+
+@pytest.fixture
+def fake_ollama_host():
+	FakeOllamaHandler.seen_prompts = set()
+	yield from serve(FakeOllamaHandler)
+
+
+def request(video_id: str, prompt: str, model_name: str = "llama3.2") -> InferenceRequest:
+	return InferenceRequest(video_id, model_name, "Is it a conspiracy video?", prompt)
+
+
+def test_engine_returns_one_result_per_video(fake_ollama_host):
+	engine = OllamaInferenceEngine(
+		fake_ollama_host, max_in_flight=4, timeout_s=0.5, backoff_s=0.01, max_backoff_s=0.05
+	)
+	requests = [request(f"video{i}", f"prompt {i}") for i in range(20)]
+	requests += [
+		request("failing", "fail once"),
+		request("hanging", "hang once"),
+		request("unknown", "prompt", model_name="unknown"),
+	]
+
+	results = {result.video_id: result for result in engine.iter_results(requests)}
+
+	assert sorted(results) == sorted(r.video_id for r in requests)
+	for i in range(20):
+		assert results[f"video{i}"].response["response"] == f"PROMPT {i}"
+		assert results[f"video{i}"].attempts == 1
+	# 503 and timeout are retried
+	assert results["failing"].response["response"] == "FAIL ONCE"
+	assert results["failing"].attempts == 2
+	assert results["hanging"].response["response"] == "HANG ONCE"
+	assert results["hanging"].attempts == 2
+	# An unknown model is not
+	assert results["unknown"].response is None
+	assert "not found" in results["unknown"].error
+	assert results["unknown"].attempts == 1
+
+
+def test_engine_gives_up_after_max_retries(fake_ollama_host):
+	engine = OllamaInferenceEngine(fake_ollama_host, timeout_s=0.1, max_retries=0)
+	[result] = engine.iter_results([request("hanging", "hang once")])
+	assert result.response is None
+	assert result.error.startswith("TimeoutError")
+	assert result.attempts == 1
+
+
+def test_is_retryable():
+	assert is_retryable(asyncio.TimeoutError())
+	assert is_retryable(TimeoutError())
+	assert is_retryable(ollama.ResponseError("busy", 503))
+	assert not is_retryable(ollama.ResponseError("not found", 404))
+	assert not is_retryable(ValueError())
+
+
+def test_close_client(fake_ollama_host):
+	client = OllamaInferenceEngine(fake_ollama_host).client()
+	asyncio.run(close_client(client))
+	assert client._client.is_closed
@@ -0,0 +1,59 @@
+import math
+from datetime import datetime
+
+from project.experiments.models import Experiment
+
+
+def chat_completion(content: str, logprobs=None) -> dict:
+	return {
+		"choices": [{"message": {"role": "assistant", "content": content}, "logprobs": logprobs}]
+	}
+
+
+def predicted_labels(completions: dict) -> dict:
+	experiment = Experiment.from_completions(
+		attributes_settings={},
+		attributes=["title"],
+		completions_by_model={"model": completions},
+		description=None,
+		end_time=datetime(2024, 1, 2),
+		id="experiment",
+		image_filename_format=None,
+		models=["model"],
+		start_time=datetime(2024, 1, 1),
+		system_prompt="Is it a conspiracy video?",
+	)
+	return experiment.predicted_labels_by_model_and_video_id["model"]
+
+
+def test_malformed_logprobs_keep_the_label():
+	labels = predicted_labels(
+		{
+			"no logprobs": chat_completion("1"),
+			"no token": chat_completion("1", {"content": [{"token": None, "logprob": -0.1}]}),
+			"no choices logprobs": {"model": "llama3.2", "response": "0", "done": True},
+			"logprobs": chat_completion(
+				"1", {"content": [{"token": "1", "logprob": math.log(0.8)}]}
+			),
+		}
+	)
+	for video_id in ["no logprobs", "no token", "no choices logprobs"]:
+		assert labels[video_id]["correct_output_format"], video_id
+		assert labels[video_id]["probability"] is None, video_id
+	assert labels["no token"]["is_conspiracy"]
+	assert abs(labels["logprobs"]["probability"] - 0.8) < 1e-9
+
+
+def test_correct_output_format_agrees_with_parse_label():
+	labels = predicted_labels(
+		{
+			"backticks": chat_completion("`1`"),
+			"newline": chat_completion("\n0"),
+			"justification": chat_completion("1 because"),
+			"failed": "Connection refused",
+		}
+	)
+	assert labels["backticks"]["correct_output_format"]
+	assert labels["newline"]["correct_output_format"]
+	assert not labels["justification"]["correct_output_format"]
+	assert labels["failed"] == "Connection refused"
@@ -0,0 +1,87 @@
+import filecmp
+import os
+import shutil
+
+import ffmpeg
+import pytest
+
+from project.dataset_generation.dataset_generation import extract_dataset_entry_frames
+from project.dataset_generation.yt_dlp_download import SECTION_FILENAME_FORMAT
+from project.utils.ffmpeg_utils import extract_frames_at_times, extract_section_frames
+
+VIDEO_DURATION_S = 10
+TIMESTAMPS_BY_FRAME_PREFIX = {
+	"video_rand": [7.34, 1.02],
+	"video_hm": [4.4],
+	"video_fi": [2.5, 5.0, 7.5],
+}
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+
+
+@pytest.fixture(scope="module")
+def working_folder(tmp_path_factory):
+	"""A folder with a generated video.mp4 and its sections at every rounded timestamp."""
+	folder = tmp_path_factory.mktemp("ytdlp-metadata")
+	video_path = str(folder / "video.mp4")
+	(
+		ffmpeg.input(f"testsrc=duration={VIDEO_DURATION_S}:size=320x240:rate=25", f="lavfi")
+		.output(video_path, pix_fmt="yuv420p")
+		.run(capture_stdout=True, capture_stderr=True)
+	)
+	for timestamps in TIMESTAMPS_BY_FRAME_PREFIX.values():
+		for timestamp in timestamps:
+			section_path = folder / SECTION_FILENAME_FORMAT.format("video", round(timestamp, 1))
+			(
+				ffmpeg.input(video_path, ss=round(timestamp, 1), t=1)
+				.output(str(section_path), pix_fmt="yuv420p")
+				.overwrite_output()
+				.run(capture_stdout=True, capture_stderr=True)
+			)
+	return str(folder)
+
+
+def extract_expected_frames(working_folder: str, output_folder: str) -> None:
+	for frame_prefix, timestamps in TIMESTAMPS_BY_FRAME_PREFIX.items():
+		extract_frames_at_times(
+			os.path.join(working_folder, "video.mp4"), timestamps, output_folder, frame_prefix
+		)
+
+
+def test_dataset_entry_frames_are_the_ones_of_extract_frames_at_times(working_folder, tmp_path):
+	expected_folder = str(tmp_path / "expected")
+	extract_expected_frames(working_folder, expected_folder)
+
+	extract_dataset_entry_frames(
+		"video", TIMESTAMPS_BY_FRAME_PREFIX, str(tmp_path), False, working_folder
+	)
+	images_folder = str(tmp_path / "images")
+	filenames = sorted(os.listdir(expected_folder))
+	assert sorted(os.listdir(images_folder)) == filenames
+	assert len(filenames) == sum(len(t) for t in TIMESTAMPS_BY_FRAME_PREFIX.values())
+	_, mismatch, errors = filecmp.cmpfiles(expected_folder, images_folder, filenames, shallow=False)
+	assert mismatch == errors == []
+
+
+def test_section_frames_have_the_file_names_of_extract_frames_at_times(working_folder, tmp_path):
+	expected_folder = str(tmp_path / "expected")
+	extract_expected_frames(working_folder, expected_folder)
+
+	extract_dataset_entry_frames(
+		"video",
+		TIMESTAMPS_BY_FRAME_PREFIX,
+		str(tmp_path),
+		False,
+		working_folder,
+		partial_download=True,
+	)
+	assert sorted(os.listdir(tmp_path / "images")) == sorted(os.listdir(expected_folder))
+
+
+def test_missing_section_skips_only_its_frame(working_folder, tmp_path):
+	sections_paths = {
+		7.3: os.path.join(working_folder, SECTION_FILENAME_FORMAT.format("video", 7.3)),
+		1.0: os.path.join(working_folder, "missing.mp4"),
+	}
+	extract_section_frames(sections_paths, [7.34, 1.02], str(tmp_path), "video_rand")
+	assert os.listdir(tmp_path) == ["video_rand_00_7.3s.jpg"]
@@ -0,0 +1,53 @@
+import base64
+import io
+import os
+
+from PIL import Image
+
+from project.llm_models.image_cache import ImageSpec, PreparedImageCache
+
+MODEL = "model"
+SPEC = ImageSpec(max_size=64)
+
+
+def write_image(path: str, color: tuple[int, int, int], size: int = 200) -> None:
+	Image.new("RGB", (size, size), color).save(path, "JPEG")
+
+
+def prepared_color(cache: PreparedImageCache, image_path: str) -> tuple[int, int, int]:
+	with Image.open(io.BytesIO(cache.prepared_bytes(image_path, MODEL))) as image:
+		assert max(image.size) <= SPEC.max_size
+		return image.convert("RGB").getpixel((0, 0))
+
+
+def test_changed_source_is_prepared_again(tmp_path):
+	image_path = str(tmp_path / "image.jpg")
+	write_image(image_path, (255, 0, 0))
+	with PreparedImageCache(str(tmp_path / "cache"), {MODEL: SPEC}) as cache:
+		red_path = cache.prepared_path(image_path, MODEL)
+		assert prepared_color(cache, image_path)[0] > 200
+		assert (cache.prepared, cache.hits) == (1, 1)
+		write_image(image_path, (0, 0, 255), size=300)
+		assert cache.prepared_path(image_path, MODEL) != red_path
+		assert prepared_color(cache, image_path)[2] > 200
+		assert (cache.prepared, cache.hits) == (2, 2)
+	# The index of the sources is reused by the next runs, the old source is not taken for the new
+	with PreparedImageCache(str(tmp_path / "cache"), {MODEL: SPEC}) as cache:
+		assert prepared_color(cache, image_path)[2] > 200
+		encoded = cache.chat_image(image_path, MODEL)["image_url"]["url"].split(",", 1)[1]
+		assert base64.b64decode(encoded) == cache.prepared_bytes(image_path, MODEL)
+		assert (cache.prepared, cache.hits) == (0, 3)
+
+
+def test_incomplete_prepared_image_is_prepared_again(tmp_path):
+	image_path = str(tmp_path / "image.jpg")
+	write_image(image_path, (0, 255, 0))
+	with PreparedImageCache(str(tmp_path / "cache"), {MODEL: SPEC}) as cache:
+		prepared_path = cache.prepared_path(image_path, MODEL)
+		prepared = cache.prepared_bytes(image_path, MODEL)
+		with open(prepared_path, "wb") as prepared_file:
+			prepared_file.write(prepared[: len(prepared) // 2])
+		assert cache.prepared_bytes(image_path, MODEL) == prepared
+		os.remove(prepared_path)
+		assert cache.prepared_bytes(image_path, MODEL) == prepared
+		assert cache.prepared == 3
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+from PIL import Image
+
+from project.utils.image_utils import jpeg_path_of, transcode_to_jpeg
+
+
+def test_transcode_to_jpeg_skips_up_to_date_jpeg(tmp_path):
+	image_path = str(tmp_path / "video_thumbnail.webp")
+	Image.new("RGB", (64, 36), (200, 30, 30)).save(image_path, "WEBP")
+
+	assert transcode_to_jpeg(image_path)
+	with Image.open(jpeg_path_of(image_path)) as jpeg:
+		assert jpeg.format == "JPEG"
+		assert jpeg.size == (64, 36)
+	assert not transcode_to_jpeg(image_path)
+
+
+def test_transcode_to_jpeg_leaves_no_tmp_file_on_error(tmp_path, monkeypatch):
+	image_path = str(tmp_path / "video_thumbnail.webp")
+	Image.new("RGB", (64, 36), (200, 30, 30)).save(image_path, "WEBP")
+
+	def save_partially(image, path, *args, **kwargs):
+		with open(path, "wb") as file:
+			file.write(b"\xff\xd8partial")
+		raise OSError("No space left on device")
+
+	monkeypatch.setattr(Image.Image, "save", save_partially)
+	with pytest.raises(OSError):
+		transcode_to_jpeg(image_path)
+	assert os.listdir(tmp_path) == ["video_thumbnail.webp"]
+
+
+def test_transcode_to_jpeg_raises_on_corrupt_image(tmp_path):
+	image_path = tmp_path / "video_thumbnail.webp"
+	image_path.write_bytes(b"RIFF\x00\x00\x00\x00WEBPVP8 corrupt")
+
+	with pytest.raises(OSError):
+		transcode_to_jpeg(str(image_path))
+	assert os.listdir(tmp_path) == ["video_thumbnail.webp"]
@@ -0,0 +1,186 @@
+import dataclasses
+import io
+import json
+import random
+from datetime import date, datetime
+from enum import Enum
+from typing import Any
+
+import pytest
+
+from project.models import Heatmap, HeatmapItem, YouTubeVideoInfo
+from project.utils import json_utils
+from project.utils.json_utils import EnhancedJSONEncoder
+
+FUZZ_CASES = 1_000
+WORDS = "the truth about the moon landing they do not want you to know".split()
+
+
+class Label(str, Enum):
+	CONSPIRACY = "conspiracy"
+	NOT_CONSPIRACY = "not conspiracy"
+
+
+@dataclasses.dataclass
+class Message:
+	role: str
+	content: str
+
+
+@dataclasses.dataclass
+class Choice(dict):
+	"""Like the huggingface_hub inference outputs: a dataclass that is also a dict."""
+
+	finish_reason: str
+	index: int
+	message: Message
+
+	def __post_init__(self) -> None:
+		self.update(dataclasses.asdict(self))
+
+
+@dataclasses.dataclass
+class Node:
+	children: list[Any]
+	label: Label
+	values: dict[Any, Any]
+	when: datetime | date | None
+
+
+def comment_json(rng: random.Random, comment_id: str, parent_id: str, replies: list) -> dict:
+	return {
+		"author_id": f"UC{rng.randrange(1000):022}",
+		"author_is_uploader": False,
+		"author_name": "author",
+		"id": comment_id,
+		"is_favorited": False,
+		"is_pinned": False,
+		"like_count": rng.randrange(1000),
+		"parent_id": parent_id,
+		"publish_date": datetime(2024, 1, 1).isoformat(),
+		"replies": replies,
+		"text": " ".join(rng.choices(WORDS, k=5)),
+	}
+
+
+def video_json(rng: random.Random, video_id: str) -> str:
+	comments = [
+		comment_json(
+			rng,
+			f"{video_id}-{i}",
+			"root",
+			[comment_json(rng, f"{video_id}-{i}.{j}", f"{video_id}-{i}", []) for j in range(2)],
+		)
+		# An empty comments list is read back as None
+		for i in range(rng.randrange(1, 6))
+	]
+	return json.dumps(
+		{
+			"auto_subtitles": None,
+			"categories": ["News & Politics"],
+			"channel_id": "UC0",
+			"channel_subscribers": 1000,
+			"channel_title": "Channel",
+			"comment_count": len(comments),
+			"comments": comments,
+			"description": " ".join(rng.choices(WORDS, k=20)),
+			"duration_s": 600,
+			"heatmap": [
+				{"end_s": (i + 1) * 6.0, "intensity": rng.random(), "start_s": i * 6.0}
+				for i in range(rng.randrange(4))
+			]
+			or None,
+			"id": video_id,
+			"like_count": 10,
+			"location_description": None,
+			"location": None,
+			"publish_date": datetime(2024, 1, 1).isoformat(),
+			"subtitles": None,
+			"tags": rng.sample(WORDS, 3),
+			"title": " ".join(rng.choices(WORDS, k=5)),
+			"view_count": 100,
+		}
+	)
+
+
+def random_value(rng: random.Random, depth: int) -> Any:
+	"""A random value mixing what the experiments and the datasets serialize."""
+	kind = rng.randrange(13 if depth < 3 else 6)
+	if kind == 0:
+		return rng.choice([None, True, False])
+	if kind == 1:
+		return rng.randint(-(10**12), 10**12)
+	if kind == 2:
+		return rng.choice([rng.random(), float("nan"), float("inf"), -0.0])
+	if kind == 3:
+		return rng.choice(WORDS + ["éè", '"quoted"\n', "\U0001f47d"])
+	if kind == 4:
+		return rng.choice(list(Label))
+	if kind == 5:
+		return rng.choice([datetime(2024, 1, 2, 3, 4, 5), date(2024, 1, 2)])
+	if kind == 6:
+		return [random_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+	if kind == 7:
+		return tuple(random_value(rng, depth + 1) for _ in range(rng.randrange(4)))
+	if kind == 8:
+		keys = [rng.choice(WORDS), rng.randrange(10), Label.CONSPIRACY, None, 1.5]
+		return {rng.choice(keys): random_value(rng, depth + 1) for _ in range(rng.randrange(4))}
+	if kind == 9:
+		return Node(
+			children=[random_value(rng, depth + 1) for _ in range(rng.randrange(3))],
+			label=rng.choice(list(Label)),
+			values={rng.choice(WORDS): random_value(rng, depth + 1) for _ in range(2)},
+			when=rng.choice([None, datetime(2024, 1, 2), date(2024, 1, 2)]),
+		)
+	if kind == 10:
+		message = Message(role="assistant", content=rng.choice(["0", "1", "I cannot tell."]))
+		return Choice(finish_reason="stop", index=0, message=message)
+	if kind == 11:
+		return Heatmap.from_items([HeatmapItem(i, i + 1.0, rng.random()) for i in range(3)])
+	video = YouTubeVideoInfo.from_json(json.loads(video_json(rng, f"video{depth}")))
+	# Some comments built, the others still compact
+	built_comments = video.comments[: rng.randrange(len(video.comments) + 1)]
+	assert all(comment.replies is not None for comment in built_comments)
+	return video
+
+
+def encoder_dump(obj: Any) -> str:
+	file = io.StringIO()
+	json.dump(obj, file, cls=EnhancedJSONEncoder)
+	return file.getvalue()
+
+
+def json_utils_dump(obj: Any, stream_depth: int = 3) -> str:
+	file = io.StringIO()
+	json_utils.dump(obj, file, stream_depth)
+	return file.getvalue()
+
+
+def test_random_values_are_serialized_like_the_encoder():
+	rng = random.Random(42)
+	for _ in range(FUZZ_CASES):
+		value = random_value(rng, 0)
+		expected_json = json.dumps(value, cls=EnhancedJSONEncoder)
+		assert json_utils.dumps(value) == expected_json
+		assert json_utils_dump(value) == expected_json
+		assert json_utils_dump(value, stream_depth=0) == encoder_dump(value)
+
+
+@pytest.mark.parametrize("built_comments", [0, 1, 5])
+def test_videos_round_trip(built_comments):
+	rng = random.Random(built_comments)
+	for i in range(20):
+		expected_json = video_json(rng, f"video{i}")
+		video = YouTubeVideoInfo.from_json(json.loads(expected_json))
+		assert len(video.comments[:built_comments]) <= built_comments
+		assert json_utils.dumps(video) == expected_json
+		assert json_utils_dump(video) == expected_json
+		assert YouTubeVideoInfo.from_json(json.loads(json_utils.dumps(video))) == video
+
+
+def test_unknown_values_are_rejected_like_the_encoder():
+	for value in [object(), {1, 2}, Node([], Label.CONSPIRACY, {"a": b"bytes"}, None)]:
+		with pytest.raises(TypeError):
+			json.dumps(value, cls=EnhancedJSONEncoder)
+		with pytest.raises(TypeError):
+			json_utils.dumps(value)
@@ -0,0 +1,134 @@
+import copy
+
+import pytest
+
+from project.models import LazyComments, YouTubeComment
+
+
+def comment_json(comment_id: str, parent_id: str = "root", replies: list | None = None) -> dict:
+	return {
+		"author_id": "UC0",
+		"author_is_uploader": False,
+		"author_name": f"author of {comment_id}",
+		"id": comment_id,
+		"is_favorited": False,
+		"is_pinned": False,
+		"like_count": 3,
+		"parent_id": parent_id,
+		"publish_date": "2024-01-01T00:00:00",
+		"replies": replies or [],
+		"text": f"text of {comment_id}",
+	}
+
+
+COMMENTS_JSON = [
+	comment_json(
+		f"c{i}",
+		replies=[
+			comment_json(f"c{i}.{j}", f"c{i}", [comment_json(f"c{i}.{j}.0", f"c{i}.{j}")])
+			for j in range(i % 3)
+		],
+	)
+	for i in range(6)
+]
+
+
+def test_lazy_comments_are_the_comments_built_from_json():
+	comments = LazyComments(copy.deepcopy(COMMENTS_JSON))
+	assert len(comments) == len(COMMENTS_JSON)
+	expected_comments = [YouTubeComment.from_json(c) for c in copy.deepcopy(COMMENTS_JSON)]
+	assert list(comments) == expected_comments
+	assert comments == expected_comments
+
+
+@pytest.mark.parametrize(
+	"index", [slice(None), slice(1, 4), slice(None, None, -2), slice(-2, None), slice(4, 100)]
+)
+def test_slices_are_lists(index):
+	comments = LazyComments(copy.deepcopy(COMMENTS_JSON))
+	# Some comments built, the others still compact
+	assert comments[3].id == "c3"
+	expected_comments = [YouTubeComment.from_json(c) for c in copy.deepcopy(COMMENTS_JSON)]
+	assert comments[index] == expected_comments[index]
+	assert isinstance(comments[index], list)
+	assert comments[-1] == expected_comments[-1]
+	with pytest.raises(IndexError):
+		comments[len(COMMENTS_JSON)]
+
+
+def test_replies_are_rebuilt_at_every_depth():
+	comments = LazyComments(copy.deepcopy(COMMENTS_JSON))
+	comment = comments[2]
+	assert [reply.id for reply in comment.replies] == ["c2.0", "c2.1"]
+	assert [reply.id for reply in comment.replies[1].replies] == ["c2.1.0"]
+	assert comment.replies[1].replies[0].replies == []
+	assert comment.replies[1].text == "text of c2.1"
+	# The built comment is kept
+	assert comments[2] is comment
+	# Built or not, the comments are written back as they were read
+	assert comments.to_json() == COMMENTS_JSON
+
+
+def test_missing_fields_are_defaulted():
+	partial_comment = {"id": "c0", "text": "text of c0", "replies": [{"id": "c0.0"}]}
+	comments = LazyComments([partial_comment, {"id": "c1"}])
+	assert comments[0].author_name is None
+	assert comments[0].replies[0].text == ""
+	assert comments[1].replies == []
+	assert comments[0].to_string_for_model_input(True).startswith("None: text of c0")
+
+
+def yt_dlp_comment(comment_id: str, parent_id: str) -> dict:
+	return {
+		"author_id": "UC0",
+		"author_is_uploader": False,
+		"author": f"author of {comment_id}",
+		"id": comment_id,
+		"is_favorited": False,
+		"is_pinned": False,
+		"like_count": 3,
+		"parent": parent_id,
+		"timestamp": 1_700_000_000,
+		"text": f"text of {comment_id}",
+	}
+
+
+def tree(comments: list[YouTubeComment]) -> list:
+	return [(comment.id, tree(comment.replies)) for comment in comments]
+
+
+def test_comment_trees_keep_the_yt_dlp_order():
+	comments = YouTubeComment.from_yt_dlp_comments(
+		[
+			yt_dlp_comment("c0", "root"),
+			yt_dlp_comment("c0.r1", "c0"),
+			yt_dlp_comment("c1", "root"),
+			yt_dlp_comment("c0.r0", "c0"),
+			# A reply of a reply, and a reply listed before its parent
+			yt_dlp_comment("c0.r0.r0", "c0.r0"),
+			yt_dlp_comment("c2.r0", "c2"),
+			yt_dlp_comment("c2", "root"),
+		]
+	)
+	assert tree(comments) == [
+		("c0", [("c0.r1", []), ("c0.r0", [("c0.r0.r0", [])])]),
+		("c1", []),
+		("c2", [("c2.r0", [])]),
+	]
+	assert comments[0].replies[1].author_name == "author of c0.r0"
+
+
+def test_orphan_replies_are_dropped():
+	comments = YouTubeComment.from_yt_dlp_comments(
+		[
+			yt_dlp_comment("c0", "root"),
+			# Its parent was cut by max_comments
+			yt_dlp_comment("c1.r0", "c1"),
+			yt_dlp_comment("c1.r0.r0", "c1.r0"),
+			# Its own parent
+			yt_dlp_comment("c2", "c2"),
+			yt_dlp_comment("c0.r0", "c0"),
+		]
+	)
+	assert tree(comments) == [("c0", [("c0.r0", [])])]
+	assert YouTubeComment.from_yt_dlp_comments([]) == []
@@ -0,0 +1,41 @@
+from project.dataset_generation.pipeline import run_pipeline
+
+
+def download_stage(video_id: str) -> tuple[str, tuple | None]:
+	if video_id == "download-error":
+		raise RuntimeError("download failed")
+	if video_id == "nothing-to-process":
+		return f"{video_id}-info", None
+	return f"{video_id}-info", (video_id,)
+
+
+def processing_stage(video_id: str) -> None:
+	if video_id == "processing-error":
+		raise RuntimeError("processing failed")
+
+
+def test_run_pipeline_reports_every_video_once():
+	succeeded = {}
+	failed = {}
+
+	def on_success(video_id: str, result: str) -> None:
+		if video_id == "store-error":
+			raise OSError("store failed")
+		succeeded[video_id] = result
+
+	run_pipeline(
+		["ok", "download-error", "nothing-to-process", "processing-error", "store-error"],
+		download_stage,
+		processing_stage,
+		on_success,
+		lambda video_id, exception: failed.setdefault(video_id, str(exception)),
+		download_workers=2,
+		processing_workers=2,
+	)
+
+	assert succeeded == {"ok": "ok-info", "nothing-to-process": "nothing-to-process-info"}
+	assert failed == {
+		"download-error": "download failed",
+		"processing-error": "processing failed",
+		"store-error": "store failed",
+	}
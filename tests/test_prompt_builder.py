@@ -0,0 +1,108 @@
+import random
+import re
+from datetime import datetime, timedelta
+
+import pytest
+import srt
+
+from project.llm_models.prompt_builder import TokenBudgetPromptBuilder
+from project.models import YouTubeComment, YouTubeVideoInfo
+
+ATTRIBUTES = ["title", "description", "subtitles", "auto_subtitles", "comments"]
+WORDS = "the truth about the moon landing they do not want you to know".split()
+TOKENS_PATTERN = re.compile(r"\w+|\s+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+	# Whitespace runs are tokens: the parts tokenized together take fewer tokens than apart
+	return len(TOKENS_PATTERN.findall(text))
+
+
+def count_merging_tokens(text: str) -> int:
+	# The parts tokenized together take more tokens than apart
+	return int(len(text) ** 1.05)
+
+
+def video(rng: random.Random, video_id: str) -> YouTubeVideoInfo:
+	def sentence(words_count: int) -> str:
+		return " ".join(rng.choice(WORDS) for _ in range(words_count))
+
+	captions = srt.compose(
+		srt.Subtitle(i, timedelta(seconds=i), timedelta(seconds=i + 1), sentence(8))
+		for i in range(rng.randrange(1, 200))
+	)
+	comments = [
+		YouTubeComment(
+			author_id="UC0",
+			author_is_uploader=False,
+			author_name="author",
+			id=f"{video_id}-{i}",
+			is_favorited=False,
+			is_pinned=False,
+			like_count=0,
+			parent_id="root",
+			publish_date=datetime(2024, 1, 1),
+			replies=[],
+			text=sentence(rng.randrange(1, 40)),
+		)
+		for i in range(rng.randrange(0, 50))
+	]
+	return YouTubeVideoInfo(
+		auto_subtitles=captions if rng.random() < 0.7 else None,
+		categories=["News & Politics"],
+		channel_id="UC0",
+		channel_subscribers=1000,
+		channel_title="Channel",
+		comment_count=len(comments),
+		comments=comments or None,
+		description=sentence(rng.randrange(0, 300)),
+		duration_s=600,
+		heatmap=None,
+		id=video_id,
+		like_count=10,
+		location_description=None,
+		location=None,
+		publish_date=datetime(2024, 1, 1),
+		subtitles=captions if rng.random() < 0.3 else None,
+		tags=["moon"],
+		title=sentence(10),
+		view_count=100,
+	)
+
+
+VIDEOS = [video(random.Random(i), f"video{i}") for i in range(30)]
+
+
+@pytest.mark.parametrize("tokenizer", [count_tokens, count_merging_tokens])
+@pytest.mark.parametrize("max_tokens", [300, 500, 1000, 4000])
+def test_prompts_fit_in_the_budget(tokenizer, max_tokens):
+	builder = TokenBudgetPromptBuilder(tokenizer, ATTRIBUTES)
+	for v in VIDEOS:
+		prompt, settings = builder.build_with_settings(v, max_tokens)
+		assert tokenizer(prompt) <= max_tokens
+		assert prompt == v.to_string_for_model_input(ATTRIBUTES, **settings)
+
+
+@pytest.mark.parametrize("max_tokens", [300, 500])
+def test_later_priorities_get_the_tokens_left_by_the_first_ones(max_tokens):
+	builder = TokenBudgetPromptBuilder(count_tokens, ATTRIBUTES)
+	truncated_descriptions = 0
+	for v in VIDEOS:
+		_, settings = builder.build_with_settings(v, max_tokens)
+		if settings["max_description_length"] < len(v.description):
+			# A character of description takes at most 2 tokens, a comment more
+			truncated_descriptions += 1
+			assert settings["max_comments"] == 0
+	assert truncated_descriptions > 0
+
+
+def test_prompt_within_a_large_budget_is_not_truncated():
+	builder = TokenBudgetPromptBuilder(count_tokens, ATTRIBUTES)
+	for v in VIDEOS:
+		assert builder.build(v, 10**6) == v.to_string_for_model_input(ATTRIBUTES)
+
+
+def test_attributes_that_cannot_be_truncated_must_fit():
+	builder = TokenBudgetPromptBuilder(count_tokens, ATTRIBUTES)
+	with pytest.raises(ValueError):
+		builder.build(VIDEOS[0], 10)
@@ -0,0 +1,112 @@
+import json
+
+import pytest
+
+from project.dataset import reader
+from project.dataset.reader import VideoDataset, _iter_json_array, _read_json_value_at
+from project.dataset.store import ShardedDatasetStore
+from project.models import YouTubeVideoInfo
+from project.utils import json_utils
+from tests.test_models import comment_json
+
+
+def video_json(i: int) -> dict:
+	return {
+		"auto_subtitles": None,
+		"categories": ["News & Politics"],
+		"channel_id": "UC0",
+		"channel_subscribers": 1000,
+		"channel_title": 'Chaîne ],[ "quoted"',
+		"comment_count": 2,
+		"comments": [comment_json(f"video{i}-0"), comment_json(f"video{i}-1")],
+		"description": "é" * i + "\U0001f47d ] } ,",
+		"duration_s": 600,
+		"heatmap": [{"end_s": 6.0, "intensity": 0.5, "start_s": 0.0}],
+		"id": f"video{i}",
+		"like_count": 10,
+		"location_description": None,
+		"location": None,
+		"publish_date": "2024-01-01T00:00:00",
+		"subtitles": "1\n00:00:00,000 --> 00:00:01,000\nthe moon landing\n",
+		"tags": ["moon", "landing"],
+		"title": f"The moon landing {i}",
+		"view_count": 100,
+	}
+
+
+VIDEOS_JSON = [video_json(i) for i in range(20)]
+
+
+@pytest.mark.parametrize("chunk_size", [7, 64, 1024 * 1024])
+@pytest.mark.parametrize("separator", [",", ",\n  ", " , "])
+def test_iter_json_array_yields_the_elements_and_their_offsets(
+	tmp_path, monkeypatch, chunk_size, separator
+):
+	# Small chunks split the elements and the multi-byte characters
+	monkeypatch.setattr(reader, "_READ_CHUNK_SIZE", chunk_size)
+	json_path = tmp_path / "videos_infos.json"
+	json_path.write_text(
+		" \n[ " + separator.join(json.dumps(v, ensure_ascii=False) for v in VIDEOS_JSON) + " ]\n",
+		encoding="utf-8",
+	)
+
+	elements = list(_iter_json_array(str(json_path)))
+
+	assert [element for _, element in elements] == VIDEOS_JSON
+	for byte_offset, element in elements:
+		assert _read_json_value_at(str(json_path), byte_offset) == element
+
+
+@pytest.mark.parametrize("content", ["[]", " [ ] ", "[\n]"])
+def test_iter_json_array_of_an_empty_array(tmp_path, content):
+	json_path = tmp_path / "videos_infos.json"
+	json_path.write_text(content)
+	assert list(_iter_json_array(str(json_path))) == []
+
+
+@pytest.mark.parametrize("content", ['{"id": "video0"}', '[{"id": "video0"}, {"id": '])
+def test_iter_json_array_rejects_other_files(tmp_path, content):
+	json_path = tmp_path / "videos_infos.json"
+	json_path.write_text(content)
+	with pytest.raises(ValueError):
+		list(_iter_json_array(str(json_path)))
+
+
+@pytest.fixture(params=["json", "store"])
+def dataset_path(request, tmp_path) -> str:
+	"""The same videos in a videos_infos.json file or in a ShardedDatasetStore."""
+	if request.param == "json":
+		json_path = tmp_path / "videos_infos.json"
+		json_path.write_text(json.dumps(VIDEOS_JSON))
+		return str(json_path)
+	with ShardedDatasetStore(str(tmp_path / "videos_infos"), max_shard_bytes=4096) as store:
+		for video in VIDEOS_JSON:
+			store.append(video)
+	assert len(store.manifest["shards"]) > 1
+	return str(tmp_path)
+
+
+def test_lazy_fields_are_read_from_disk_when_accessed(dataset_path):
+	records = list(VideoDataset(dataset_path))
+	assert [r.id for r in records] == [v["id"] for v in VIDEOS_JSON]
+	for record, video in zip(records, VIDEOS_JSON):
+		expected_video = YouTubeVideoInfo.from_json(json.loads(json.dumps(video)))
+		for field in reader.HEAVY_FIELDS:
+			assert field not in record.__dict__
+			assert getattr(record, field) == getattr(expected_video, field)
+		assert record.title == expected_video.title
+		assert record.heatmap.to_json() == expected_video.heatmap.to_json()
+		assert json_utils.dumps(record.to_video_info()) == json_utils.dumps(expected_video)
+
+
+def test_fields_outside_the_projection_are_missing(dataset_path):
+	record = next(
+		iter(VideoDataset(dataset_path, fields=["id", "title"], lazy_fields=["comments"]))
+	)
+	assert record.__dict__.keys() >= {"id", "title"}
+	assert "description" not in record.__dict__
+	assert record.comments[1].id == "video0-1"
+	with pytest.raises(AttributeError):
+		_ = record.description
+	# Rendering reads the whole record
+	assert "**description**: " in record.to_string_for_model_input(["title", "description"])
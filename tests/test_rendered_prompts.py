@@ -0,0 +1,89 @@
+import dataclasses
+from datetime import datetime
+
+from project.dataset import rendered_prompts
+from project.dataset.reader import VideoDataset
+from project.dataset.rendered_prompts import RenderedPromptStore, rendering_key
+from project.models import YouTubeVideoInfo
+from project.utils import json_utils
+
+ATTRIBUTES = ["title", "description"]
+
+
+def video(video_id: str, description: str = "they do not want you to know") -> YouTubeVideoInfo:
+	return YouTubeVideoInfo(
+		auto_subtitles=None,
+		categories=["News & Politics"],
+		channel_id="UC0",
+		channel_subscribers=1000,
+		channel_title="Channel",
+		comment_count=0,
+		comments=None,
+		description=description,
+		duration_s=600,
+		heatmap=None,
+		id=video_id,
+		like_count=10,
+		location_description=None,
+		location=None,
+		publish_date=datetime(2024, 1, 1),
+		subtitles=None,
+		tags=["moon"],
+		title=f"The moon landing {video_id}",
+		view_count=100,
+	)
+
+
+def test_changed_attribute_setting_misses_the_cache(tmp_path):
+	videos = [video(f"video{i}") for i in range(3)]
+	with RenderedPromptStore(str(tmp_path), ATTRIBUTES, {}) as prompt_store:
+		assert prompt_store.render_all(videos) == 3
+	# The defaults of to_string_for_model_input written explicitly hit the cache
+	with RenderedPromptStore(
+		str(tmp_path), ATTRIBUTES, {"max_description_length": -1}
+	) as prompt_store:
+		assert prompt_store.render_all(videos) == 0
+	with RenderedPromptStore(
+		str(tmp_path), ATTRIBUTES, {"max_description_length": 4}
+	) as prompt_store:
+		assert len(prompt_store) == 0
+		assert prompt_store.get(videos[0]) == videos[0].to_string_for_model_input(
+			ATTRIBUTES, max_description_length=4
+		)
+		assert prompt_store.render_all(videos) == 2
+
+
+def test_renderer_version_is_part_of_the_key(tmp_path, monkeypatch):
+	key = rendering_key(ATTRIBUTES, {})
+	with RenderedPromptStore(str(tmp_path), ATTRIBUTES, {}) as prompt_store:
+		prompt_store.render_all([video("video0")])
+	monkeypatch.setattr(rendered_prompts, "RENDERER_VERSION", rendered_prompts.RENDERER_VERSION + 1)
+	assert rendering_key(ATTRIBUTES, {}) != key
+	with RenderedPromptStore(str(tmp_path), ATTRIBUTES, {}) as prompt_store:
+		assert "video0" not in prompt_store
+
+
+def test_changed_video_record_misses_the_cache(tmp_path):
+	with RenderedPromptStore(str(tmp_path), ATTRIBUTES, {}) as prompt_store:
+		prompt_store.get(video("video0"))
+		prompt_store.render_all([video("video1")])
+	changed_video = dataclasses.replace(video("video0"), description="the truth")
+	with RenderedPromptStore(str(tmp_path), ATTRIBUTES, {}) as prompt_store:
+		assert prompt_store.get(changed_video).endswith("the truth")
+		assert prompt_store.render_all([video("video0"), video("video1")]) == 1
+		# A field that is not rendered does not matter
+		assert prompt_store.render_all([dataclasses.replace(video("video1"), view_count=5)]) == 0
+		assert prompt_store.get(video("video0")).endswith("they do not want you to know")
+	with RenderedPromptStore(str(tmp_path), ATTRIBUTES, {}) as prompt_store:
+		prompts = dict(prompt_store.items())
+	assert list(prompts) == ["video1", "video0"]
+	assert prompts["video0"].endswith("they do not want you to know")
+
+
+def test_video_records_share_the_prompts_of_the_video_infos(tmp_path):
+	videos = [video(f"video{i}") for i in range(3)]
+	dataset_path = tmp_path / "videos_infos.json"
+	dataset_path.write_text(json_utils.dumps(videos))
+	with RenderedPromptStore(str(tmp_path / "prompts"), ATTRIBUTES, {}) as prompt_store:
+		prompt_store.render_all(videos)
+		assert prompt_store.render_all(VideoDataset(str(dataset_path))) == 0
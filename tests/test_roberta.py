@@ -0,0 +1,89 @@
+import os
+from dataclasses import dataclass
+
+import pytest
+from tokenizers import ByteLevelBPETokenizer
+from transformers import RobertaConfig, RobertaForSequenceClassification, RobertaTokenizer
+
+from project.classifiers.roberta import RobertaClassifier
+from project.dataset.rendered_prompts import RenderedPromptStore
+
+ATTRIBUTES = ["title", "description"]
+ATTRIBUTES_SETTINGS = {"max_description_length": 100}
+
+
+@dataclass
+class Video:
+	id: str
+	title: str
+	description: str
+
+	def to_string_for_model_input(self, attributes_to_include: list[str], **kwargs) -> str:
+		description = self.description[: kwargs.get("max_description_length")]
+		values = {"title": self.title, "description": description}
+		return "\n".join(f"{a}: {values[a]}" for a in attributes_to_include)
+
+
+VIDEOS = [
+	Video(f"video{i}", f"the moon landing {i}", "they do not want you to know " * i)
+	for i in range(5)
+]
+
+
+@pytest.fixture(scope="module")
+def classifier(tmp_path_factory):
+	"""A classifier with a tiny randomly initialized model and a tokenizer trained offline."""
+	folder = tmp_path_factory.mktemp("roberta")
+	tokenizer_path = str(folder / "tokenizer")
+	os.makedirs(tokenizer_path)
+	bpe = ByteLevelBPETokenizer()
+	bpe.train_from_iterator(
+		[v.to_string_for_model_input(ATTRIBUTES) for v in VIDEOS],
+		vocab_size=300,
+		special_tokens=["<s>", "<pad>", "</s>", "<unk>", "<mask>"],
+	)
+	bpe.save_model(tokenizer_path)
+	RobertaTokenizer(
+		os.path.join(tokenizer_path, "vocab.json"), os.path.join(tokenizer_path, "merges.txt")
+	).save_pretrained(tokenizer_path)
+	checkpoint_path = str(folder / "best_model")
+	config = RobertaConfig(
+		vocab_size=300,
+		hidden_size=16,
+		num_hidden_layers=1,
+		num_attention_heads=2,
+		intermediate_size=32,
+		max_position_embeddings=130,
+		type_vocab_size=1,
+		num_labels=2,
+	)
+	RobertaForSequenceClassification(config).save_pretrained(checkpoint_path)
+	return RobertaClassifier(
+		checkpoint_path,
+		batch_size=2,
+		tokenizer=tokenizer_path,
+		attributes=ATTRIBUTES,
+		attributes_settings=ATTRIBUTES_SETTINGS,
+		max_length=128,
+		sort_window_batches=2,
+	)
+
+
+def test_scores_of_the_prompt_store_are_the_rendered_ones(classifier, tmp_path):
+	scores = list(classifier.score_videos(VIDEOS))
+	assert [video_id for video_id, _ in scores] == [v.id for v in VIDEOS]
+	with RenderedPromptStore(str(tmp_path), ATTRIBUTES, ATTRIBUTES_SETTINGS) as prompt_store:
+		stored_scores = list(classifier.score_videos(VIDEOS, prompt_store))
+	assert [s for _, s in stored_scores] == pytest.approx([s for _, s in scores], abs=1e-6)
+
+
+@pytest.mark.parametrize(
+	"attributes,attributes_settings",
+	[(["title"], ATTRIBUTES_SETTINGS), (ATTRIBUTES, {"max_description_length": 10})],
+)
+def test_prompt_store_of_other_attributes_is_rejected(
+	classifier, tmp_path, attributes, attributes_settings
+):
+	with RenderedPromptStore(str(tmp_path), attributes, attributes_settings) as prompt_store:
+		with pytest.raises(ValueError):
+			list(classifier.score_videos(VIDEOS, prompt_store))
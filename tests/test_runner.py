@@ -0,0 +1,106 @@
+import dataclasses
+import os
+
+import pytest
+
+from project.experiments.runner import ExperimentRunner
+
+MODELS = ["llava", "mistralai/Mistral-7B-Instruct-v0.2"]
+
+
+@dataclasses.dataclass
+class Video:
+	id: str
+
+	def to_string_for_model_input(self, attributes_to_include: list[str], **kwargs) -> str:
+		return f"title: {self.id}"
+
+
+VIDEOS = [Video(f"video{i}") for i in range(10)]
+
+
+def runner(folder: str, attributes: list[str] | None = None) -> ExperimentRunner:
+	return ExperimentRunner(
+		folder,
+		attributes_settings={"max_description_length": 100},
+		attributes=attributes or ["title"],
+		description=None,
+		id="experiment",
+		image_filename_format=None,
+		models=MODELS,
+		system_prompt="Is it a conspiracy video?",
+	)
+
+
+def interrupted_videos(count: int):
+	"""The videos, until a Ctrl-C after count videos."""
+	for video in VIDEOS[:count]:
+		yield video
+	raise KeyboardInterrupt
+
+
+def test_interrupted_experiment_is_resumed(tmp_path):
+	calls = []
+
+	def complete(model, system_prompt, user_prompt, images_paths):
+		calls.append((model, user_prompt))
+		return {"choices": [{"message": {"role": "assistant", "content": "1"}}]}
+
+	with runner(str(tmp_path)) as first_runner, pytest.raises(KeyboardInterrupt):
+		first_runner.run(interrupted_videos(4), complete, max_in_flight_per_model=1)
+	journaled = {
+		(model, f"title: {video_id}")
+		for model, journal in first_runner.journals_by_model.items()
+		for video_id in journal.statuses_by_video_id
+	}
+	assert journaled
+	calls_before_resume = len(calls)
+	# A crash in the middle of the next completion
+	journal_path = first_runner.journals_by_model["llava"].journal_path
+	with open(journal_path, "ab") as journal_file:
+		journal_file.write(b'{"video_id": "video9", "compl')
+
+	with ExperimentRunner.resume(str(tmp_path), "experiment") as resumed_runner:
+		resumed_runner.run(VIDEOS, complete)
+		experiment = resumed_runner.to_experiment()
+
+	for model in MODELS:
+		assert sorted(experiment.completions_by_model_and_video_id[model]) == sorted(
+			v.id for v in VIDEOS
+		)
+	# Every completion that was not journaled before the interruption is requested once
+	assert sorted(calls[calls_before_resume:]) == sorted(
+		(model, f"title: {v.id}")
+		for model in MODELS
+		for v in VIDEOS
+		if (model, f"title: {v.id}") not in journaled
+	)
+
+
+def test_other_settings_are_refused(tmp_path):
+	def complete(model, system_prompt, user_prompt, images_paths):
+		return {"choices": [{"message": {"role": "assistant", "content": "0"}}]}
+
+	with runner(str(tmp_path)) as first_runner:
+		first_runner.run(VIDEOS[:2], complete)
+
+	with pytest.raises(ValueError, match="another id"):
+		runner(str(tmp_path), attributes=["title", "description"])
+	# The journals are left as they are
+	with runner(str(tmp_path)) as same_runner:
+		assert not same_runner.is_pending(MODELS[1], "video1")
+		assert same_runner.is_pending(MODELS[1], "video2")
+
+
+def test_journal_interrupted_while_writing_its_header_is_started_again(tmp_path):
+	with runner(str(tmp_path)) as first_runner:
+		journal = first_runner.journals_by_model["llava"]
+	with open(journal.journal_path, "r+b") as journal_file:
+		journal_file.truncate(10)
+
+	with runner(str(tmp_path)) as new_runner:
+		journal = new_runner.journals_by_model["llava"]
+		assert new_runner.is_pending("llava", "video0")
+		journal.append("video0", {"response": "1"})
+		assert journal.completions() == {"video0": {"response": "1"}}
+	assert os.path.getsize(journal.ids_path) == len("video0\tcompleted\n")
@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from project.models import Heatmap, HeatmapItem
+from project.utils.sampling_utils import sample_heatmap, sample_heatmaps
+
+BUCKET_S = 6.0
+
+
+def sorted_sample(heatmap: list[HeatmapItem], samples: int) -> list[float]:
+	# The former sample_heatmap
+	return [
+		hmi.start_s for hmi in sorted(heatmap, key=lambda e: e.intensity, reverse=True)[:samples]
+	]
+
+
+def suppressed_sample(
+	heatmap: list[HeatmapItem], samples: int, min_separation_s: float
+) -> list[float]:
+	# Non-maximum suppression over the sorted buckets, written plainly
+	sampled = []
+	for hmi in sorted(heatmap, key=lambda e: e.intensity, reverse=True):
+		if len(sampled) == samples:
+			break
+		if all(abs(hmi.start_s - start_s) >= min_separation_s for start_s in sampled):
+			sampled.append(hmi.start_s)
+	return sampled
+
+
+def random_heatmap(rng: random.Random) -> list[HeatmapItem]:
+	# Few intensity levels, so that many buckets are tied
+	levels = rng.choice([3, 10, 1000])
+	return [
+		HeatmapItem(
+			end_s=(i + 1) * BUCKET_S,
+			intensity=rng.randrange(levels) / levels,
+			start_s=i * BUCKET_S,
+		)
+		for i in range(rng.randrange(0, 120))
+	]
+
+
+HEATMAPS = [random_heatmap(random.Random(seed)) for seed in range(300)]
+
+
+@pytest.mark.parametrize("samples", [0, 1, 5, 100, 200])
+def test_sample_heatmap_is_the_sorted_sample(samples):
+	for heatmap in HEATMAPS:
+		expected_sample = sorted_sample(heatmap, samples)
+		assert sample_heatmap(heatmap, samples) == expected_sample
+		assert sample_heatmap(Heatmap.from_items(heatmap), samples) == expected_sample
+
+
+@pytest.mark.parametrize("samples", [0, 1, 5, 100, 200])
+def test_sample_heatmaps_is_sample_heatmap_of_every_heatmap(samples):
+	assert sample_heatmaps(HEATMAPS, samples) == [sorted_sample(h, samples) for h in HEATMAPS]
+	assert sample_heatmaps([[], []], samples) == [[], []]
+	assert sample_heatmaps([], samples) == []
+
+
+@pytest.mark.parametrize("min_separation_s", [BUCKET_S / 2, BUCKET_S, 3 * BUCKET_S, 50.0])
+def test_suppression_is_the_greedy_non_maximum_suppression(min_separation_s):
+	for heatmap in HEATMAPS:
+		expected_sample = suppressed_sample(heatmap, 5, min_separation_s)
+		assert sample_heatmap(heatmap, 5, min_separation_s) == expected_sample
+	assert sample_heatmaps(HEATMAPS, 5, min_separation_s) == [
+		suppressed_sample(h, 5, min_separation_s) for h in HEATMAPS
+	]
+
+
+def test_suppression_takes_the_samples_from_different_peaks():
+	intensities = [0.1, 0.8, 1.0, 0.9, 0.2, 0.1, 0.7, 0.75, 0.1, 0.1]
+	heatmap = [
+		HeatmapItem(end_s=(i + 1) * BUCKET_S, intensity=intensity, start_s=i * BUCKET_S)
+		for i, intensity in enumerate(intensities)
+	]
+	assert sample_heatmap(heatmap, 2) == [2 * BUCKET_S, 3 * BUCKET_S]
+	assert sample_heatmap(heatmap, 2, 2 * BUCKET_S) == [2 * BUCKET_S, 7 * BUCKET_S]
+	# Not enough separated buckets
+	assert sample_heatmap(heatmap, 5, 4 * BUCKET_S) == [2 * BUCKET_S, 7 * BUCKET_S]
@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import Counter
+from itertools import groupby, pairwise
+
+import pytest
+
+from project.llm_models.engine import OllamaInferenceEngine
+from project.llm_models.scheduler import OllamaModelScheduler
+from tests.test_engine import FakeOllamaHandler, request, serve
+
+LOAD_S = 0.05
+LATENCY_S = 0.01
+MODELS = ["llama3.2", "llama3.2-vision", "llava"]
+VIDEOS_COUNT = 12
+
+
+class LoadingOllamaHandler(FakeOllamaHandler):
+	"""
+	The fake server with the memory of a single model: a request for another model than the
+	resident one replaces it after LOAD_S. An empty prompt with keep_alive 0 unloads the model.
+	"""
+
+	resident_model: str | None = None
+	loaded_models: list[str] = []
+	memory_lock = threading.Lock()
+
+	def answer(self, request: dict) -> None:
+		with self.memory_lock:
+			if request.get("keep_alive") == 0 and not request.get("prompt"):
+				if LoadingOllamaHandler.resident_model == request["model"]:
+					LoadingOllamaHandler.resident_model = None
+			elif LoadingOllamaHandler.resident_model != request["model"]:
+				time.sleep(LOAD_S)
+				LoadingOllamaHandler.resident_model = request["model"]
+				self.loaded_models.append(request["model"])
+		if request.get("prompt"):
+			time.sleep(LATENCY_S)
+		super().answer(request)
+
+
+@pytest.fixture
+def loading_ollama_host():
+	FakeOllamaHandler.seen_prompts = set()
+	LoadingOllamaHandler.resident_model = None
+	LoadingOllamaHandler.loaded_models = []
+	yield from serve(LoadingOllamaHandler)
+
+
+# Interleaved video by video, as an ExperimentRunner sends them
+REQUESTS = [
+	request(f"video{i}", f"prompt {i}", model_name=model)
+	for i in range(VIDEOS_COUNT)
+	for model in MODELS
+]
+
+
+def check_results(results: list) -> None:
+	assert sorted((r.model_name, r.video_id) for r in results) == sorted(
+		(r.model_name, r.video_id) for r in REQUESTS
+	)
+	assert all(r.response["response"] == r.video_id.replace("video", "PROMPT ") for r in results)
+
+
+def test_scheduler_loads_every_model_once(loading_ollama_host):
+	engine = OllamaInferenceEngine(loading_ollama_host, max_in_flight=4)
+	scheduler = OllamaModelScheduler(engine)
+
+	results = list(scheduler.iter_results(REQUESTS))
+
+	check_results(results)
+	# Model by model, in the order of their first request
+	assert LoadingOllamaHandler.loaded_models == MODELS
+	assert [model for model, _ in groupby(r.model_name for r in results)] == MODELS
+	assert scheduler.resident_model == MODELS[-1]
+	for model in MODELS:
+		assert scheduler.stats[model].loads == 1
+		assert scheduler.stats[model].requests == VIDEOS_COUNT
+		assert scheduler.stats[model].load_s >= LOAD_S
+
+
+def test_engine_alone_swaps_the_models(loading_ollama_host):
+	engine = OllamaInferenceEngine(loading_ollama_host, max_in_flight=4)
+
+	check_results(list(engine.iter_results(REQUESTS)))
+
+	assert len(LoadingOllamaHandler.loaded_models) > len(MODELS)
+
+
+def test_fairness_deadline_switches_before_the_queue_is_drained(loading_ollama_host):
+	engine = OllamaInferenceEngine(loading_ollama_host, max_in_flight=1)
+	scheduler = OllamaModelScheduler(engine, max_residency_s=LATENCY_S)
+
+	results = list(scheduler.iter_results(REQUESTS))
+
+	check_results(results)
+	loaded_models = LoadingOllamaHandler.loaded_models
+	assert len(loaded_models) > len(MODELS)
+	# Round robin: never the same model twice in a row
+	assert all(a != b for a, b in pairwise(loaded_models))
+	assert Counter(loaded_models) == {
+		model: stats.loads for model, stats in scheduler.stats.items()
+	}
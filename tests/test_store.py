@@ -0,0 +1,61 @@
+import os
+
+from project.dataset import store as store_module
+from project.dataset.store import ShardedDatasetStore
+
+
+def video(video_id: str) -> dict:
+	return {"id": video_id, "title": "x" * 100}
+
+
+def test_previous_shard_is_durable_before_the_manifest_commits_it(tmp_path, monkeypatch):
+	events = []
+	fsync = os.fsync
+	write_json_atomically = store_module.write_json_atomically
+
+	def recording_fsync(fd: int) -> None:
+		stat = os.fstat(fd)
+		events.append(("fsync", (stat.st_ino, stat.st_size)))
+		fsync(fd)
+
+	def recording_write_json_atomically(json_data, file_path: str) -> None:
+		if file_path.endswith(store_module.MANIFEST_FILENAME):
+			events.append(("manifest", len(json_data["shards"])))
+		write_json_atomically(json_data, file_path)
+
+	monkeypatch.setattr(store_module.os, "fsync", recording_fsync)
+	monkeypatch.setattr(store_module, "write_json_atomically", recording_write_json_atomically)
+
+	with ShardedDatasetStore(str(tmp_path), max_shard_bytes=150) as store:
+		store.append(video("video0"))
+		store.append(video("video1"))
+		first_shard = store.manifest["shards"][0]
+	# Both files of the first shard were synced with the byte counts the manifest commits
+	first_shard_files = {
+		(os.stat(tmp_path / first_shard[filename_key]).st_ino, first_shard[bytes_key])
+		for filename_key, bytes_key in [("filename", "bytes"), ("ids_filename", "ids_bytes")]
+	}
+
+	assert len(store.manifest["shards"]) == 2
+	manifest_with_two_shards = events.index(("manifest", 2))
+	assert first_shard_files <= {file for _, file in events[:manifest_with_two_shards]}
+	assert os.path.getsize(tmp_path / first_shard["filename"]) == first_shard["bytes"]
+
+
+def test_reopened_store_drops_what_was_not_checkpointed(tmp_path):
+	with ShardedDatasetStore(str(tmp_path), max_shard_bytes=150) as store:
+		store.append(video("video0"))
+		store.append(video("video1"))
+		store.append_failed("video2", "unavailable")
+	store = ShardedDatasetStore(str(tmp_path))
+	store.append(video("video3"))
+	store.append_failed("video4", "unavailable")
+	# A crash: nothing after the last checkpoint is committed
+	store._shard_file.flush()
+	store._failed_file.flush()
+
+	reopened_store = ShardedDatasetStore(str(tmp_path))
+	assert list(reopened_store.video_ids()) == ["video0", "video1"]
+	assert reopened_store.failed() == {"video2": "unavailable"}
+	assert [v["id"] for v in reopened_store.iter_json()] == ["video0", "video1"]
+	reopened_store.close()
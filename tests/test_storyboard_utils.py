@@ -0,0 +1,67 @@
+import json
+import os
+
+from PIL import Image, ImageStat
+
+from project.utils.ffmpeg_utils import frame_filename
+from project.utils.storyboard_utils import (
+	extract_frames_from_storyboard,
+	select_storyboard_format,
+	storyboard_tile_position,
+)
+
+FIXTURES_FOLDER = os.path.join(os.path.dirname(__file__), "fixtures")
+INFO_JSON_PATH = os.path.join(FIXTURES_FOLDER, "yt_dlp", "dQw4w9WgXcQ.info.json")
+# The sprite sheets of the sb0 storyboard of the info JSON, tile i is filled with tile_color(i)
+SPRITE_SHEETS_FOLDER = os.path.join(FIXTURES_FOLDER, "storyboards")
+
+
+def tile_color(tile_index: int) -> tuple[int, int, int]:
+	return (
+		(tile_index * 40) % 256,
+		(255 - tile_index * 40) % 256,
+		(tile_index * 100) % 256,
+	)
+
+
+def storyboard_format() -> dict:
+	with open(INFO_JSON_PATH, "r") as info_file:
+		return select_storyboard_format(json.load(info_file)["formats"])
+
+
+def test_select_storyboard_format_picks_the_largest_tiles():
+	assert storyboard_format()["format_id"] == "sb0"
+
+
+def test_storyboard_tile_position():
+	# 320x180 tiles, 3x3 tiles per sheet, one tile every 10s of the 212s video
+	assert storyboard_tile_position(storyboard_format(), 0.0) == (0, 0, 0)
+	assert storyboard_tile_position(storyboard_format(), 44.9) == (0, 1, 1)
+	assert storyboard_tile_position(storyboard_format(), 96.0) == (1, 0, 1)
+	# Past the last tile
+	assert storyboard_tile_position(storyboard_format(), 211.9) == (2, 0, 2)
+
+
+def test_extract_frames_from_storyboard(tmp_path):
+	fetched_urls = []
+
+	def fetch_fixture(url: str) -> bytes:
+		fetched_urls.append(url)
+		sheet_filename = url.split("?")[0].rsplit("/", 1)[-1]
+		with open(os.path.join(SPRITE_SHEETS_FOLDER, sheet_filename), "rb") as sheet_file:
+			return sheet_file.read()
+
+	timestamps_by_frame_prefix = {"vid_rand": [0.0, 14.0, 96.0], "vid_fi": [211.9, 44.9]}
+	expected_tiles = {"vid_rand": [0, 1, 10], "vid_fi": [20, 4]}
+	extract_frames_from_storyboard(
+		storyboard_format(), timestamps_by_frame_prefix, str(tmp_path), fetch=fetch_fixture
+	)
+
+	# Every sprite sheet is fetched once
+	assert len(fetched_urls) == len(set(fetched_urls)) == 3
+	for frame_prefix, timestamps in timestamps_by_frame_prefix.items():
+		for i, (timestamp, tile_index) in enumerate(zip(timestamps, expected_tiles[frame_prefix])):
+			with Image.open(tmp_path / frame_filename(frame_prefix, i, timestamp)) as frame:
+				assert frame.size == (320, 180)
+				mean_color = ImageStat.Stat(frame).mean
+			assert all(abs(m - c) < 8 for m, c in zip(mean_color, tile_color(tile_index)))
@@ -0,0 +1,119 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from project.dataset.rendered_prompts import RenderedPromptStore
+from project.utils.subtitles_utils import (
+	TRANSCRIPT_CACHE_FILENAME,
+	TranscriptCache,
+	cached_text_from_subtitles,
+	convert_subtitles_file_to_srt,
+	use_transcript_cache,
+)
+
+REPOSITORY_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_FOLDER = os.path.join(os.path.dirname(__file__), "fixtures", "subtitles")
+SUBTITLES_FIXTURES = [
+	"manual_subtitles.en.vtt",
+	"youtube_auto_captions.en.vtt",
+	"youtube_auto_captions.en.json3",
+	"youtube_auto_captions.en.srv3",
+]
+
+
+@pytest.mark.parametrize("subtitles_filename", SUBTITLES_FIXTURES)
+def test_convert_subtitles_file_to_srt_matches_golden_file(subtitles_filename, tmp_path):
+	srt_path = tmp_path / "converted.srt"
+	convert_subtitles_file_to_srt(os.path.join(FIXTURES_FOLDER, subtitles_filename), str(srt_path))
+
+	expected_path = os.path.join(FIXTURES_FOLDER, f"{subtitles_filename}.expected.srt")
+	with open(expected_path, "rb") as expected_file:
+		assert srt_path.read_bytes() == expected_file.read()
+
+
+def test_convert_subtitles_file_to_srt_rejects_unsupported_format(tmp_path):
+	with pytest.raises(ValueError):
+		convert_subtitles_file_to_srt(
+			os.path.join(FIXTURES_FOLDER, "manual_subtitles.en.vtt"),
+			str(tmp_path / "converted.srt"),
+			subtitles_format="ass",
+		)
+
+
+def srt_subtitles(text: str) -> str:
+	return f"1\n00:00:00,000 --> 00:00:01,000\n{text}\n\n"
+
+
+def test_transcript_cache_keeps_at_most_max_cached_texts_in_memory():
+	cache = TranscriptCache(max_cached_texts=2)
+	for text in ["first", "second", "third"]:
+		assert cache.text_from_subtitles(srt_subtitles(text)) == text
+	assert len(cache) == 2
+	assert list(cache._cached_texts.values()) == ["second", "third"]
+
+
+def test_persisted_transcript_cache_reads_dropped_texts_back(tmp_path):
+	file_path = str(tmp_path / "transcripts.jsonl")
+	with open(file_path, "w") as cache_file:
+		# Interrupted run
+		cache_file.write('{"sha1": "trunc')
+	cache = TranscriptCache(file_path, max_cached_texts=1)
+	for text in ["first", "second", "àéî"]:
+		cache.text_from_subtitles(srt_subtitles(text))
+	cache.close()
+
+	cache = TranscriptCache(file_path, max_cached_texts=1)
+	assert len(cache) == 3
+	for text in ["first", "second", "àéî", "first"]:
+		assert cache.text_from_subtitles(srt_subtitles(text)) == text
+	assert len(cache._cached_texts) == 1
+	cache.close()
+	with open(file_path, "r") as cache_file:
+		assert len(cache_file.read().splitlines()) == 4
+
+
+@pytest.fixture
+def in_memory_transcript_cache():
+	yield
+	use_transcript_cache(None)
+
+
+def test_transcript_cache_is_shared_with_a_new_process(tmp_path, in_memory_transcript_cache):
+	file_path = str(tmp_path / TRANSCRIPT_CACHE_FILENAME)
+	use_transcript_cache(file_path)
+	assert cached_text_from_subtitles(srt_subtitles("first")) == "first"
+	use_transcript_cache(None)
+
+	# The new process fails if it parses the subtitles instead of reading the cached text
+	script = f"""
+import project.utils.subtitles_utils as subtitles_utils
+
+def parse(raw_subtitles):
+	raise AssertionError("parsed again")
+
+subtitles_utils.use_transcript_cache({file_path!r})
+subtitles_utils.text_from_subtitles = parse
+print(subtitles_utils.cached_text_from_subtitles({srt_subtitles("first")!r}))
+"""
+	process = subprocess.run(
+		[sys.executable, "-c", script],
+		cwd=REPOSITORY_FOLDER,
+		capture_output=True,
+		text=True,
+		check=True,
+	)
+	assert process.stdout == "first\n"
+
+
+def test_prompt_store_persists_the_transcripts_in_its_folder(tmp_path, in_memory_transcript_cache):
+	file_path = str(tmp_path / TRANSCRIPT_CACHE_FILENAME)
+	with RenderedPromptStore(str(tmp_path), ["title"], {}):
+		assert cached_text_from_subtitles(srt_subtitles("first")) == "first"
+	use_transcript_cache(None)
+
+	with RenderedPromptStore(str(tmp_path), ["description"], {}):
+		cache = use_transcript_cache(file_path)
+		assert len(cache) == 1
+		assert cache._get(next(iter(cache._offsets_by_hash))) == "first"
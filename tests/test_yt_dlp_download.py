@@ -0,0 +1,144 @@
+import os
+import shutil
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import ffmpeg
+import pytest
+from PIL import Image, ImageChops, ImageStat
+
+from project.dataset_generation.yt_dlp_download import (
+	SECTION_FILENAME_FORMAT,
+	download_video_and_metadata,
+)
+from project.utils.ffmpeg_utils import (
+	extract_frames_at_times,
+	extract_section_frames,
+	frame_filename,
+)
+
+VIDEO_DURATION_S = 30
+# One keyframe every 10s, a stream copied section would start up to 10s before its timestamp
+KEYFRAME_INTERVAL_S = 10
+FRAME_RATE = 25
+SECTIONS_TIMESTAMPS = [7.0, 23.0]
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+	"""Serves the files of the directory, with the byte ranges requested by ffmpeg."""
+
+	def send_head(self):
+		path = self.translate_path(self.path)
+		if not os.path.isfile(path):
+			self.send_error(404)
+			return None
+		size = os.path.getsize(path)
+		start, end = 0, size - 1
+		byte_range = self.headers.get("Range")
+		if byte_range is None:
+			self.send_response(200)
+		else:
+			first, last = byte_range.removeprefix("bytes=").split("-")
+			start, end = int(first), int(last) if last else size - 1
+			self.send_response(206)
+			self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+		self.send_header("Content-Type", "video/mp4")
+		self.send_header("Accept-Ranges", "bytes")
+		self.send_header("Content-Length", str(end - start + 1))
+		self.end_headers()
+		file = open(path, "rb")
+		file.seek(start)
+		self.bytes_left = end - start + 1
+		return file
+
+	def copyfile(self, source, output) -> None:
+		while self.bytes_left > 0:
+			chunk = source.read(min(64 * 1024, self.bytes_left))
+			try:
+				output.write(chunk)
+			except (BrokenPipeError, ConnectionResetError):
+				return  # The client has read what it needed
+			self.bytes_left -= len(chunk)
+
+	def log_message(self, *args) -> None:
+		pass
+
+
+@pytest.fixture(scope="module")
+def served_video(tmp_path_factory):
+	"""The local path and the url of a generated mp4 served over HTTP."""
+	folder = tmp_path_factory.mktemp("server")
+	video_path = str(folder / "video.mp4")
+	(
+		ffmpeg.input(
+			f"testsrc=duration={VIDEO_DURATION_S}:size=320x240:rate={FRAME_RATE}", f="lavfi"
+		)
+		.output(
+			video_path,
+			pix_fmt="yuv420p",
+			g=KEYFRAME_INTERVAL_S * FRAME_RATE,
+			keyint_min=KEYFRAME_INTERVAL_S * FRAME_RATE,
+			sc_threshold=0,
+			movflags="+faststart",
+		)
+		.run(capture_stdout=True, capture_stderr=True)
+	)
+	server = ThreadingHTTPServer(
+		("127.0.0.1", 0), partial(RangeRequestHandler, directory=str(folder))
+	)
+	server.daemon_threads = True
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	yield video_path, f"http://127.0.0.1:{server.server_address[1]}/video.mp4"
+	server.shutdown()
+	server.server_close()
+
+
+def mean_difference(image_path: str, other_image_path: str) -> float:
+	with Image.open(image_path) as image, Image.open(other_image_path) as other_image:
+		difference = ImageChops.difference(image.convert("RGB"), other_image.convert("RGB"))
+	return sum(ImageStat.Stat(difference).mean) / 3
+
+
+def test_partial_download_sections_start_at_their_timestamp(served_video, tmp_path):
+	video_path, video_url = served_video
+	download_folder = str(tmp_path / "download")
+	download_video_and_metadata(
+		"video",
+		download_folder,
+		sections_timestamps=lambda info: SECTIONS_TIMESTAMPS,
+		video_url=video_url,
+	)
+
+	sections_paths = {
+		t: os.path.join(download_folder, SECTION_FILENAME_FORMAT.format("video", t))
+		for t in SECTIONS_TIMESTAMPS
+	}
+	assert not os.path.exists(os.path.join(download_folder, "video.mp4"))
+	assert sum(os.path.getsize(path) for path in sections_paths.values()) < os.path.getsize(
+		video_path
+	) / len(SECTIONS_TIMESTAMPS)
+
+	sections_frames_folder = str(tmp_path / "sections-frames")
+	extract_section_frames(sections_paths, SECTIONS_TIMESTAMPS, sections_frames_folder, "section")
+	keyframes_timestamps = [
+		t // KEYFRAME_INTERVAL_S * KEYFRAME_INTERVAL_S for t in SECTIONS_TIMESTAMPS
+	]
+	video_frames_folder = str(tmp_path / "video-frames")
+	extract_frames_at_times(video_path, SECTIONS_TIMESTAMPS, video_frames_folder, "video")
+	extract_frames_at_times(video_path, keyframes_timestamps, video_frames_folder, "keyframe")
+	for i, (timestamp, keyframe_timestamp) in enumerate(
+		zip(SECTIONS_TIMESTAMPS, keyframes_timestamps)
+	):
+		section_frame_path = os.path.join(
+			sections_frames_folder, frame_filename("section", i, timestamp)
+		)
+		video_frame_path = os.path.join(video_frames_folder, frame_filename("video", i, timestamp))
+		keyframe_path = os.path.join(
+			video_frames_folder, frame_filename("keyframe", i, keyframe_timestamp)
+		)
+		# The sections are re-encoded, their frames are not exactly the ones of the video
+		assert mean_difference(section_frame_path, video_frame_path) < 2
+		assert mean_difference(section_frame_path, keyframe_path) > 5
@@ -0,0 +1,66 @@
+import json
+import os
+
+import pytest
+
+from project.utils.yt_dlp_utils import (
+	best_muxed_format,
+	format_size,
+	frames_format_selector,
+	select_frames_format,
+)
+
+INFO_JSON_PATH = os.path.join(
+	os.path.dirname(__file__), "fixtures", "yt_dlp", "dQw4w9WgXcQ.info.json"
+)
+
+
+@pytest.fixture
+def info():
+	with open(INFO_JSON_PATH, "r") as info_file:
+		return json.load(info_file)
+
+
+@pytest.mark.parametrize(
+	"min_height,expected_format_id",
+	[
+		(144, "160"),
+		# The size of the formats without one is estimated from their bitrate
+		(240, "395"),
+		(360, "396"),
+		(480, "397"),
+		(720, "398"),
+		# No format is high enough, the highest is used
+		(2160, "137"),
+	],
+)
+def test_select_frames_format(info, min_height, expected_format_id):
+	selected_format = select_frames_format(info["formats"], min_height, duration_s=info["duration"])
+	assert selected_format["format_id"] == expected_format_id
+	assert selected_format["acodec"] == "none"
+	assert selected_format["ext"] == "mp4"
+
+
+def test_select_frames_format_is_smaller_than_the_best_muxed_format(info):
+	selected_format = select_frames_format(info["formats"], 360, duration_s=info["duration"])
+	best_format = best_muxed_format(info["formats"])
+	assert best_format["format_id"] == "18"
+	assert format_size(selected_format, info["duration"]) < format_size(
+		best_format, info["duration"]
+	)
+
+
+def test_select_frames_format_without_video_only_formats(info):
+	muxed_formats = [f for f in info["formats"] if f["acodec"] != "none"]
+	assert select_frames_format(muxed_formats, 360) is None
+
+
+def test_frames_format_selector(info):
+	selector = frames_format_selector(360)
+	assert [f["format_id"] for f in selector({"formats": info["formats"]})] == ["396"]
+
+
+def test_frames_format_selector_falls_back_to_the_best_muxed_format(info):
+	muxed_formats = [f for f in info["formats"] if f["acodec"] != "none"]
+	selector = frames_format_selector(360)
+	assert [f["format_id"] for f in selector({"formats": muxed_formats})] == ["18"]